@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+# This script measures how the cost of Component.GetLibs() grows with the
+# size of the dependency graph. It builds synthetic graphs of linkable
+# components with three shapes:
+#
+#   deep     c0 -> c1 -> ... -> cN
+#   wide     c0 -> {c1, ..., cN}
+#   lattice  layers of 4 components, each one depending on all the
+#            components of the next layer (many paths to the same library)
+#
+# SCons must be importable, if it is not installed in the python path set
+# SCONS_LIB_DIR to the directory that contains the SCons package.
+#
+# Usage: bin/getlibs-benchmark.py [--sizes=10,100,1000] [--repeat=3]
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+FBUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(FBUILD_DIR, 'site_scons'))
+if 'SCONS_LIB_DIR' in os.environ:
+    sys.path.insert(0, os.environ['SCONS_LIB_DIR'])
+
+from SCons.Environment import Environment
+
+from core_components import ExternalComponent
+from dependencygraph import ComponentDictionary
+from termcolor import Cprint
+
+LATTICE_WIDTH = 4
+
+
+def deep_edges(size):
+    return [(i, [i + 1] if i + 1 < size else []) for i in range(size)]
+
+
+def wide_edges(size):
+    return [(0, range(1, size))] + [(i, []) for i in range(1, size)]
+
+
+def lattice_edges(size):
+    edges = []
+    for i in range(size):
+        layer = i // LATTICE_WIDTH + 1
+        first = layer * LATTICE_WIDTH
+        edges.append((i, [j for j in range(first, first + LATTICE_WIDTH) if j < size]))
+    return edges
+
+SHAPES = [('deep', deep_edges), ('wide', wide_edges), ('lattice', lattice_edges)]
+
+
+def create_environment():
+    env = Environment(tools=[])
+    env['INSTALL_LIB_DIR'] = os.path.join(FBUILD_DIR, 'install', 'libs')
+    env['INSTALL_HEADERS_DIR'] = os.path.join(FBUILD_DIR, 'install', 'includes')
+    env.cerror = lambda m: Cprint(m, 'red')
+    return env
+
+
+def create_graph(env, edges):
+    graph = ComponentDictionary()
+    for (i, deps) in edges:
+        name = 'c%d' % i
+        deps = ['c%d' % j for j in deps]
+        graph.Add(ExternalComponent(graph, env, name, env.Dir('#'), deps, [], True), False)
+    return graph
+
+
+def measure(env, edges, repeat):
+    """Returns the best times to get the libs of the root and of all the components."""
+    root_times = []
+    all_times = []
+    for _ in range(repeat):
+        graph = create_graph(env, edges)
+        start = time.time()
+        graph['c0'].GetLibs()
+        root_times.append(time.time() - start)
+        graph = create_graph(env, edges)
+        start = time.time()
+        for component in graph.values():
+            component.GetLibs()
+        all_times.append(time.time() - start)
+    return min(root_times), min(all_times)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', dest='sizes', default='10,100,1000',
+                      help='comma separated list of graph sizes')
+    parser.add_option('--repeat', dest='repeat', type='int', default=3,
+                      help='times each measure is repeated, the best is kept')
+    (options, args) = parser.parse_args()
+    sizes = [int(x) for x in options.sizes.split(',')]
+    env = create_environment()
+    print '%-8s %8s %12s %12s %14s' % ('shape', 'size', 'root (s)', 'all (s)', 'per comp (us)')
+    for (shape, edges_function) in SHAPES:
+        for size in sizes:
+            (root_time, all_time) = measure(env, edges_function(size), options.repeat)
+            print '%-8s %8d %12.6f %12.6f %14.2f' % (shape, size, root_time, all_time,
+                                                     all_time / size * 1e6)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+# This script measures the phases of fbuild itself on synthetic workspaces
+# of several sizes, to see how a change of fbuild affects them. For each
+# size it generates a workspace with bin/workspace-generator.py, builds it
+# once and then times no-op rebuilds of all:build with --phase-times:
+#
+#   setup     the SConstruct before reading the SConscripts
+#   read      WalkDirsForSconscripts() loading the component graph
+#   process   the Process() of the components
+#   closures  the GetIncludePaths() and GetLibs() calls (part of process)
+#   build     the up-to-date check of SCons
+#   wall      the whole scons run
+#
+# With --dry-run the workspaces are not built and the runs are dry runs
+# (scons -n), which is faster for the big sizes. The graph cache is off by
+# default, so every run reads the SConscripts (see bin/startup-benchmark.py
+# for the graph cache). The results of every run are written in JSON.
+#
+# Usage: bin/phase-benchmark.py [--sizes=10,100,1000] [--repeat=3] [--depth=5]
+#            [--fan-out=3] [--mix=...] [--dry-run] [--output=phase-benchmark.json]
+#            [--scons=scons]
+
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+FBUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR = os.path.join(FBUILD_DIR, 'bin', 'workspace-generator.py')
+# The phases reported, those of --phase-times and the wall time.
+PHASES = ['setup', 'read', 'process', 'closures', 'build', 'wall']
+# The variant of the runs, so the signatures of the normal build are kept
+# apart (see site_scons/variants.py).
+VARIANT = 'phase-benchmark'
+TARGET = 'all:build'
+
+
+def run_scons(options, tmp, extra):
+    times_file = os.path.join(tmp, 'phase-times.json')
+    install_dir = os.path.join(tmp, 'install')
+    command = shlex.split(options.scons) + [
+        '-Q', '--nostdin', '-j%d' % options.jobs, '--graph-cache=%s' % options.graph_cache,
+        '--phase-times=%s' % times_file,
+        'WS_DIR=%s' % os.path.join(tmp, 'projects'),
+        'BUILD_DIR=%s' % os.path.join(tmp, 'build'),
+        'INSTALL_BIN_DIR=%s' % os.path.join(install_dir, 'bin'),
+        'INSTALL_HEADERS_DIR=%s' % os.path.join(install_dir, 'includes'),
+        'INSTALL_LIB_DIR=%s' % os.path.join(install_dir, 'libs'),
+        'INSTALL_REPORTS_DIR=%s' % os.path.join(install_dir, 'reports'),
+        'VARIANT=%s' % VARIANT] + extra + [TARGET]
+    start = time.time()
+    process = subprocess.Popen(command, cwd=FBUILD_DIR, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    elapsed = time.time() - start
+    if process.returncode != 0:
+        sys.stderr.write(output)
+        sys.exit('scons failed')
+    with open(times_file) as f:
+        result = json.load(f)
+    result['phases']['wall'] = elapsed
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def measure(options, size):
+    tmp = tempfile.mkdtemp(prefix='fbuild-phases-')
+    try:
+        subprocess.check_call([sys.executable, GENERATOR, '--components=%d' % size,
+                               '--depth=%d' % options.depth, '--fan-out=%d' % options.fan_out,
+                               '--mix=%s' % options.mix, '--seed=%d' % options.seed,
+                               os.path.join(tmp, 'projects')], stdout=open(os.devnull, 'w'))
+        extra = ['-n'] if options.dry_run else []
+        # Build the workspace (and create the build dir) before measuring.
+        first = run_scons(options, tmp, extra)
+        runs = [run_scons(options, tmp, extra) for _ in range(options.repeat)]
+    finally:
+        shutil.rmtree(tmp)
+        sconsign = os.path.join(FBUILD_DIR, '.sconsign-%s.dblite' % VARIANT)
+        if os.path.exists(sconsign):
+            os.remove(sconsign)
+    return {
+        'size': size,
+        'components': runs[0].get('components'),
+        'first': first,
+        'runs': runs,
+        'median': dict((phase, median([run['phases'][phase] for run in runs]))
+                       for phase in PHASES),
+    }
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', dest='sizes', default='10,100,1000',
+                      help='numbers of components of the workspaces')
+    parser.add_option('--repeat', dest='repeat', type='int', default=3,
+                      help='times each workspace is measured')
+    parser.add_option('--depth', dest='depth', type='int', default=5,
+                      help='layers of libraries of the workspaces')
+    parser.add_option('--fan-out', dest='fan_out', type='int', default=3,
+                      help='dependencies of each library of the workspaces')
+    parser.add_option('--mix', dest='mix', default='static:4,shared:2,headers:2,test:2',
+                      help='weights of the kinds of components of the workspaces')
+    parser.add_option('--seed', dest='seed', type='int', default=0,
+                      help='seed of the workspaces')
+    parser.add_option('--dry-run', dest='dry_run', action='store_true', default=False,
+                      help='do not build the workspaces, measure dry runs')
+    parser.add_option('--graph-cache', dest='graph_cache', default='off',
+                      help='value of the --graph-cache option of the runs')
+    parser.add_option('--jobs', dest='jobs', type='int', default=1,
+                      help='parallel jobs of the builds')
+    parser.add_option('--output', dest='output', default='phase-benchmark.json',
+                      help='file where the results are written')
+    parser.add_option('--scons', dest='scons', default='scons',
+                      help='command used to run scons')
+    (options, args) = parser.parse_args()
+    options.repeat = max(options.repeat, 1)
+    sizes = [int(size) for size in options.sizes.split(',')]
+    results = []
+    print '%-6s %-10s' % ('size', 'components') + ''.join('%11s' % p for p in PHASES)
+    for size in sizes:
+        result = measure(options, size)
+        results.append(result)
+        print '%-6d %-10s' % (size, result['components']) + ''.join(
+            '%11.3f' % result['median'][phase] for phase in PHASES)
+    with open(options.output, 'w') as f:
+        json.dump({'options': vars(options), 'results': results}, f, indent=2, sort_keys=True)
+    print 'Results written to %s' % options.output
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+# This script compares the startup time of scons with and without the
+# component graph cache. It generates a workspace with
+# bin/workspace-generator.py and times a dry run of one target:
+#
+#   off   the cache is not used (every SConscript is executed)
+#   cold  the cache is rebuilt (every SConscript is executed and recorded)
+#   warm  the cache is read (the SConscripts are replayed)
+#
+# Usage: bin/startup-benchmark.py [--copies=50] [--repeat=3] [--scons=scons]
+
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+FBUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENERATOR = os.path.join(FBUILD_DIR, 'bin', 'workspace-generator.py')
+# The modes measured, with the value of --graph-cache for each one.
+MODES = [('off', 'off'), ('cold', 'rebuild'), ('warm', 'read')]
+
+
+def run_scons(scons, ws_dir, build_dir, mode, target):
+    command = shlex.split(scons) + ['-n', '-Q', '--nostdin', '--graph-cache=%s' % mode,
+                                    'WS_DIR=%s' % ws_dir, 'BUILD_DIR=%s' % build_dir, target]
+    start = time.time()
+    process = subprocess.Popen(command, cwd=FBUILD_DIR, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    elapsed = time.time() - start
+    if process.returncode != 0:
+        sys.stderr.write(output)
+        sys.exit('scons failed in %s mode' % mode)
+    return elapsed
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--copies', dest='copies', type='int', default=50,
+                      help='number of copies of the buildtests tree')
+    parser.add_option('--repeat', dest='repeat', type='int', default=3,
+                      help='times each mode is measured')
+    parser.add_option('--scons', dest='scons', default='scons',
+                      help='command used to run scons')
+    parser.add_option('--target', dest='target', default='teststatic_0',
+                      help='target of the dry run')
+    (options, args) = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix='fbuild-startup-')
+    try:
+        ws_dir = os.path.join(tmp, 'projects')
+        build_dir = os.path.join(tmp, 'build')
+        subprocess.check_call([sys.executable, GENERATOR, '--copies=%d' % options.copies, ws_dir])
+        # Create the build dir and the external dependencies before measuring.
+        run_scons(options.scons, ws_dir, build_dir, 'off', options.target)
+        times = dict((name, []) for (name, mode) in MODES)
+        for _ in range(options.repeat):
+            for (name, mode) in MODES:
+                times[name].append(run_scons(options.scons, ws_dir, build_dir, mode,
+                                             options.target))
+        print '%-6s %10s %10s' % ('mode', 'min (s)', 'median (s)')
+        for (name, mode) in MODES:
+            values = sorted(times[name])
+            print '%-6s %10.3f %10.3f' % (name, values[0], values[len(values) // 2])
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
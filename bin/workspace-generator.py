@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+# This script generates a big workspace by copying the buildtests tree
+# several times. The components of each copy get a numeric suffix, and the
+# static library of each copy depends on the header only library of the
+# previous one, so the copies make a chain.
+#
+# The dependencies that must be downloaded (mili) are removed, so the
+# workspace can be parsed offline.
+#
+# With --components it generates a synthetic workspace instead, with that
+# number of components: static, shared and header only libraries and tests,
+# mixed in the proportions given by --mix. The libraries are arranged in
+# --depth layers, each one depends on up to --fan-out libraries of the next
+# layer (the header only libraries only on header only libraries), and each
+# test tests a library. Every library has a source that calls the functions
+# of its dependencies, so the workspace builds.
+#
+# Usage: bin/workspace-generator.py [--copies=50] <output dir>
+#        bin/workspace-generator.py --components=100 [--depth=5] [--fan-out=3]
+#            [--mix=static:4,shared:2,headers:2,test:2] [--seed=0] <output dir>
+#
+# The generated workspace is used with:
+#     scons WS_DIR=<output dir> ...
+
+import os
+import random
+import re
+import shutil
+from optparse import OptionParser
+
+FBUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILDTESTS_DIR = os.path.join(FBUILD_DIR, 'buildtests')
+# The projects of the buildtests tree that are copied.
+PROJECTS = ['test_headers', 'test_static', 'test_shared', 'test_ut', 'test_program']
+# The components defined by those projects.
+COMPONENTS = ['testheaders', 'teststatic', 'testshared', 'testprogram']
+# The dependencies that are removed.
+DOWNLOADED = ['mili']
+# The kinds of the synthetic components, and the default mix.
+KINDS = ['static', 'shared', 'headers', 'test']
+DEFAULT_MIX = 'static:4,shared:2,headers:2,test:2'
+
+LIBRARY_SCONSCRIPT = """Import ('env')
+
+name = '%(name)s'
+inc = env.Dir('.')
+ext_inc = env.Dir('.')
+src = env.Glob('*.cpp')
+deps = %(deps)r
+
+env.%(command)s(name, inc, ext_inc, src, deps)
+"""
+
+HEADERS_SCONSCRIPT = """Import ('env')
+
+name = '%(name)s'
+ext_inc = env.Dir('.')
+deps = %(deps)r
+
+env.CreateHeaderOnlyLibrary(name, ext_inc, deps)
+"""
+
+TEST_SCONSCRIPT = """Import ('env')
+
+name = '%(name)s'
+inc = env.Dir('.')
+src = env.Glob('*.cpp')
+deps = []
+
+env.CreateTest(name, inc, src, deps)
+"""
+
+
+def rename(text, copy):
+    for name in COMPONENTS:
+        text = re.sub(r"'%s'" % name, "'%s_%d'" % (name, copy), text)
+    for name in DOWNLOADED:
+        text = re.sub(r",\s*'%s'" % name, '', text)
+        text = re.sub(r'#include <%s/.*>\n' % name, '', text)
+    return text
+
+
+def copy_project(project, copy, output):
+    source = os.path.join(BUILDTESTS_DIR, project)
+    target = os.path.join(output, 'copy%03d' % copy, project)
+    # The symlinks of the buildtests tree are broken, they are skipped.
+    shutil.copytree(source, target, ignore=lambda d, names: [n for n in names
+                    if os.path.islink(os.path.join(d, n))])
+    for root, dirnames, filenames in os.walk(target):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path) as f:
+                text = f.read()
+            text = rename(text, copy)
+            if copy > 0 and filename == 'SConscript' and project == 'test_static':
+                text = text.replace('deps = []', "deps = ['testheaders_%d']" % (copy - 1))
+            with open(path, 'w') as f:
+                f.write(text)
+
+
+def generate(output, copies):
+    for copy in range(copies):
+        for project in PROJECTS:
+            copy_project(project, copy, output)
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        (kind, weight) = item.split(':')
+        if kind not in KINDS:
+            raise ValueError('unknown kind of component: %s' % kind)
+        mix.append((kind, float(weight)))
+    return mix
+
+
+def plan_components(count, depth, fan_out, mix, rng):
+    """
+    Returns a list of (name, kind, deps, tested) tuples, tested is the name
+    of the library of a test.
+    """
+    total = sum(weight for (kind, weight) in mix)
+    tests = int(round(count * sum(w for (k, w) in mix if k == 'test') / total))
+    libraries = [(k, w) for (k, w) in mix if k != 'test'] or [('static', 1.0)]
+    # Each test needs its own library.
+    tests = min(tests, count // 2)
+    kinds = []
+    for i in range(count - tests):
+        point = rng.uniform(0, sum(w for (k, w) in libraries))
+        for (kind, weight) in libraries:
+            point -= weight
+            if point <= 0:
+                break
+        kinds.append(kind)
+    names = ['%s%04d' % (kind, i) for (i, kind) in enumerate(kinds)]
+    layers = [i * max(depth, 1) // len(names) for i in range(len(names))]
+    components = []
+    for (i, name) in enumerate(names):
+        # The candidates are in the next layer.
+        candidates = [j for j in range(len(names)) if layers[j] == layers[i] + 1]
+        if kinds[i] == 'headers':
+            candidates = [j for j in candidates if kinds[j] == 'headers']
+        deps = sorted(rng.sample(candidates, min(fan_out, len(candidates))))
+        components.append((name, kinds[i], [names[j] for j in deps], None))
+    tested = [name for (name, kind, deps, _) in components if kind != 'headers'][:tests]
+    for name in tested:
+        components.append(('%s@test' % name, 'test', [], name))
+    return components
+
+
+def write_file(path, text):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def write_header(path, name, text):
+    guard = '%s_H' % name.upper()
+    write_file(path, '#ifndef %s\n#define %s\n\n%s\n#endif\n' % (guard, guard, text))
+
+
+def write_component(output, name, kind, deps, tested):
+    includes = ''.join('#include "%s.h"\n' % dep for dep in deps)
+    calls = ' + '.join(['%s()' % dep for dep in deps] or ['0'])
+    if kind == 'test':
+        directory = os.path.join(output, tested, 'ut')
+        write_file(os.path.join(directory, 'SConscript'), TEST_SCONSCRIPT % {'name': tested})
+        write_file(os.path.join(directory, 'main.cpp'),
+                   '#include "%s.h"\n\nint main() {\n    return %s();\n}\n' % (tested, tested))
+        return
+    directory = os.path.join(output, name)
+    if kind == 'headers':
+        write_file(os.path.join(directory, 'SConscript'),
+                   HEADERS_SCONSCRIPT % {'name': name, 'deps': deps})
+        write_header(os.path.join(directory, '%s.h' % name), name,
+                     '%s\ninline int %s() {\n    return %s;\n}\n' % (includes, name, calls))
+        return
+    command = 'CreateStaticLibrary' if kind == 'static' else 'CreateSharedLibrary'
+    write_file(os.path.join(directory, 'SConscript'),
+               LIBRARY_SCONSCRIPT % {'name': name, 'deps': deps, 'command': command})
+    write_header(os.path.join(directory, '%s.h' % name), name, 'int %s();\n' % name)
+    write_file(os.path.join(directory, '%s.cpp' % name),
+               '#include "%s.h"\n%s\nint %s() {\n    return %s;\n}\n' %
+               (name, includes, name, calls))
+
+
+def generate_synthetic(output, count, depth, fan_out, mix, seed):
+    components = plan_components(count, depth, fan_out, mix, random.Random(seed))
+    for (name, kind, deps, tested) in components:
+        write_component(output, name, kind, deps, tested)
+    return components
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] <output dir>')
+    parser.add_option('--copies', dest='copies', type='int', default=50,
+                      help='number of copies of the buildtests tree')
+    parser.add_option('--components', dest='components', type='int', default=None,
+                      help='generate a synthetic workspace with this number of components')
+    parser.add_option('--depth', dest='depth', type='int', default=5,
+                      help='layers of libraries of the synthetic workspace')
+    parser.add_option('--fan-out', dest='fan_out', type='int', default=3,
+                      help='dependencies of each library of the synthetic workspace')
+    parser.add_option('--mix', dest='mix', default=DEFAULT_MIX,
+                      help='weights of the kinds of components of the synthetic workspace '
+                           '(default %s)' % DEFAULT_MIX)
+    parser.add_option('--seed', dest='seed', type='int', default=0,
+                      help='seed of the synthetic workspace')
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error('the output dir is missing')
+    output = os.path.abspath(args[0])
+    if os.path.exists(output):
+        parser.error('%s already exists' % output)
+    if options.components is None:
+        generate(output, options.copies)
+        print 'Generated %d components in %s' % (options.copies * (len(COMPONENTS) + 2), output)
+        return
+    try:
+        mix = parse_mix(options.mix)
+    except ValueError, error:
+        parser.error('invalid --mix: %s' % error)
+    components = generate_synthetic(output, options.components, options.depth,
+                                    options.fan_out, mix, options.seed)
+    print 'Generated %d components in %s' % (len(components), output)
+
+if __name__ == '__main__':
+    main()
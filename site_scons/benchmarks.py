@@ -0,0 +1,392 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module runs the benchmarks of a project (<project>:bench).
+
+    The benchmarks (env.CreateBenchmark) are Google Benchmark programs. They
+    are always measured optimized: the benchmark program is built in the
+    'bench' variant (see variants.py) with --type=opt, whatever the type of
+    the build, and then it runs here. Its results are written in JSON, in
+    INSTALL_REPORTS_DIR/bench/<project>/results.json. The results of the runs
+    made with the project at a clean git commit are kept too, in
+    history/<commit>.json.
+
+    <project>:bench-compare runs the benchmarks and compares their results
+    with a baseline: the results in baseline.json (saved by the first
+    comparison), in a given file or those kept for a git ref. Each benchmark
+    is repeated (--bench-repetitions), its time is the median of the
+    repetitions and its noise the median absolute deviation (MAD). A
+    benchmark regresses when its median grows more than the threshold
+    (--bench-threshold) and more than the noise of both runs.
+"""
+
+
+import json
+import os
+import shutil
+import subprocess
+from xml.dom import minidom
+
+import variants
+import utils
+
+
+# The variant where the benchmarks are built.
+VARIANT = 'bench'
+# The build type of the benchmarks.
+BUILD_TYPE = 'opt'
+# The file with the results of the last run, in the directory of the reports
+# of the project.
+RESULTS_FILE = 'results.json'
+# The results compared by default, in the directory of the reports.
+BASELINE_FILE = 'baseline.json'
+# The directory with the results of each commit, in the directory of the
+# reports.
+HISTORY_DIR = 'history'
+# The report of the comparison, in the directory of the reports.
+COMPARE_FILE = 'compare.txt'
+# The report of the comparison for Jenkins (JUnit), in
+# INSTALL_METRICS_DIR/bench/<project>.
+COMPARE_XML_FILE = 'bench-compare.xml'
+# The number of MADs of a difference that is not noise. A MAD times 1.4826
+# estimates the standard deviation of normally distributed times.
+NOISE_MADS = 3 * 1.4826
+# The statuses of a compared benchmark.
+REGRESSION = 'regression'
+IMPROVEMENT = 'improvement'
+UNCHANGED = 'unchanged'
+NEW = 'new'
+REMOVED = 'removed'
+# The time units of Google Benchmark, in nanoseconds.
+_TIME_UNITS = {'ns': 1.0, 'us': 1e3, 'ms': 1e6, 's': 1e9}
+
+
+def GetReportDir(env, project):
+    """
+        Description:
+            Gets the directory of the benchmark reports of a project.
+        Arguments:
+            env      -  The SCons environment.
+            project  -  The name of the project.
+        Exceptions:
+            None.
+        Return:
+            The absolute path to the directory.
+    """
+    return os.path.join(env.Dir('$INSTALL_REPORTS_DIR').abspath, 'bench', project)
+
+
+def Run(env, graph, project):
+    """
+        Description:
+            Builds the benchmarks of a project in the 'bench' variant and runs
+            them.
+        Arguments:
+            env      -  The SCons environment.
+            graph    -  The graph of components.
+            project  -  The name of the project.
+        Exceptions:
+            None.
+        Return:
+            The path to the results, or None if the benchmarks failed.
+    """
+    bench = graph.get('%s@bench' % project)
+    if bench is None:
+        env.cerror('[error] %s has no benchmarks.' % project)
+        return None
+    # The variant builds the benchmark program for the same target.
+    if variants.RunVariant(env, VARIANT, ['%s:bench' % project], {'--type': BUILD_TYPE}):
+        env.cerror('[error] the build of the benchmarks of %s failed.' % project)
+        return None
+    dirs = variants.GetVariantDirs(env, VARIANT)
+    bench_dir = os.path.relpath(bench._dir.abspath, env.Dir('$BUILD_DIR').abspath)
+    bench_dir = os.path.join(dirs['BUILD_DIR'], bench_dir)
+    report_dir = GetReportDir(env, project)
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    results = os.path.join(report_dir, RESULTS_FILE)
+    cmd = [os.path.join(bench_dir, '%s_bench' % project),
+           '--benchmark_out=%s' % results,
+           '--benchmark_out_format=json',
+           '--benchmark_repetitions=%d' % max(env.GetOption('bench_repetitions'), 1),
+           '--benchmark_display_aggregates_only=true']
+    if env.GetOption('bench_filter'):
+        cmd.append('--benchmark_filter=%s' % env.GetOption('bench_filter'))
+    process_env = dict(os.environ)
+    process_env['LD_LIBRARY_PATH'] = dirs['INSTALL_LIB_DIR']
+    if env.GetOption('verbose'):
+        env.Cprint('>> %s' % ' '.join(cmd), 'end')
+    returncode = subprocess.call(cmd, cwd=bench_dir, env=process_env)
+    if returncode:
+        env.cerror('[error] the benchmarks of %s failed with exit code %d.' %
+                   (project, returncode))
+        return None
+    commit = _GetCleanCommit(graph.get(project))
+    if commit is not None:
+        history_dir = os.path.join(report_dir, HISTORY_DIR)
+        if not os.path.exists(history_dir):
+            os.makedirs(history_dir)
+        shutil.copy(results, os.path.join(history_dir, '%s.json' % commit))
+    env.Cprint('[info] benchmark results of %s written to %s' % (project, results), 'green')
+    return results
+
+
+def Compare(env, graph, project):
+    """
+        Description:
+            Runs the benchmarks of a project and compares their results with
+            the baseline (see --bench-baseline), writing the reports.
+        Arguments:
+            env      -  The SCons environment.
+            graph    -  The graph of components.
+            project  -  The name of the project.
+        Exceptions:
+            None.
+        Return:
+            True if no benchmark regressed.
+    """
+    metrics_dir = env.Dir('$INSTALL_METRICS_DIR').Dir('bench').Dir(project).abspath
+    xml_report = os.path.join(metrics_dir, COMPARE_XML_FILE)
+    # The report of a previous comparison is not left for ready-to-commit.
+    if os.path.exists(xml_report):
+        os.remove(xml_report)
+    report_dir = GetReportDir(env, project)
+    default_baseline = os.path.join(report_dir, BASELINE_FILE)
+    baseline = _GetBaseline(env, graph, project)
+    if baseline is None:
+        return False
+    # The baseline is read before the run, which may replace the results
+    # kept for the commit.
+    baseline_times = None
+    if os.path.exists(baseline):
+        try:
+            baseline_times = LoadResults(baseline)
+        except (IOError, ValueError, KeyError), error:
+            env.cerror('[error] the baseline %s can not be read: %s' % (baseline, error))
+            return False
+    results = Run(env, graph, project)
+    if results is None:
+        return False
+    if baseline_times is None:
+        shutil.copy(results, baseline)
+        env.Cprint('[info] no baseline for %s, the results were saved as the baseline: %s' %
+                   (project, baseline), 'green')
+        return True
+    try:
+        comparison = CompareResults(baseline_times, LoadResults(results),
+                                    env.GetOption('bench_threshold') / 100.0)
+    except (IOError, ValueError, KeyError), error:
+        env.cerror('[error] the results of the benchmarks can not be read: %s' % error)
+        return False
+    text = _FormatComparison(comparison, baseline)
+    with open(os.path.join(report_dir, COMPARE_FILE), 'w') as f:
+        f.write(text)
+    if not os.path.exists(metrics_dir):
+        os.makedirs(metrics_dir)
+    _WriteJUnitReport(xml_report, project, comparison)
+    print text
+    regressions = [row for row in comparison if row['status'] == REGRESSION]
+    if env.GetOption('bench_update_baseline'):
+        shutil.copy(results, default_baseline)
+        env.Cprint('[info] the results were saved as the baseline: %s' % default_baseline,
+                   'green')
+    if regressions:
+        env.cerror('[error] %d benchmarks of %s regressed more than %g%%.' %
+                   (len(regressions), project, env.GetOption('bench_threshold')))
+        return False
+    env.Cprint('[info] no benchmark of %s regressed.' % project, 'green')
+    return True
+
+
+def LoadResults(path):
+    """
+        Description:
+            Reads the times of the benchmarks from a JSON file written by
+            Google Benchmark.
+        Arguments:
+            path  -  The path to the file.
+        Exceptions:
+            IOError, ValueError and KeyError if the file can not be read.
+        Return:
+            A dictionary with the CPU time (in nanoseconds) of each repetition
+            of each benchmark (name -> list of times).
+    """
+    with open(path) as f:
+        data = json.load(f)
+    times = {}
+    for benchmark in data['benchmarks']:
+        # The aggregates (mean, median, ...) are computed from the
+        # repetitions.
+        if benchmark.get('run_type') == 'aggregate' or benchmark.get('error_occurred'):
+            continue
+        name = benchmark.get('run_name', benchmark['name'])
+        unit = _TIME_UNITS[benchmark.get('time_unit', 'ns')]
+        times.setdefault(name, []).append(benchmark['cpu_time'] * unit)
+    return times
+
+
+def CompareResults(baseline, current, threshold):
+    """
+        Description:
+            Compares the times of the benchmarks of two runs.
+        Arguments:
+            baseline   -  The times of the baseline (see LoadResults()).
+            current    -  The times of the current run.
+            threshold  -  The relative change of a regression (0.05 is 5%).
+        Exceptions:
+            None.
+        Return:
+            A list with a dictionary for each benchmark, sorted by name, with
+            the keys 'name', 'status', 'baseline' and 'current' (the medians,
+            or None), 'change' (relative) and 'noise' (relative to the
+            baseline).
+    """
+    comparison = []
+    for name in sorted(set(baseline) | set(current)):
+        row = {'name': name, 'baseline': None, 'current': None, 'change': None,
+               'noise': None}
+        if name not in baseline:
+            row.update(status=NEW, current=Median(current[name]))
+        elif name not in current:
+            row.update(status=REMOVED, baseline=Median(baseline[name]))
+        else:
+            (old, new) = (Median(baseline[name]), Median(current[name]))
+            noise = NOISE_MADS * max(MedianAbsoluteDeviation(baseline[name]),
+                                     MedianAbsoluteDeviation(current[name]))
+            difference = new - old
+            if old > 0 and abs(difference) > noise and abs(difference) > threshold * old:
+                status = REGRESSION if difference > 0 else IMPROVEMENT
+            else:
+                status = UNCHANGED
+            row.update(status=status, baseline=old, current=new,
+                       change=difference / old if old > 0 else 0.0,
+                       noise=noise / old if old > 0 else 0.0)
+        comparison.append(row)
+    return comparison
+
+
+def Median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def MedianAbsoluteDeviation(values):
+    median = Median(values)
+    return Median([abs(value - median) for value in values])
+
+
+def _GetBaseline(env, graph, project):
+    """
+        Returns the path to the results compared with: the default baseline,
+        the file given by --bench-baseline or the results kept for the git
+        ref given by --bench-baseline. Returns None if they are not found.
+    """
+    option = env.GetOption('bench_baseline')
+    report_dir = GetReportDir(env, project)
+    if not option:
+        return os.path.join(report_dir, BASELINE_FILE)
+    if os.path.isfile(option):
+        return os.path.abspath(option)
+    source_dir = graph.get(project)._dir.srcnode().abspath
+    try:
+        commit = utils.Git(['rev-parse', '--verify', '%s^{commit}' % option], source_dir).strip()
+    except (OSError, subprocess.CalledProcessError):
+        env.cerror('[error] --bench-baseline=%s is not a file nor a git ref of %s.' %
+                   (option, project))
+        return None
+    path = os.path.join(report_dir, HISTORY_DIR, '%s.json' % commit)
+    if not os.path.exists(path):
+        env.cerror('[error] there are no benchmark results of %s for %s (%s), run %s:bench '
+                   'with that commit checked out.' % (project, option, commit[:12], project))
+        return None
+    return path
+
+
+def _GetCleanCommit(component):
+    """
+        Returns the commit checked out in the repository of the component,
+        or None if its directory is not in a git repository or it has
+        changes.
+    """
+    source_dir = component._dir.srcnode().abspath
+    try:
+        if utils.Git(['status', '--porcelain', '--untracked-files=no', '--', '.'], source_dir):
+            return None
+        return utils.Git(['rev-parse', 'HEAD'], source_dir).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _FormatComparison(comparison, baseline):
+    lines = ['Baseline: %s' % baseline, '',
+             '%-40s %14s %14s %9s %9s  %s' % ('Benchmark', 'Baseline', 'Current', 'Change',
+                                              'Noise', 'Status')]
+    for row in comparison:
+        change = '%+.1f%%' % (100 * row['change']) if row['change'] is not None else '-'
+        noise = '%.1f%%' % (100 * row['noise']) if row['noise'] is not None else '-'
+        lines.append('%-40s %14s %14s %9s %9s  %s' % (
+            row['name'], _FormatTime(row['baseline']), _FormatTime(row['current']), change,
+            noise, row['status']))
+    return '\n'.join(lines) + '\n'
+
+
+def _FormatTime(nanoseconds):
+    if nanoseconds is None:
+        return '-'
+    for unit in ['ns', 'us', 'ms']:
+        if nanoseconds < 1000:
+            return '%.3f %s' % (nanoseconds, unit)
+        nanoseconds /= 1000.0
+    return '%.3f s' % nanoseconds
+
+
+def _WriteJUnitReport(path, project, comparison):
+    """Writes the comparison as a JUnit report, a test case per benchmark."""
+    document = minidom.Document()
+    suite = document.createElement('testsuite')
+    suite.setAttribute('name', '%s.bench-compare' % project)
+    suite.setAttribute('tests', str(len(comparison)))
+    suite.setAttribute('failures', str(len([row for row in comparison
+                                             if row['status'] == REGRESSION])))
+    suite.setAttribute('errors', '0')
+    document.appendChild(suite)
+    for row in comparison:
+        case = document.createElement('testcase')
+        case.setAttribute('classname', '%s.bench' % project)
+        case.setAttribute('name', row['name'])
+        case.setAttribute('time', '%.9f' % ((row['current'] or 0) / 1e9))
+        if row['status'] == REGRESSION:
+            failure = document.createElement('failure')
+            failure.setAttribute('message', '%s regressed %+.1f%% (noise %.1f%%)' %
+                                 (row['name'], 100 * row['change'], 100 * row['noise']))
+            case.appendChild(failure)
+        elif row['status'] != UNCHANGED:
+            output = document.createElement('system-out')
+            output.appendChild(document.createTextNode(row['status']))
+            case.appendChild(output)
+        suite.appendChild(case)
+    with open(path, 'w') as f:
+        f.write(document.toprettyxml(indent='  '))
@@ -32,6 +32,16 @@ import shutil
 import os
 import utils
 import re
+import buildtrace
+import criticalpath
+import derivedcache
+import benchmarks
+import pgo
+import profiling
+import testcache
+import testrunner
+import testtimings
+import SCons.Tool
 from SCons.Defaults import Delete
 from SCons.Builder import Builder
 from SCons.Action import Action
@@ -54,9 +64,59 @@ CPPCHECK_CONFIG_RESULT = 0
 
 
 def init(env):
+    # The precompiled headers use the flags of the C++ compilations.
+    env['PCHCOM'] = '$CXX -o $TARGET -x c++-header -c $CXXFLAGS $CCFLAGS $_CCCOMCOM $SOURCE'
+    bldPCH = Builder(action=Action('$PCHCOM', '$PCHCOMSTR'), source_scanner=SCons.Tool.CScanner)
+    env.Append(BUILDERS={'PrecompiledHeader': bldPCH})
+    #-
+    bldUnity = Builder(action=Action(CreateUnityFile, PrintDummy))
+    env.Append(BUILDERS={'UnityFile': bldUnity})
+    #-
+    bldPGO = Builder(action=Action(RunPGO, PrintDummy))
+    env.Append(BUILDERS={'RunPGO': bldPGO})
+    #-
+    bldProfile = Builder(action=Action(RunProfile, PrintDummy))
+    env.Append(BUILDERS={'RunProfile': bldProfile})
+    #-
+    bldBench = Builder(action=Action(RunBenchmark, PrintDummy))
+    env.Append(BUILDERS={'RunBenchmark': bldBench})
+    #-
+    bldBenchCompare = Builder(action=Action(RunBenchmarkCompare, PrintDummy))
+    env.Append(BUILDERS={'RunBenchmarkCompare': bldBenchCompare})
+    #-
     bldRUT = Builder(action=Action(RunUnittest, PrintDummy))
     env.Append(BUILDERS={'RunUnittest': bldRUT})
     #-
+    bldTestTimings = Builder(action=Action(RunTestTimings, PrintDummy))
+    env.Append(BUILDERS={'RunTestTimings': bldTestTimings})
+    timings_report = env.Dir('$INSTALL_REPORTS_DIR').Dir('test').File(testtimings.REPORT_FILE)
+    timings = env.RunTestTimings(timings_report, [])
+    env.AlwaysBuild(timings)
+    env.Alias(testtimings.TIMINGS_TARGET, timings,
+              'Show the slowest tests and the trend of their times')
+    #-
+    bldCriticalPath = Builder(action=Action(RunCriticalPath, PrintDummy))
+    env.Append(BUILDERS={'RunCriticalPath': bldCriticalPath})
+    critical_path_report = env.Dir('$INSTALL_REPORTS_DIR').Dir('critical-path')
+    critical_path = env.RunCriticalPath(critical_path_report.File('critical-path.txt'), [])
+    env.AlwaysBuild(critical_path)
+    env.Alias(criticalpath.CRITICAL_PATH_TARGET, critical_path,
+              'Analyze the parallelism of the build with the durations of a --trace')
+    #-
+    bldCacheStats = Builder(action=Action(RunDerivedCacheStats, PrintDummy))
+    env.Append(BUILDERS={'RunDerivedCacheStats': bldCacheStats})
+    cache_report = env.Dir('$INSTALL_REPORTS_DIR').Dir('derived-cache')
+    cache_stats = env.RunDerivedCacheStats(cache_report.File('stats.txt'), [])
+    env.AlwaysBuild(cache_stats)
+    env.Alias(derivedcache.STATS_TARGET, cache_stats,
+              'Show the size and the use of the --derived-cache')
+    bldCachePrune = Builder(action=Action(RunDerivedCachePrune, PrintDummy))
+    env.Append(BUILDERS={'RunDerivedCachePrune': bldCachePrune})
+    cache_prune = env.RunDerivedCachePrune(cache_report.File('prune'), [])
+    env.AlwaysBuild(cache_prune)
+    env.Alias(derivedcache.PRUNE_TARGET, cache_prune,
+              'Remove the least recently used files of the --derived-cache beyond its size')
+    #-
     bldInitLcov = Builder(action=Action(InitLcov, PrintDummy))
     env.Append(BUILDERS={'InitLcov': bldInitLcov})
     #-
@@ -141,28 +201,133 @@ def RunNamecheck(env, target, source):
 
 
 def RunUnittest(env, target, source):
-    # Print message on the screen.
-    env.Cprint('\n=== Running TESTS ===\n', 'green')
+    # Get the name of the project from the target (<project>.passed).
+    name = target[0].name.split('.')[0]
     # Get the test directory and the test executable.
     test_dir, test_program = os.path.split(source[0].abspath)
     # Get the test suite to be executed.
     test_suite = env.GetOption('testsuite')
+    # Variables for the environment of the test. Other tests may be running
+    # at the same time, so os.environ must not be changed.
+    test_env = {}
     # Check if a report file is needed.
+    report = None
     if env.NEED_TEST_REPORT:
-        os.environ['GTEST_OUTPUT'] = env.test_report
+        test_env['GTEST_OUTPUT'] = env.test_report
+        report = env.test_report.split(':', 1)[-1]
     # Check if the test uses mocko or not.
     if env._USE_MOCKO:
-        cmd = "cd %s; gdb -x mocko_bind.gdb %s" % (test_dir, test_program)  # NOTE: The mocko_bind.gdb is hardcode here!
+        cmd = "gdb -x mocko_bind.gdb %s" % test_program  # NOTE: The mocko_bind.gdb is hardcode here!
     else:
-        cmd = "cd %s; ./%s --gtest_filter=%s" % (test_dir, test_program, test_suite)
+        cmd = "./%s --gtest_filter=%s" % (test_program, test_suite)
     if env.GetOption('verbose'):
-        env.Cprint('>> %s\n' % cmd, 'end')
-    # Execute the test.
-    test_proc = subprocess.Popen(cmd, shell=True)
-    if test_proc.wait():
-        env.cerror('\n\nTest result: *** FAILED ***\n\n')
-    else:
-        env.Cprint('\n\nTest result: *** PASSED ***\n\n', 'green')
+        env.Cprint('>> cd %s; %s\n' % (test_dir, cmd), 'end')
+    # The tests are split in shards only if the coverage is not needed (the
+    # shards would write the coverage data at the same time).
+    shards = 1 if env.NEED_COVERAGE else max(env.GetOption('test_shards'), 1)
+    # The results are cached only if the test does not need the terminal and
+    # it does not write coverage data.
+    use_cache = (env.GetOption('test_cache') == testcache.MODE_ON and
+                 not env._USE_MOCKO and not env.NEED_COVERAGE)
+    if use_cache:
+        cache = testcache.TestCache(env)
+        # The 'ref' files may not be copied to the build tree.
+        ref_dirs = RemoveDuplicates([os.path.join(test_dir, 'ref'),
+                                     source[0].dir.srcnode().Dir('ref').abspath])
+        key = cache.GetKey(source[0].abspath, ref_dirs, cmd, test_env)
+        output = cache.Load(key, report)
+        if output is not None:
+            testrunner.ReplayTest(env, name, output)
+            return EXIT_SUCCESS
+    # Execute the test. Its output is printed when it finishes, unless it
+    # runs under gdb.
+    result = testrunner.RunTest(env, name, test_dir, cmd, test_env, not env._USE_MOCKO, shards)
+    # Only the tests that passed are stored.
+    if use_cache and result.Passed():
+        cache.Store(key, result.output, report)
+    # Keep the times of the complete runs without coverage instrumentation.
+    if test_suite == '*' and not env.NEED_COVERAGE:
+        testtimings.Record(env, result, shards, report)
+    return EXIT_SUCCESS
+
+
+def CreateUnityFile(env, target, source):
+    # The source is a Value() with the #include lines.
+    with open(target[0].abspath, 'w') as f:
+        f.write('// Generated by fbuild --unity, do not edit.\n')
+        f.write(source[0].read() + '\n')
+    return EXIT_SUCCESS
+
+
+def RunPGO(env, target, source):
+    # The graph is complete when the targets are built.
+    from dependencygraph import componentGraph
+    if not pgo.Run(env, componentGraph, env['PGO_PROJECT'], env['PGO_TRAINING']):
+        return EXIT_ERROR
+    return EXIT_SUCCESS
+
+
+def RunProfile(env, target, source):
+    # The graph is complete when the targets are built.
+    from dependencygraph import componentGraph
+    if not profiling.Run(env, componentGraph, env['PROFILE_PROJECT'], env['PROFILE_TRAINING']):
+        return EXIT_ERROR
+    return EXIT_SUCCESS
+
+
+def RunBenchmark(env, target, source):
+    # The graph is complete when the targets are built.
+    from dependencygraph import componentGraph
+    if benchmarks.Run(env, componentGraph, env['BENCH_PROJECT']) is None:
+        return EXIT_ERROR
+    return EXIT_SUCCESS
+
+
+def RunBenchmarkCompare(env, target, source):
+    # The graph is complete when the targets are built.
+    from dependencygraph import componentGraph
+    if not benchmarks.Compare(env, componentGraph, env['BENCH_PROJECT']):
+        return EXIT_ERROR
+    return EXIT_SUCCESS
+
+
+def RunTestTimings(env, target, source):
+    testtimings.WriteReport(env, target[0].abspath)
+    return EXIT_SUCCESS
+
+
+def RunCriticalPath(env, target, source):
+    # The graph is complete when the targets are built.
+    from dependencygraph import componentGraph
+    trace = env.GetOption('critical_path_trace')
+    if not trace:
+        env.cerror('[error] use --critical-path-trace=FILE with a trace written by --trace.')
+        return EXIT_ERROR
+    try:
+        tasks = buildtrace.GetTaskEvents(trace)
+    except (IOError, ValueError, KeyError), error:
+        env.cerror('[error] can not read the trace %s: %s' % (trace, error))
+        return EXIT_ERROR
+    result = criticalpath.Analyze(env, componentGraph, tasks)
+    criticalpath.WriteReport(env, result, target[0].abspath)
+    return EXIT_SUCCESS
+
+
+def RunDerivedCacheStats(env, target, source):
+    if 'DERIVED_CACHE' not in env:
+        env.cerror('[error] use --derived-cache=DIR with the directory of the cache.')
+        return EXIT_ERROR
+    derivedcache.WriteStats(env, target[0].abspath)
+    return EXIT_SUCCESS
+
+
+def RunDerivedCachePrune(env, target, source):
+    if 'DERIVED_CACHE' not in env:
+        env.cerror('[error] use --derived-cache=DIR with the directory of the cache.')
+        return EXIT_ERROR
+    (removed, freed) = derivedcache.Prune(env, env['DERIVED_CACHE_SIZE'])
+    env.Cprint('[info] %d files removed from %s, %.1f MB freed' %
+               (removed, env['DERIVED_CACHE'], freed / float(1 << 20)), 'green')
     return EXIT_SUCCESS
 
 
@@ -543,6 +708,13 @@ def RunReadyToCommit(env, target, source):
         env.Cprint('VALGRIND : [OK]', 'green')
     else:
         env.Cprint('VALGRIND : [ERROR]', 'red')
+    # Check for the benchmarks, if they were compared.
+    if env.GetOption('rtc_bench'):
+        benchmarks_ok = _RTCCheckBenchmarks(env)
+        if benchmarks_ok:
+            env.Cprint('BENCHMARKS : [OK]', 'green')
+        elif benchmarks_ok is not None:
+            env.Cprint('BENCHMARKS : [ERROR]', 'red')
     env.Cprint("", 'end')  # Just an empty line.
     return EXIT_SUCCESS
 
@@ -771,6 +943,20 @@ def _RTCCheckValgrind(env):
     return not element.strip()
 
 
+def _RTCCheckBenchmarks(env):
+    # Path to the report of the comparison.
+    report_file = env.Dir('$INSTALL_METRICS_DIR').Dir('bench')
+    report_file = report_file.Dir(env['PROJECT_NAME'])
+    report_file = os.path.join(report_file.abspath, benchmarks.COMPARE_XML_FILE)
+    # The project has no benchmarks, or they have no baseline yet.
+    if not os.path.exists(report_file):
+        return None
+    # Take the tag <testsuite>.
+    xml_report = minidom.parse(report_file)
+    element = xml_report.getElementsByTagName('testsuite')[FIRST_ELEMENT]
+    return element.getAttribute('failures') == '0'
+
+
 def _ExecuteNamecheck(env, files, plugin, conf, includes):
     reg = '(/%s/).*(\[namecheck\])' % env['PROJECT_NAME']
     for x in files.split(SPACE):
@@ -0,0 +1,156 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module records a trace of the build (--trace=FILE).
+
+    Every task executed by SCons (a compilation, a link, an install, a test
+    run, ...) is recorded with its start and end times, the worker that ran
+    it and its targets. When the build ends the trace is written in the
+    Chrome trace event format, so it can be loaded in chrome://tracing or in
+    any trace viewer, where each worker of -j is a row.
+"""
+
+
+import atexit
+import json
+import os
+import threading
+import time
+
+import SCons.Node.Alias
+import SCons.Taskmaster
+
+
+# Events of the trace (dictionaries in the trace event format).
+_events = []
+# The worker slot of each thread (thread ident -> slot number).
+_slots = {}
+# The lock that protects the events and the slots, the tasks are executed
+# in the threads of the workers.
+_lock = threading.Lock()
+# The time when the trace started.
+_start = None
+
+
+def init(env):
+    """
+        Description:
+            Starts recording the trace if the --trace option was given.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    global _start
+    path = env.GetOption('trace_file')
+    if not path or _start is not None:
+        return
+    _start = time.time()
+    path = os.path.abspath(path)
+    execute = SCons.Taskmaster.Task.execute
+
+    def TracedExecute(task):
+        start = time.time()
+        try:
+            execute(task)
+        finally:
+            _AddTaskEvent(task, start, time.time())
+
+    SCons.Taskmaster.Task.execute = TracedExecute
+    atexit.register(_Write, env, path)
+
+
+def GetTaskEvents(path):
+    """
+        Description:
+            Reads the actions of a trace written by this module.
+        Arguments:
+            path  -  The path to the trace file.
+        Exceptions:
+            IOError and ValueError if the file can not be read.
+        Return:
+            A list of dictionaries with the keys 'targets' (their absolute
+            paths), 'builder', 'start' and 'duration' (in seconds).
+    """
+    with open(path) as f:
+        trace = json.load(f)
+    tasks = []
+    for event in trace['traceEvents']:
+        if event.get('ph') == 'X':
+            tasks.append({
+                'targets': event['args']['targets'],
+                'builder': event['cat'],
+                'start': event['ts'] / 1e6,
+                'duration': event['dur'] / 1e6,
+            })
+    return tasks
+
+
+def _AddTaskEvent(task, start, end):
+    """Records an executed task."""
+    node = task.targets[0]
+    # The aliases have no action.
+    if isinstance(node, SCons.Node.Alias.Alias):
+        return
+    try:
+        builder = node.get_builder().get_name(node.get_build_env())
+    except Exception:
+        builder = 'unknown'
+    targets = [str(t) for t in task.targets]
+    with _lock:
+        thread = threading.current_thread().ident
+        if thread not in _slots:
+            _slots[thread] = len(_slots)
+        _events.append({
+            'name': targets[0],
+            'cat': builder,
+            'ph': 'X',
+            'ts': int((start - _start) * 1e6),
+            'dur': int((end - start) * 1e6),
+            'pid': 1,
+            'tid': _slots[thread],
+            'args': {
+                'targets': [t.get_abspath() for t in task.targets],
+                'cached': bool(getattr(node, 'cached', False)),
+            },
+        })
+
+
+def _Write(env, path):
+    """Writes the trace file."""
+    with _lock:
+        events = list(_events)
+        for slot in sorted(_slots.values()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': slot,
+                           'args': {'name': 'worker %d' % slot}})
+    events.append({'name': 'process_name', 'ph': 'M', 'pid': 1,
+                   'args': {'name': 'fbuild'}})
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    env.Cprint('[info] build trace with %d actions written to %s' %
+               (len(_events), path), 'green')
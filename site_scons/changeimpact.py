@@ -0,0 +1,190 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module selects the tests affected by a change.
+
+    Each changed file is mapped to the component that owns it: the component
+    that has it as a source file or, if none has it, the component with the
+    deepest directory (own, include or external include directory) that
+    contains it. The tests affected are the test components that depend
+    (directly or not) on an owner, found walking the reverse dependencies of
+    the component graph.
+"""
+
+
+import collections
+import os
+import subprocess
+
+from core_components import ExternalComponent, SourcedComponent, UnitTestComponent
+import testtimings
+import utils
+
+
+# The target that runs the tests affected by the change.
+AFFECTED_TEST_TARGET = 'affected:test'
+# The revision compared with the working tree when no change is given.
+DEFAULT_REVISION = 'HEAD'
+
+# The names of the affected tests, computed once.
+_affected_tests = None
+
+
+def GetChangedFiles(env):
+    """
+        Description:
+            Gets the files changed, from the file given with --changed-files
+            (one path per line) or from git, comparing the working tree with
+            the revision given with --changed-from (HEAD by default).
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            A list with the absolute paths of the changed files.
+    """
+    files_list = env.GetOption('changed_files')
+    if files_list:
+        try:
+            with open(files_list) as f:
+                lines = f.read().splitlines()
+        except IOError, error:
+            env.cerror('[error] can not read the changed files: %s' % error)
+            return []
+        return [os.path.realpath(x.strip()) for x in lines if x.strip()]
+    revision = env.GetOption('changed_from') or DEFAULT_REVISION
+    ws_dir = env.Dir('$WS_DIR').abspath
+    try:
+        top = utils.Git(['rev-parse', '--show-toplevel'], ws_dir).strip()
+        # The files changed since the revision, and the new files.
+        names = utils.Git(['diff', '--name-only', revision, '--'], top).splitlines()
+        names += utils.Git(['ls-files', '--others', '--exclude-standard'], top).splitlines()
+    except (OSError, subprocess.CalledProcessError), error:
+        env.cerror('[error] can not get the files changed from %s in %s: %s %s' %
+                   (revision, ws_dir, error, getattr(error, 'output', '')))
+        return []
+    return [os.path.realpath(os.path.join(top, x)) for x in names if x]
+
+
+def GetOwners(graph, files):
+    """
+        Description:
+            Maps each file to the component that owns it.
+        Arguments:
+            graph  -  The graph of components.
+            files  -  A list with the absolute paths of the files.
+        Exceptions:
+            None.
+        Return:
+            A set with the names of the components that own a file. The files
+            not owned by any component are ignored.
+    """
+    sources = {}
+    dirs = {}
+    for component in graph.values():
+        if isinstance(component, ExternalComponent):
+            continue
+        if isinstance(component, SourcedComponent):
+            for node in component.GetSourcesFiles():
+                sources.setdefault(_SourcePath(node), set()).add(component.name)
+        directories = [component._dir] + (component._includes or [])
+        directories += component._external_includes or []
+        for node in directories:
+            dirs.setdefault(_SourcePath(node), set()).add(component.name)
+    owners = set()
+    for path in files:
+        if path in sources:
+            owners.update(sources[path])
+            continue
+        # Look for the deepest directory that contains the file.
+        directory = os.path.dirname(path)
+        while directory not in dirs and os.path.dirname(directory) != directory:
+            directory = os.path.dirname(directory)
+        owners.update(dirs.get(directory, []))
+    return owners
+
+
+def GetAffectedTests(env, graph):
+    """
+        Description:
+            Gets the test components affected by the changed files (see
+            GetChangedFiles()).
+        Arguments:
+            env    -  The SCons environment.
+            graph  -  The graph of components.
+        Exceptions:
+            None.
+        Return:
+            A sorted list with the names of the affected test components.
+    """
+    global _affected_tests
+    if _affected_tests is not None:
+        return _affected_tests
+    files = GetChangedFiles(env)
+    owners = GetOwners(graph, files)
+    # The components that depend on each component.
+    dependents = collections.defaultdict(list)
+    for component in graph.values():
+        for dep in component._dependencies:
+            dependents[dep].append(component.name)
+    # Walk the reverse dependencies from the owners.
+    reached = set(owners)
+    queue = collections.deque(owners)
+    while queue:
+        for name in dependents[queue.popleft()]:
+            if name not in reached:
+                reached.add(name)
+                queue.append(name)
+    _affected_tests = sorted(name for name in reached
+                             if isinstance(graph.get(name), UnitTestComponent))
+    if env.GetOption('verbose'):
+        env.cdebug('[info] %d changed files, owned by: %s' %
+                   (len(files), ', '.join(sorted(owners)) or '-'))
+    env.cdebug('[info] %d tests affected by the change: %s' %
+               (len(_affected_tests), ', '.join(_affected_tests) or '-'))
+    return _affected_tests
+
+
+def CreateAffectedTestAlias(env, graph):
+    """
+        Description:
+            Creates the 'affected:test' alias, with the targets that run the
+            affected tests. The test components must be processed.
+        Arguments:
+            env    -  The SCons environment.
+            graph  -  The graph of components.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    # Process() returns the target that runs the test of a test component.
+    # The slowest tests go first, so they start running first.
+    names = testtimings.SortLongestFirst(env, graph, GetAffectedTests(env, graph))
+    builders = [graph.get(name).Process() for name in names]
+    env.Alias(AFFECTED_TEST_TARGET, builders, 'Run the tests affected by the changed files')
+
+
+def _SourcePath(node):
+    """Returns the real path of a node in the source tree."""
+    return os.path.realpath(node.srcnode().abspath)
@@ -23,23 +23,75 @@
 """This file contains all the compiler related stuff."""
 
 
+import atexit
 import platform
 import os
+import re
 import sys
 import subprocess
+from distutils.spawn import find_executable
 from SCons.Script import AddOption
 
 
+# The modes of the --pgo option.
+PGO_GENERATE = 'generate'
+PGO_USE = 'use'
+PGO_MODES = [PGO_GENERATE, PGO_USE]
+# The profilers of the --instrument option.
+INSTRUMENT_GPROF = 'gprof'
+INSTRUMENT_PERF = 'perf'
+INSTRUMENT_PROFILERS = [INSTRUMENT_GPROF, INSTRUMENT_PERF]
+# The compilation commands that go through the compiler cache.
+COMPILER_CACHE_COMMANDS = ['CCCOM', 'CXXCOM', 'SHCCCOM', 'SHCXXCOM']
+# The statistics of ccache shown at the end of the build, with the names
+# used by 'ccache --print-stats' and the lines of 'ccache -s' (old versions).
+_CCACHE_STATS = [
+    ('hits', ['direct_cache_hit', 'preprocessed_cache_hit'],
+     [r'cache hit \(direct\)\s+(\d+)', r'cache hit \(preprocessed\)\s+(\d+)']),
+    ('misses', ['cache_miss'], [r'cache miss\s+(\d+)']),
+]
+
+
 def init(env):
     AddOption('--type',
               dest='type',
               type='string',
               nargs=1,
               action='store',
-              help='type of build, options: release, opt')
+              help='type of build, options: release, opt, lto')
+    AddOption('--compiler-cache',
+              dest='compiler_cache',
+              type='string',
+              nargs=1,
+              action='store',
+              help='directory of a ccache cache shared by the workspaces and build types')
+    AddOption('--pgo',
+              dest='pgo',
+              type='choice',
+              choices=PGO_MODES,
+              nargs=1,
+              action='store',
+              help='profile-guided optimization, options: %s (see <project>:pgo)' %
+                   ', '.join(PGO_MODES))
+    AddOption('--pgo-dir',
+              dest='pgo_dir',
+              type='string',
+              nargs=1,
+              action='store',
+              help='directory of the profile written and read by --pgo')
+    AddOption('--instrument',
+              dest='instrument',
+              type='choice',
+              choices=INSTRUMENT_PROFILERS,
+              nargs=1,
+              action='store',
+              help='compile for a profiler, options: %s (see <project>:profile)' %
+                   ', '.join(INSTRUMENT_PROFILERS))
     (arch, binType) = platform.architecture()
     if binType == 'ELF':
         LinuxOptions(env)
+    if env.GetOption('compiler_cache'):
+        CompilerCache(env, env.GetOption('compiler_cache'))
 
 def LinuxOptions(env):
     AddOption('--effective',
@@ -59,7 +111,139 @@ def LinuxOptions(env):
         optFlags = ['-O3']
         env.Append(CXXFLAGS=optFlags, CFLAGS=optFlags)
         env.Append(CPPDEFINES=['NDEBUG'])
+    elif env.GetOption('type') == 'lto':
+        # The link flags and the archiver are set by the linker module.
+        optFlags = ['-O3', '-flto']
+        env.Append(CXXFLAGS=optFlags, CFLAGS=optFlags)
+        env.Append(CPPDEFINES=['NDEBUG'])
     elif env.GetOption('type') != 'release':
         dbgFlags = ['-ggdb3']
         env.Append(CXXFLAGS=dbgFlags, CFLAGS=dbgFlags)
         env.Append(CPPDEFINES=['DEBUG'])
+    if env.GetOption('pgo'):
+        ProfileGuidedOptimization(env, env.GetOption('pgo'), env.GetOption('pgo_dir'))
+    if env.GetOption('instrument'):
+        Instrument(env, env.GetOption('instrument'))
+
+
+def ProfileGuidedOptimization(env, mode, profile_dir):
+    """
+        Description:
+            Compiles to write a profile when the programs run ('generate'),
+            or to optimize with the profile written ('use'). Both builds must
+            have the same objects paths, the profile of each object is found
+            by its path.
+        Arguments:
+            env          -  The SCons environment.
+            mode         -  One of PGO_MODES.
+            profile_dir  -  The directory of the profile.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    profile_dir = os.path.abspath(profile_dir or 'pgo')
+    if mode == PGO_GENERATE:
+        # The tests may run in many threads.
+        flags = ['-fprofile-generate=%s' % profile_dir, '-fprofile-update=atomic']
+        linkFlags = ['-fprofile-generate=%s' % profile_dir]
+    else:
+        # The functions that changed or did not run are compiled without
+        # the profile, instead of failing.
+        flags = ['-fprofile-use=%s' % profile_dir, '-fprofile-correction',
+                 '-Wno-missing-profile', '-Wno-error=coverage-mismatch']
+        linkFlags = ['-fprofile-use=%s' % profile_dir]
+    env.Append(CXXFLAGS=flags, CFLAGS=flags, LINKFLAGS=linkFlags)
+
+
+def Instrument(env, profiler):
+    """
+        Description:
+            Compiles for a profiler: gprof needs the programs compiled and
+            linked with -pg, perf needs the frame pointers to walk the stacks
+            and the debug information to name the functions.
+        Arguments:
+            env       -  The SCons environment.
+            profiler  -  One of INSTRUMENT_PROFILERS.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    if profiler == INSTRUMENT_GPROF:
+        flags = ['-pg']
+        linkFlags = ['-pg']
+    else:
+        flags = ['-fno-omit-frame-pointer', '-g']
+        linkFlags = []
+    env.Append(CXXFLAGS=flags, CFLAGS=flags, LINKFLAGS=linkFlags)
+
+
+def CompilerCache(env, cache_dir):
+    """
+        Description:
+            Runs the compilations through ccache, with its cache in the given
+            directory. The cache is put in front of the compilation commands
+            instead of the compiler, so it is kept when a component changes
+            its compiler (like clang for ASan). The paths are hashed relative
+            to the fbuild directory, so other workspaces can use the objects.
+        Arguments:
+            env        -  The SCons environment.
+            cache_dir  -  The directory of the cache.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    ccache = find_executable('ccache')
+    if ccache is None:
+        env.cwarn('[warn] ccache is not installed, --compiler-cache is ignored.')
+        return
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+    env['COMPILER_CACHE'] = ccache
+    env['ENV']['CCACHE_DIR'] = cache_dir
+    env['ENV']['CCACHE_BASEDIR'] = env.Dir('#').abspath
+    # Do not hash the working directory, it is only written in the debug
+    # information.
+    env['ENV']['CCACHE_NOHASHDIR'] = '1'
+    for command in COMPILER_CACHE_COMMANDS:
+        env[command] = '$COMPILER_CACHE ' + env[command]
+    start = _GetCompilerCacheStats(ccache, env['ENV'])
+    if start is not None:
+        atexit.register(_PrintCompilerCacheStats, env, ccache, start)
+
+
+def _GetCompilerCacheStats(ccache, ccache_env):
+    """Returns a dictionary with the statistics of ccache, or None."""
+    def Run(option):
+        process = subprocess.Popen([ccache, option], env=ccache_env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = process.communicate()[0]
+        return output if process.returncode == 0 else None
+    stats = {}
+    output = Run('--print-stats')
+    if output is not None:
+        values = dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+        for (name, keys, regexps) in _CCACHE_STATS:
+            stats[name] = sum(int(values.get(key, 0)) for key in keys)
+        return stats
+    output = Run('-s')
+    if output is None:
+        return None
+    for (name, keys, regexps) in _CCACHE_STATS:
+        stats[name] = sum(int(m.group(1)) for m in
+                          [re.search(regexp, output) for regexp in regexps] if m)
+    return stats
+
+
+def _PrintCompilerCacheStats(env, ccache, start):
+    """Prints the hits and misses of ccache during the build."""
+    end = _GetCompilerCacheStats(ccache, env['ENV'])
+    if end is None:
+        return
+    hits = end['hits'] - start['hits']
+    misses = end['misses'] - start['misses']
+    if hits + misses:
+        env.Cprint('[info] compiler cache: %d hits, %d misses (%.0f%% hits) in %s' %
+                   (hits, misses, 100.0 * hits / (hits + misses), env['ENV']['CCACHE_DIR']),
+                   'green')
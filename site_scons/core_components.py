@@ -35,8 +35,10 @@ import re
 from SCons import Node
 from re import sub
 
+import benchmarks
 import utils
 import fbuild_exceptions
+import variants
 
 
 HEADERS_FILTER = ['*.h', '*.hpp']
@@ -151,20 +153,16 @@ class Component(object):
         self._libpaths.append(self._env['INSTALL_LIB_DIR'])
         # Look for the libs and its paths.
         try:
-            self._GetLibs(self._libs, self._libpaths, [], 0)
+            self._GetLibs(self._libs, self._libpaths)
         except fbuild_exceptions.CircularDependencyError, error:
             msg = (' -> ').join(error[0])
             self._env.cerror('[error] A dependency cycle was found:\n  %s' % msg)
-        # This function tells if the tuple depth is the maximum in
-        # self._libs.
-        IsMax = lambda depth, name: len([(d, n) for (d, n) in self._libs 
-                                              if (n == name) and (d > depth)]) == 0
-        # Remove from the list the duplicated names.
-        aux = [t for t in self._libs if IsMax(*t)]
-        aux = utils.RemoveDuplicates(aux)
-        aux.sort()
+        # Each library comes once with the length of the longest path that
+        # reaches it, so sorting by depth puts every library before the ones
+        # it depends on.
+        self._libs.sort()
         # Create the self._libs list.
-        self._libs = [t[1] for t in aux]
+        self._libs = [t[1] for t in self._libs]
         # Remove duplicated in libpaths
         self._libpaths = utils.RemoveDuplicates(self._libpaths)
         return (self._libs, self._libpaths)
@@ -185,7 +183,7 @@ class Component(object):
         else:
             self._include_paths = set()
         try:
-            self._GetIncludePaths(self._include_paths, [])
+            self._GetIncludePaths(self._include_paths)
         except fbuild_exceptions.CircularDependencyError, error:
             msg = (' -> ').join(error[0])
             self._env.cerror('[error] A dependency cycle was found:\n  %s' % msg)
@@ -236,7 +234,7 @@ class Component(object):
         else:
             self._object_files = []
         try:
-            self._GetObjectsFiles(self._object_files, [])
+            self._GetObjectsFiles(self._object_files)
         except fbuild_exceptions.CircularDependencyError, error:
             msg = (' -> ').join(error[0])
             self._env.cerror('[error] A dependency cycle was found:\n  %s' % msg)
@@ -270,125 +268,75 @@ class Component(object):
         self._env.Alias('all:cloc', run_cloc_builder, 'Run Cloc in all projects')
 
 
-    def _GetObjectsFiles(self, object_files, stack):
+    def _GetObjectsFiles(self, object_files):
         """
-            This is a recursive internal method used by the GetObjectsFiles
-            method.
+            This is an internal method used by the GetObjectsFiles method.
         """
-        if self.name in stack:
-            # If the component name is within the stack then there is a
-            # cycle.
-            stack.append(self.name)
-            raise fbuild_exceptions.CircularDependencyError(stack)
-        else:
-            # We add the component name to the stack.
-            stack.append(self.name)
-        if ((len(stack) == 1 and isinstance(self,ObjectComponent)) or
-            (type(self) == ObjectComponent)):
+        if isinstance(self, ObjectComponent):
             self._CreateObjectFiles()
             object_files.extend(self._objects)
-        for dependency in self._dependencies:
-            try:
-                component = self._component_graph[dependency]
-            except (IndexError, KeyError):
-                self._env.cerror(
-                    '[error] %s depends on %s which could not be found' %
-                    (self.name, dependency)
-                )
-            else:
-                component._GetObjectsFiles(object_files, stack)
-        # We remove the component name from the stack.
-        if self.name in stack:
-            stack.pop()
-
-    def _GetIncludePaths(self, include_paths, stack):
+        # Only the plain object components are linked into the component
+        # that depends on them.
+        engine = self._component_graph.engine
+        for dependency in engine.GetDependencies(self.name):
+            component = self._component_graph[dependency]
+            if type(component) == ObjectComponent:
+                component._CreateObjectFiles()
+                object_files.extend(component._objects)
+
+    def _GetIncludePaths(self, include_paths):
         """
-        This is a recursive internal method used by the GetIncludePaths
-        method.
+        This is an internal method used by the GetIncludePaths method.
         """
-        if self.name in stack:
-            # If the component name is within the stack then there is a
-            # cycle.
-            stack.append(self.name) # so why append it?
-            raise fbuild_exceptions.CircularDependencyError(stack)
-        else:
-            # We add the component name to the stack.
-            stack.append(self.name)
-        if len(stack) == 1:
-            # If we're here is because we are looking for the include of this
-            # component.
-            # So we add the _includes from this component
-            include_paths |= set(self._includes)
-
-            if isinstance(self, UnitTestComponent):
-                # If this is a UnitTestComponent we need the include directories
-                # from its component too.
-                component = self._component_graph[self._project_name]
-                include_paths |= set(component._includes)
-            
-            # We also add the install/include/ and the build/project/ directories.
-            include_paths.add(self._env.Dir('$INSTALL_HEADERS_DIR'))
-            include_paths.add(self._dir)
-        else:
-            # If we're here is because we're looking for the include of the
-            # dependency of a component.
-            # 'self' can not be a UnitTestComponent. Because a
-            # 'UnitTestComponent should never be a dependency of other
-            # component.
-            assert(not isinstance(self, UnitTestComponent))
-            if isinstance(self, ExternalComponent):
-                include_paths |= set(self._includes)
-            else:
-                path = self._env.Dir('$INSTALL_HEADERS_DIR')
-                path = path.Dir(self.name)
-                include_paths.add(path)
+        # So we add the _includes from this component
+        include_paths |= set(self._includes)
+        if isinstance(self, (UnitTestComponent, BenchmarkComponent)):
+            # If this is a UnitTestComponent (or a BenchmarkComponent) we need
+            # the include directories from its component too.
+            component = self._component_graph[self._project_name]
+            include_paths |= set(component._includes)
+        # We also add the install/include/ and the build/project/ directories.
+        include_paths.add(self._env.Dir('$INSTALL_HEADERS_DIR'))
+        include_paths.add(self._dir)
         # We always add external includes.
         include_paths |= set(self._external_includes)
         # Look for the includes of its dependencies.
-        for dependency in self._dependencies:
-            component = self._component_graph.get(dependency)
-            if component:
-                include_paths |= set(component._includes)
-                component._GetIncludePaths(include_paths, stack)
-            else:
-                self._env.cerror(
-                    '[error] %s depends on %s which could not be found' %
-                    (self.name, dependency)
-                )
-        # We remove the component name from the stack.
-        if self.name in stack:
-            stack.pop()
-
-    def _GetLibs(self, libs, libpaths, stack, depth):
+        engine = self._component_graph.engine
+        include_paths |= engine.GetDependenciesIncludePaths(self.name)
+
+    def _GetIncludePathsAsDependency(self):
         """
-            This is a recursive internal method used by the GetLibs method.
+            This is an internal method that returns the include paths this
+            component gives to the components that depend on it (without
+            those of its own dependencies).
         """
-        if self.name in stack:
-            # If the component name is within the stack then there is a cycle.
-            stack.append(self.name)
-            raise fbuild_exceptions.CircularDependencyError(stack)
-        else:
-            # We add the component name to the stack.
-            stack.append(self.name)
-        if self._should_be_linked and depth > 0:
-            libs.append((depth, self.name))
-            # We add the directory where the library lives.
-            if not self._dir.abspath in libpaths:
-                libpaths.append(self._dir)
-        # Check its dependencies.
-        for dependencies in self._dependencies:
-            try:
-                component = self._component_graph[dependencies]
-            except KeyError:
-                self._env.cerror(
-                    '[error] %s depends on %s which could not be found' %
-                    (self.name, dependencies)
-                )
-            else:
-                component._GetLibs(libs, libpaths, stack, depth + 1)
-        # We remove the component name from the stack.
-        if self.name in stack:
-            stack.pop()
+        # 'self' can not be a UnitTestComponent. Because a
+        # 'UnitTestComponent should never be a dependency of other
+        # component.
+        assert(not isinstance(self, UnitTestComponent))
+        include_paths = list(self._includes)
+        if not isinstance(self, ExternalComponent):
+            # The headers of the component are taken from the install/include/
+            # directory.
+            path = self._env.Dir('$INSTALL_HEADERS_DIR')
+            path = path.Dir(self.name)
+            include_paths.append(path)
+        # We always add external includes.
+        include_paths.extend(self._external_includes)
+        return include_paths
+
+    def _GetLibs(self, libs, libpaths):
+        """
+            This is an internal method used by the GetLibs method.
+        """
+        engine = self._component_graph.engine
+        depths = engine.GetDependenciesDepth(self.name)
+        for dependency in engine.GetDependencies(self.name):
+            component = self._component_graph[dependency]
+            if component._should_be_linked:
+                libs.append((depths[dependency], component.name))
+                # We add the directory where the library lives.
+                libpaths.append(component._dir)
 
     def _CreateInstallerBuilder(self, binaries):
         """
@@ -505,6 +453,8 @@ class HeaderOnlyComponent(Component):
             'asan': None,
             'astyle': None,
             'astyle-check': None,
+            'bench': None,
+            'bench-compare': None,
             'cccc': None,
             'cloc': None,
             'coverage': None,
@@ -512,6 +462,8 @@ class HeaderOnlyComponent(Component):
             'info': None,
             'install': None,
             'jenkins': None,
+            'pgo': None,
+            'profile': None,
             'ready-to-commit': None,
             'static-analysis': None,
             'test': None,
@@ -798,7 +750,10 @@ class HeaderOnlyComponent(Component):
                 utils.WasTargetInvoked('all:asan'))
         namecheck = utils.WasTargetInvoked('%s:namecheck' % name)
         test = (utils.WasTargetInvoked('%s:test' % name) or
-                utils.WasTargetInvoked('all:test'))
+                utils.WasTargetInvoked('all:test') or
+                utils.WasTargetInvoked('affected:test'))
+        bench = (utils.WasTargetInvoked('%s:bench' % name) or
+                 utils.WasTargetInvoked('all:bench'))
         # Create the dictionary of flags.
         result = {
             'jenkins': jenkins,
@@ -806,7 +761,8 @@ class HeaderOnlyComponent(Component):
             'ready-to-commit': rtc,
             'asan': asan,
             'namecheck': namecheck,
-            'test': test
+            'test': test,
+            'bench': bench
         }
         # Check for needed reports.
         self._env.NEED_COVERAGE = jenkins or coverage
@@ -1109,6 +1065,18 @@ class ObjectComponent(SourcedComponent):
     #
     # A list with the object files (instances of the SCons Object() class).
     _objects = None
+    # Whether the sources can be compiled together in unity files (see the
+    # --unity option). It is False for the sources that do not compile that
+    # way, like those that define the same static names.
+    _unity = True
+    # The header precompiled for the C++ sources (an instance of the SCons
+    # File class), or None.
+    _pch = None
+    # The builder of the precompiled header.
+    _pch_builder = None
+    # The command that runs the program to write the profile for <name>:pgo,
+    # and the workload profiled by <name>:profile, or None to run the tests.
+    _pgo_training = None
 
     #
     # Special methods.
@@ -1147,9 +1115,42 @@ class ObjectComponent(SourcedComponent):
             Initialize the list of object files.
         """
         if not self._objects:
-            for source in self.GetSourcesFiles():
+            for source in self._GetCompiledFiles():
                 self._objects.append(self._CreateObjectBuilder(source))
 
+    def _GetCompiledFiles(self):
+        """
+            Returns the files that are compiled: the sources or, with
+            --unity=N, unity files that include about N sources each. The
+            other targets (like the names check or the static analysis) use
+            the sources.
+        """
+        size = self._env.GetOption('unity')
+        if not self._unity or size < 2:
+            return self.GetSourcesFiles()
+        # The C and the C++ sources are compiled in different unity files.
+        languages = {}
+        for source in sorted(self.GetSourcesFiles(), key=lambda x: x.abspath):
+            extension = '.c' if source.name.endswith('.c') else '.cc'
+            languages.setdefault(extension, []).append(source)
+        files = []
+        for (extension, sources) in sorted(languages.items()):
+            count = (len(sources) + size - 1) // size
+            for i in range(count):
+                group = sources[i * len(sources) // count:(i + 1) * len(sources) // count]
+                if len(group) == 1:
+                    files.extend(group)
+                    continue
+                name = '%s-unity%d%s' % (self.name.replace('@', '_'), len(files), extension)
+                # The unity file is in the directory of the component, so
+                # the sources are included with relative paths.
+                includes = ['#include "%s"' % os.path.relpath(x.abspath, self._dir.abspath)
+                            for x in group]
+                unity_file = self._env.UnityFile(self._dir.File(name),
+                                                 self._env.Value('\n'.join(includes)))
+                files.extend(unity_file)
+        return files
+
     def _CreateObjectBuilder(self, source):
         """
             This is a private method that takes a file source and return an
@@ -1161,17 +1162,75 @@ class ObjectComponent(SourcedComponent):
         (libs, libpaths) = self.GetLibs()
         # Create the target for each file.
         target = os.path.splitext(source.abspath)[0]
+        # The precompiled header is included before the C++ sources, the
+        # compiler uses the .gch file next to it.
+        cppflags = self._env.get('CPPFLAGS', [])
+        pch_builder = self._CreatePrecompiledHeader()
+        if pch_builder is not None and not source.name.endswith('.c'):
+            cppflags = ['-include', self._pch.abspath] + cppflags
         # Create an instance of the Object() builder.
         object_builder = self._env.Object(
             target,
             source,
             CPPPATH=include_paths+self._env.get('CPPPATH',[]),
+            CPPFLAGS=cppflags,
             LIBPATH=libpaths+self._env.get('LIBPATH', []),
             LIBS=libs+self._env.get('LIBS', [])
         )
+        if pch_builder is not None:
+            self._env.Depends(object_builder, pch_builder)
         # Return the builder instance.
         return object_builder
 
+    def _CreatePGOTarget(self):
+        if self._builders['pgo'] is not None:
+            return self._builders['pgo']
+        target = self._env.Dir('%s-pgo' % self.name)
+        # Create an instance of the RunPGO() builder.
+        pgo_builder = self._env.RunPGO(target, [], PGO_PROJECT=self.name,
+                                       PGO_TRAINING=self._pgo_training)
+        # The profile is checked by the builder.
+        self._env.AlwaysBuild(pgo_builder)
+        # Create the alias.
+        name = '%s:pgo' % self.name
+        msg = 'Build %s optimized with the profile of its tests' % self.name
+        self._env.Alias(name, [pgo_builder], msg)
+        self._builders['pgo'] = pgo_builder
+        return pgo_builder
+
+    def _CreateProfileTarget(self, project):
+        if self._builders['profile'] is not None:
+            return self._builders['profile']
+        target = self._env.Dir('%s-profile' % project)
+        # Create an instance of the RunProfile() builder.
+        profile_builder = self._env.RunProfile(target, [], PROFILE_PROJECT=project,
+                                               PROFILE_TRAINING=self._pgo_training)
+        # The workload runs each time.
+        self._env.AlwaysBuild(profile_builder)
+        # Create the alias.
+        name = '%s:profile' % project
+        msg = 'Profile %s with gprof or perf' % project
+        self._env.Alias(name, [profile_builder], msg)
+        self._builders['profile'] = profile_builder
+        return profile_builder
+
+    def _CreatePrecompiledHeader(self):
+        """
+            Returns the builder of the precompiled header of the component,
+            or None if it has no precompiled header. The header is compiled
+            with the environment of the component, so a change of its flags
+            (like those for coverage or ASan) compiles it again.
+        """
+        if self._pch is None:
+            return None
+        if self._pch_builder is None:
+            self._pch_builder = self._env.PrecompiledHeader(
+                self._pch.abspath + '.gch',
+                self._pch,
+                CPPPATH=self.GetIncludePaths()+self._env.get('CPPPATH',[])
+            )
+        return self._pch_builder
+
 
 class StaticLibraryComponent(ObjectComponent):
     """
@@ -1201,6 +1260,7 @@ class StaticLibraryComponent(ObjectComponent):
         slib_builder = self._CreateStaticLibraryBuilder(target)
         # Create an installer builders.
         installer = self._CreateInstallerBuilder([slib_builder])
+        self._CreatePGOTarget()
         # Create jenkins output
         self._CreateJenkinsTarget(installer)
         # Create the group aliases.
@@ -1255,6 +1315,7 @@ class DynamicLibraryComponent(ObjectComponent):
         # Create the installer builder.
         installer = self._CreateInstallerBuilder([dlib_builder])
         self._SetTargets(installer)
+        self._CreatePGOTarget()
         # Create jenkins output
         self._CreateJenkinsTarget(installer)
         self._builders['install'] = installer
@@ -1272,7 +1333,7 @@ class DynamicLibraryComponent(ObjectComponent):
         # Create an instance of the SharedLibrary() builder.
         dlib_builder = self._env.SharedLibrary(
             target,
-            self.GetSourcesFiles(),
+            self._GetCompiledFiles(),
             CPPPATH=includes+self._env.get('CPPPATH',[]),
             LIBPATH=libpaths+self._env.get('LIBPATH', []),
             LIBS=libs+self._env.get('LIBS', [])
@@ -1311,6 +1372,8 @@ class ProgramComponent(ObjectComponent):
         # Create an instance of the Install() builder.
         installer = self._CreateInstallerBuilder([program_builder])
         self._SetTargets(installer)
+        self._CreatePGOTarget()
+        self._CreateProfileTarget(self.name)
         # Create jenkins output
         self._CreateJenkinsTarget(program_builder)
         # Create the group aliases.
@@ -1341,8 +1404,8 @@ class ProgramComponent(ObjectComponent):
             # Only do this if the project that the tests depend is a Program.
             if isinstance(self_comp, ProgramComponent):
                 # Suppress the main from the Program to use the main from the tests.
-                # Set the flag only if the target :test was invoked.
-                if flags['test']:
+                # Set the flag only if the target :test (or :bench) was invoked.
+                if flags['test'] or flags['bench']:
                     self_comp._env.Append(CXXFLAGS='-Dmain=principalmain')
                     sources.extend(self_comp.GetObjectsFiles())
         # Create an instance of the Program() builder.
@@ -1408,6 +1471,10 @@ class UnitTestComponent(ProgramComponent):
         self._CreateJenkinsTarget(program_builder, target=run_test_target,)
         run_rtc_builder = self._CreateReadyToCommitTarget(run_test_target, program_builder)
         run_test_builder = self._CreateTestTarget(run_test_target, program_builder)
+        # The programs create their own target, it runs their tests.
+        project_component = self._component_graph.get(self._project_name)
+        if not isinstance(project_component, ProgramComponent):
+            self._CreateProfileTarget(self._project_name)
         self._builders['install'] = run_test_builder
         # Create alias for 'all:test'.
         self._env.Alias('all:test', run_test_builder, "Run tests in all projects")
@@ -1549,6 +1616,12 @@ class UnitTestComponent(ProgramComponent):
             self._env.Depends(rtc_builder, cppcheck)
             self._env.Depends(rtc_builder, run_test)
             self._env.Depends(rtc_builder, valgrind)
+            # The comparison of the benchmarks is optional.
+            bench_component = self._component_graph.get('%s@bench' % self._project_name)
+            if self._env.GetOption('rtc_bench') and bench_component is not None:
+                bench_component.Process()
+                bench_compare = bench_component._CreateBenchmarkCompareTarget()
+                self._env.Depends(rtc_builder, bench_compare)
         # Create the alias.
         self._env.Alias(
             '%s:ready-to-commit' % self._project_name,
@@ -1594,6 +1667,91 @@ class UnitTestComponent(ProgramComponent):
         self._env.Append(VALGRIND_OPTIONS='--vgdb-error=0')
         return mocko_builder
 
+
+class BenchmarkComponent(ProgramComponent):
+    """
+        This class represents a benchmark component (Google Benchmark).
+    """
+
+    #
+    # Private attributes.
+    #
+    # The name of the project from which the benchmark component depends.
+    _project_name = None
+
+    #
+    # Special methods.
+    #
+
+    def __init__(self, graph, env, name, dir, deps, inc, src, als=None):
+        super(BenchmarkComponent, self).__init__(graph, env, name, dir, deps, inc, src, als)
+        self._project_name = name.split('@')[0]
+
+    #
+    # Public methods.
+    #
+
+    def Process(self):
+        # Check if the component was already processed.
+        if self._builders['install'] is not None:
+            return self._builders['install']
+        # Create the target.
+        target = os.path.join(self._dir.abspath, '%s_bench' % self._project_name)
+        # Create the builder that creates the benchmark executable.
+        program_builder = self._CreateProgramBuilder(target)
+        # Create alias for aliasGroups.
+        self._CreateGroupAliases()
+        run_bench_builder = self._CreateBenchmarkTarget(program_builder)
+        self._CreateBenchmarkCompareTarget()
+        self._builders['install'] = run_bench_builder
+        # Create the alias for 'all:bench'.
+        self._env.Alias('all:bench', run_bench_builder, 'Run benchmarks in all projects')
+        return run_bench_builder
+
+    #
+    # Private methods.
+    #
+
+    def _CreateBenchmarkTarget(self, program_builder):
+        if self._builders['bench'] is not None:
+            return self._builders['bench']
+        if variants.GetVariantName() == benchmarks.VARIANT:
+            # This is the optimized build of the benchmarks, they are run by
+            # the build that started it.
+            run_bench_builder = program_builder
+        else:
+            target = self._env.Dir('%s-bench' % self._project_name)
+            # Create an instance of the RunBenchmark() builder.
+            run_bench_builder = self._env.RunBenchmark(target, [],
+                                                       BENCH_PROJECT=self._project_name)
+            # The benchmarks are measured each time.
+            self._env.AlwaysBuild(run_bench_builder)
+        # Create the alias.
+        name = '%s:bench' % self._project_name
+        msg = 'Run benchmarks for %s' % self._project_name
+        self._env.Alias(name, [run_bench_builder], msg)
+        self._builders['bench'] = run_bench_builder
+        return run_bench_builder
+
+    def _CreateBenchmarkCompareTarget(self):
+        if self._builders['bench-compare'] is not None:
+            return self._builders['bench-compare']
+        if variants.GetVariantName() == benchmarks.VARIANT:
+            return None
+        target = self._env.Dir('%s-bench-compare' % self._project_name)
+        # Create an instance of the RunBenchmarkCompare() builder.
+        compare_builder = self._env.RunBenchmarkCompare(target, [],
+                                                        BENCH_PROJECT=self._project_name)
+        # The benchmarks are measured each time.
+        self._env.AlwaysBuild(compare_builder)
+        # Create the alias.
+        name = '%s:bench-compare' % self._project_name
+        msg = 'Compare the benchmarks of %s with their baseline' % self._project_name
+        self._env.Alias(name, [compare_builder], msg)
+        self._builders['bench-compare'] = compare_builder
+        return compare_builder
+
+
 class NameCheck():
 
     """
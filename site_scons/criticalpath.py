@@ -0,0 +1,212 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module analyzes how parallel the build of the component graph can
+    be, from the durations of the actions recorded by --trace.
+
+    Each action of the trace is assigned to the component that owns its
+    target. A component is modeled as its compilations, which can run at the
+    same time, followed by its other actions (archive, link, install, test),
+    which run one after the other; and it can start only when all its
+    dependencies finished. With that model the report gives:
+
+      - the total work, and the critical path (the longest chain of
+        dependent components), whose ratio is the maximum speedup that any
+        number of jobs can get.
+      - the components that block the most: those with the longest own
+        time multiplied by the number of components that wait for them.
+"""
+
+
+import json
+import os
+
+from core_components import ExternalComponent
+from termcolor import Cformat
+
+
+# The target that writes the report.
+CRITICAL_PATH_TARGET = 'all:critical-path'
+# The builders whose actions of a component can run at the same time.
+PARALLEL_BUILDERS = ['Object', 'SharedObject', 'StaticObject']
+# The number of blocking components listed in the report.
+REPORT_BLOCKERS = 10
+
+
+def Analyze(env, graph, tasks):
+    """
+        Description:
+            Computes the critical path of the component graph.
+        Arguments:
+            env    -  The SCons environment.
+            graph  -  The graph of components.
+            tasks  -  A list with the actions of a trace (see
+                      buildtrace.GetTaskEvents()).
+        Exceptions:
+            CircularDependencyError.
+        Return:
+            A dictionary with the results (see WriteReport()).
+    """
+    # The actions of each component.
+    owners = _GetOwnerFinder(env, graph)
+    compile_times = {}
+    serial_times = {}
+    unowned = 0.0
+    for task in tasks:
+        owner = owners(task['targets'])
+        if owner is None:
+            unowned += task['duration']
+        elif task['builder'] in PARALLEL_BUILDERS:
+            compile_times.setdefault(owner, []).append(task['duration'])
+        else:
+            serial_times[owner] = serial_times.get(owner, 0.0) + task['duration']
+    # The time of each component alone (with unlimited jobs) and its work.
+    span = {}
+    work = {}
+    for name in graph.keys():
+        compiles = compile_times.get(name, [])
+        span[name] = max(compiles or [0.0]) + serial_times.get(name, 0.0)
+        work[name] = sum(compiles) + serial_times.get(name, 0.0)
+    # The earliest finish time of each component, in topological order.
+    finish = {}
+    previous = {}
+    dependents = dict((name, 0) for name in graph.keys())
+    for name in graph.engine.GetTopologicalOrder():
+        deps = [d for d in graph.get(name)._dependencies if d in finish]
+        start = 0.0
+        previous[name] = None
+        for dep in deps:
+            if finish[dep] > start:
+                (start, previous[name]) = (finish[dep], dep)
+        finish[name] = start + span[name]
+        for dep in graph.engine.GetDependencies(name):
+            if dep in dependents:
+                dependents[dep] += 1
+    # Follow the chain back from the component that finishes last.
+    path = []
+    name = max(finish, key=finish.get) if finish else None
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    path.reverse()
+    total_work = sum(work.values()) + unowned
+    critical_time = finish[path[-1]] if path else 0.0
+    blockers = sorted((name for name in graph.keys() if span[name] > 0 and dependents[name]),
+                      key=lambda name: -span[name] * dependents[name])[:REPORT_BLOCKERS]
+    return {
+        'total_work': total_work,
+        'critical_time': critical_time,
+        'max_speedup': total_work / critical_time if critical_time else 0.0,
+        'unowned_work': unowned,
+        'critical_path': [{'component': name, 'time': span[name], 'finish': finish[name]}
+                          for name in path],
+        'blockers': [{'component': name, 'time': span[name], 'dependents': dependents[name],
+                      'critical': name in path} for name in blockers],
+    }
+
+
+def WriteReport(env, result, target):
+    """
+        Description:
+            Prints the report of Analyze() and writes it as text and JSON.
+        Arguments:
+            env     -  The SCons environment.
+            result  -  The dictionary returned by Analyze().
+            target  -  The path to the text report, the JSON report is
+                       written next to it.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    lines = [
+        'Total work:        %10.2f s' % result['total_work'],
+        'Critical path:     %10.2f s' % result['critical_time'],
+        'Maximum speedup:   %10.2f x  (with unlimited jobs, currently -j%d)' %
+        (result['max_speedup'], env.GetOption('num_jobs') or 1),
+        'Work not assigned to a component: %.2f s' % result['unowned_work'],
+        '',
+        'Critical path (the components that must be built one after the other):',
+        '',
+        '  %-40s %10s %10s' % ('component', 'own (s)', 'finish (s)'),
+    ]
+    for step in result['critical_path']:
+        lines.append('  %-40s %10.2f %10.2f' % (step['component'], step['time'], step['finish']))
+    lines += [
+        '',
+        'Components that block the most (own time x components that wait for them):',
+        '',
+        '  %-40s %10s %10s %8s' % ('component', 'own (s)', 'waiting', 'critical'),
+    ]
+    for blocker in result['blockers']:
+        lines.append('  %-40s %10.2f %10d %8s' % (blocker['component'], blocker['time'],
+                                                  blocker['dependents'],
+                                                  'yes' if blocker['critical'] else ''))
+    text = '\n'.join(lines) + '\n'
+    directory = os.path.dirname(target)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(target, 'w') as f:
+        f.write(text)
+    json_target = os.path.splitext(target)[0] + '.json'
+    with open(json_target, 'w') as f:
+        json.dump(result, f, indent=2)
+    print Cformat('\n=== CRITICAL PATH ===\n', 'green')
+    print text
+    print 'Report written to %s and %s' % (target, json_target)
+
+
+def _GetOwnerFinder(env, graph):
+    """
+        Returns a function that finds the component that owns a list of
+        targets: the component with the deepest directory (in the build or
+        source tree) that contains a target. For the targets outside those
+        directories (like the installed files) the sources of the target are
+        used.
+    """
+    dirs = {}
+    for component in graph.values():
+        if not isinstance(component, ExternalComponent) and component._dir is not None:
+            for path in [component._dir.abspath, component._dir.srcnode().abspath]:
+                dirs.setdefault(path, component.name)
+
+    def FindInDirs(path):
+        directory = os.path.dirname(path)
+        while directory not in dirs and os.path.dirname(directory) != directory:
+            directory = os.path.dirname(directory)
+        return dirs.get(directory)
+
+    def FindOwner(targets, depth=2):
+        for path in targets:
+            owner = FindInDirs(path)
+            if owner is not None:
+                return owner
+        if depth:
+            for path in targets:
+                sources = [s.get_abspath() for s in env.Entry(path).sources]
+                owner = FindOwner(sources, depth - 1) if sources else None
+                if owner is not None:
+                    return owner
+        return None
+
+    return FindOwner
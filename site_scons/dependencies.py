@@ -25,10 +25,20 @@
 """
 
 
+import cPickle
+import glob
+import hashlib
 import os
 import os.path
 import platform
+import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+from distutils.spawn import find_executable
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from xml.dom import minidom
 
 from SCons.Script import Builder
@@ -63,6 +73,20 @@ CMD_TEMPLATE_HLIB = 'gcc -E _chklib_.c'
 TMP_DIR = '_tmp_downloads'
 # A shortcut for subprocess.PIPE
 PIPE = subprocess.PIPE
+# The name of the file (inside the BUILD_DIR) where the results of the
+# install checks are cached.
+INSTALL_CHECKS_FILE = 'installchecks.pickle'
+# Bump this number every time the format of the install checks cache changes.
+INSTALL_CHECKS_VERSION = 2
+# The directories where the compiler looks for libraries and headers. A
+# change in their mtimes invalidates the cached install checks.
+LIB_DIRS = ['/lib', '/lib64', '/lib/*-linux-gnu', '/usr/lib', '/usr/lib64',
+            '/usr/lib/*-linux-gnu', '/usr/local/lib']
+INCLUDE_DIRS = ['/usr/include', '/usr/include/*-linux-gnu', '/usr/local/include']
+# The environment variables that change where the libraries and headers
+# are looked for.
+LIB_VARS = ['LIBRARY_PATH', 'LD_LIBRARY_PATH']
+INCLUDE_VARS = ['CPATH', 'C_INCLUDE_PATH']
 
 
 def init(env):
@@ -93,11 +117,82 @@ def init(env):
     _CreateExternalDependenciesTargets(env)
     # Puts a public function within the environment.
     env.CheckoutDependencyNow = CheckoutDependencyNow
+    env.CheckoutDependenciesNow = CheckoutDependenciesNow
     env.GetComponentDeps = GetComponentDeps
+    env.IsProjectDependency = IsProjectDependency
+
+
+class _Output(object):
+    """
+        This class runs the commands of a dependency and prints its messages
+        directly in the terminal.
+    """
+
+    def Call(self, cmd, shell=False):
+        return subprocess.call(cmd, shell=shell)
+
+    def MakeDirs(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def Print(self, msg, color):
+        Cprint(msg, color)
+
+
+class _PrefixedOutput(_Output):
+    """
+        This class runs the commands of a dependency capturing their output,
+        and prints it line by line with the name of the dependency as prefix,
+        so the output of concurrent checkouts can be told apart.
+    """
+
+    # A lock shared by all the instances, so the lines are not mixed.
+    _lock = threading.Lock()
+
+    def __init__(self, name=None):
+        self._prefix = '[%s] ' % name if name else ''
+
+    def Call(self, cmd, shell=False):
+        process = subprocess.Popen(cmd, shell=shell, stdout=PIPE, stderr=subprocess.STDOUT)
+        for line in iter(process.stdout.readline, ''):
+            self._Write(line)
+        return process.wait()
+
+    def Print(self, msg, color):
+        self._Write(Cformat(msg, color) + '\n')
+
+    def _Write(self, line):
+        with self._lock:
+            sys.stdout.write(self._prefix + line)
+            sys.stdout.flush()
+
+
+class _DryRunOutput(_PrefixedOutput):
+    """
+        This class prints the commands of a dependency instead of running
+        them.
+    """
+
+    def Call(self, cmd, shell=False):
+        if not isinstance(cmd, basestring):
+            cmd = ' '.join(cmd)
+        self._Write('[dry-run] %s\n' % cmd)
+        return 0
+
+    def MakeDirs(self, path):
+        pass
+
+
+# The output used when the dependencies are checked out one at a time.
+DIRECT_OUTPUT = _Output()
 
 
 class Dependencies(object):
 
+    # True if Fetch() can run at the same time than the fetch of other
+    # dependencies.
+    parallel_fetch = False
+
     def __init__(self, name, target, node, env):
         self.env = env
         self.name = name
@@ -147,12 +242,27 @@ class Dependencies(object):
         else:
             self.create_ext_lib_component = ''
 
-    def AfterCheckout(self):
+    def Fetch(self, output=DIRECT_OUTPUT):
         """
             Description:
-                This method download the component/project and install it.
+                This method downloads the component/project, without running
+                the post-checkout commands.
             Arguments:
+                output  -  The _Output used to run the commands.
+            Exceptions:
                 None.
+            Return:
+                0 if the component was downloaded.
+                An error message otherwise.
+        """
+        return 0
+
+    def AfterCheckout(self, output=DIRECT_OUTPUT):
+        """
+            Description:
+                This method download the component/project and install it.
+            Arguments:
+                output  -  The _Output used to run the commands.
             Exceptions:
                 None.
             Return:
@@ -162,8 +272,8 @@ class Dependencies(object):
         if len(self.executeAfter) > 0:
             commands = _GetExecutableCommands(self.env, self.executeAfter)
             for cmd in commands:
-                Cprint('[info] execute post-checkout command: %s' % cmd, 'purple')
-                rc = subprocess.call(cmd, shell=True)
+                output.Print('[info] execute post-checkout command: %s' % cmd, 'purple')
+                rc = output.Call(cmd, shell=True)
                 if rc != 0:
                     return Cformat('[error] failed to execute post-checkout command: %s, error: %s' % (cmd, rc),
                                    'red')
@@ -204,6 +314,8 @@ class Dependencies(object):
 
 class HG(Dependencies):
 
+    parallel_fetch = True
+
     def __init__(self, name, target, node, env):
         super(HG, self).__init__(name, target, node, env)
         if self.type == 'component':
@@ -211,14 +323,19 @@ class HG(Dependencies):
             self.target = self.env.Dir(os.path.join(TMP_DIR, name)).abspath
 
     def Checkout(self):
-        if not os.path.exists(self.target):
-            os.makedirs(self.target)
-        Cprint('[hg] Checkout %s => %s' % (self.url, self.target), 'purple')
-        rc = subprocess.call(['hg', 'clone', self.url, self.target])
+        rc = self.Fetch()
+        if rc != 0:
+            return rc
+        return self.AfterCheckout()
+
+    def Fetch(self, output=DIRECT_OUTPUT):
+        output.MakeDirs(self.target)
+        output.Print('[hg] Checkout %s => %s' % (self.url, self.target), 'purple')
+        rc = output.Call(['hg', 'clone', self.url, self.target])
         if rc != 0:
             return Cformat('[error] hg failed to Checkout target %s from %s, error: %s' % (self.target, self.url, rc),
                            'red')
-        return self.AfterCheckout()
+        return 0
 
     def Update(self):
         Cprint('[hg] updating %s => %s' % (self.url, self.target), 'purple')
@@ -231,6 +348,8 @@ class HG(Dependencies):
 
 class SVN(Dependencies):
 
+    parallel_fetch = True
+
     def __init__(self, name, target, node, env):
         super(SVN, self).__init__(name, target, node, env)
         if self.type == 'component':
@@ -238,11 +357,16 @@ class SVN(Dependencies):
             self.target = self.env.Dir(os.path.join(TMP_DIR, name)).abspath
 
     def Checkout(self):
-        if not os.path.exists(self.target):
-            os.makedirs(self.target)
-        Cprint('[svn] Checkout %s => %s' % (self.url, self.target), 'purple')
+        rc = self.Fetch()
+        if rc != 0:
+            return rc
+        return self.AfterCheckout()
+
+    def Fetch(self, output=DIRECT_OUTPUT):
+        output.MakeDirs(self.target)
+        output.Print('[svn] Checkout %s => %s' % (self.url, self.target), 'purple')
         cmd = ['svn', 'checkout'] + (['--username', self.username] if self.username else []) + [self.url, self.target]
-        rc = subprocess.call(cmd)
+        rc = output.Call(cmd)
         if rc != 0:
             
             return Cformat(
@@ -250,7 +374,7 @@ class SVN(Dependencies):
                 % (self.target, self.url, rc),
                 'red'
             )
-        return self.AfterCheckout()
+        return 0
 
     def Update(self):
         Cprint('[svn] updating %s => %s' % (self.url, self.target), 'purple')
@@ -267,6 +391,8 @@ class SVN(Dependencies):
 
 class WGET(Dependencies):
 
+    parallel_fetch = True
+
     def __init__(self, name, target, node, env):
         super(WGET, self).__init__(name, target, node, env)
         if self.type == 'component':
@@ -274,17 +400,22 @@ class WGET(Dependencies):
             self.target = self.env.Dir(os.path.join(TMP_DIR, name)).abspath
 
     def Checkout(self):
-        if not os.path.exists(self.target):
-            os.makedirs(self.target)
-        Cprint('[wget] downloading %s => %s' % (self.url, self.target), 'purple')
-        rc = subprocess.call(['wget', self.url, '-P', self.target])
+        rc = self.Fetch()
+        if rc != 0:
+            return rc
+        return self.AfterCheckout()
+
+    def Fetch(self, output=DIRECT_OUTPUT):
+        output.MakeDirs(self.target)
+        output.Print('[wget] downloading %s => %s' % (self.url, self.target), 'purple')
+        rc = output.Call(['wget', self.url, '-P', self.target])
         if rc != 0:
             return Cformat(
                 '[error] wget failed to download target %s from %s, error: %s'
                 % (self.target, self.url, rc),
                 'red'
             )
-        return self.AfterCheckout()
+        return 0
 
     def Update(self):
         # this is not supported, should be? should we download the version
@@ -294,60 +425,74 @@ class WGET(Dependencies):
         return 0
 
 
-class PACKER(Dependencies):
+class PackageDependency(Dependencies):
+    """
+        This class represents a dependency installed by the package manager
+        of the system. The packages of several dependencies can be installed
+        with a single command.
+    """
+
+    # The name of the package manager.
+    manager = None
+    # The command that installs the packages, '%s' is replaced by the list
+    # of packages.
+    install_command = None
 
     def Checkout(self):
-        Cprint('[packer] installing %s ' % self.name, 'purple')
-        rc = subprocess.call('sudo packer -S %s' % self.target, shell=True)
+        rc = self.InstallPackages([self.target])
         if rc != 0:
-            return Cprint(
-                '[error] pacman failed to installing %s, error: %s'
-                % (self.target, rc),
-                'red'
-            )
+            return rc
         return self.AfterCheckout()
 
-
-class PACMAN(Dependencies):
-
-    def Checkout(self):
-        Cprint('[pacman] installing %s ' % self.name, 'purple')
-        rc = subprocess.call('sudo pacman -S %s' % self.target, shell=True)
+    @classmethod
+    def InstallPackages(cls, packages, output=DIRECT_OUTPUT):
+        """
+            Description:
+                This method installs some packages in one transaction of the
+                package manager.
+            Arguments:
+                packages  -  A list with the names of the packages.
+                output  -  The _Output used to run the command.
+            Exceptions:
+                None.
+            Return:
+                0 if the packages were installed.
+                An error message otherwise.
+        """
+        packages = ' '.join(packages)
+        output.Print('[%s] installing %s ' % (cls.manager, packages), 'purple')
+        rc = output.Call(cls.install_command % packages, shell=True)
         if rc != 0:
-            return Cprint(
-                '[error] pacman failed to installing %s, error: %s'
-                % (self.target, rc),
+            return Cformat(
+                '[error] %s failed to installing %s, error: %s'
+                % (cls.manager, packages, rc),
                 'red'
             )
-        return self.AfterCheckout()
+        return 0
 
 
-class APT_GET(Dependencies):
+class PACKER(PackageDependency):
 
-    def Checkout(self):
-        Cprint('[apt-get] installing %s ' % self.name, 'purple')
-        rc = subprocess.call('sudo apt-get install -y %s' % self.target, shell=True)
-        if rc != 0:
-            return Cprint(
-                '[error] apt-get failed to installing %s, error: %s'
-                % (self.target, rc),
-                'red'
-            )
-        return self.AfterCheckout()
+    manager = 'packer'
+    install_command = 'sudo packer -S %s'
 
 
-class APTITUDE(Dependencies):
+class PACMAN(PackageDependency):
 
-    def Checkout(self):
-        Cprint('[aptitude] installing %s ' % self.name, 'purple')
-        rc = subprocess.call('sudo aptitude install %s' % self.target, shell=True)
-        if rc != 0:
-            return Cprint(
-                '[error] aptitude failed to installing %s, error: %s'
-                % (self.target, rc),
-                'red'
-            )
-        return self.AfterCheckout()
+    manager = 'pacman'
+    install_command = 'sudo pacman -S %s'
+
+
+class APT_GET(PackageDependency):
+
+    manager = 'apt-get'
+    install_command = 'sudo apt-get install -y %s'
+
+
+class APTITUDE(PackageDependency):
+
+    manager = 'aptitude'
+    install_command = 'sudo aptitude install %s'
 
 
 def _CreateProjectsDependenciesTargets(env):
@@ -468,8 +613,9 @@ def _CreateExternalDependenciesTargets(env):
             if not dep is None:
                 external_dependencies[componentName] = dep
     # Check if each component is already installed.
+    installed = _CheckInstalled(env, extDepsFile)
     for component in external_dependencies.keys():
-        if external_dependencies[component].CheckInstall():
+        if installed[component]:
             # If it's installed we have to add the component to the graph by
             # adding a call to 'CreateExternalLibraryComponent()'.
             pcall = external_dependencies[component].create_ext_lib_component
@@ -477,6 +623,165 @@ def _CreateExternalDependenciesTargets(env):
             env.ExternalDependenciesCreateComponentsDict[component] = pcall
 
 
+def _CheckInstalled(env, extDepsFile):
+    """
+        Description:
+            This function checks which external dependencies are installed.
+            The dependencies found installed are cached in the BUILD_DIR, and
+            their check only runs again if the dependency, the xml file, the
+            compiler or the directories where it looks for things changed, or
+            if the --recheck-deps flag is given. The missing dependencies are
+            always checked again: the cache can not see everything a checker
+            looks at (a file, a package) and fbuild may install them. The
+            checks that must run are run concurrently, as many as CPUs at
+            once.
+        Arguments:
+            env  -  An SCons environment.
+            extDepsFile  -  The path to the external_dependencies.xml file.
+        Exceptions:
+            None.
+        Return:
+            A dictionary that tells if each dependency is installed.
+    """
+    cache = _InstallChecksCache(env, extDepsFile)
+    result = {}
+    pending = []
+    for (name, dep) in external_dependencies.iteritems():
+        installed = cache.Get(dep)
+        if installed is None:
+            pending.append(dep)
+        else:
+            result[name] = installed
+    if pending:
+        # SCons takes -j1 when it is not given, the probes use all the CPUs
+        # whatever -j is.
+        pool = ThreadPool(min(cpu_count(), len(pending)))
+        try:
+            checks = pool.map(_RunInstallCheck, pending)
+        finally:
+            pool.close()
+            pool.join()
+        for (dep, installed) in zip(pending, checks):
+            cache.Set(dep, installed)
+            result[dep.name] = installed
+        cache.Save()
+    return result
+
+
+def _RunInstallCheck(dep):
+    """
+        This function runs the install check of a dependency in a thread of
+        the pool.
+    """
+    return bool(dep.CheckInstall())
+
+
+class _InstallChecksCache(object):
+    """
+        This class stores the external dependencies found installed by the
+        install checks between runs.
+    """
+
+    def __init__(self, env, extDepsFile):
+        self._path = os.path.join(env['BUILD_DIR'], INSTALL_CHECKS_FILE)
+        with open(extDepsFile, 'rb') as f:
+            self._key = (INSTALL_CHECKS_VERSION, hashlib.md5(f.read()).hexdigest())
+        # A dictionary (kind of check -> fingerprint).
+        self._fingerprints = {}
+        # A dictionary (name -> (key, result)).
+        self._results = {}
+        if not env.GetOption('recheck_deps'):
+            try:
+                with open(self._path, 'rb') as f:
+                    data = cPickle.load(f)
+                if data[0] == self._key:
+                    self._results = data[1]
+            except Exception:
+                pass
+
+    def Get(self, dep):
+        """
+            This method returns the cached result of the install check of a
+            dependency, or None if it must be checked again.
+        """
+        if dep.name in self._results:
+            (key, result) = self._results[dep.name]
+            if key == self._GetKey(dep):
+                return result
+        return None
+
+    def Set(self, dep, result):
+        # Only the installed dependencies are kept: a dependency missing now
+        # may be installed before the next run, by fbuild or by hand.
+        if result:
+            self._results[dep.name] = (self._GetKey(dep), result)
+        else:
+            self._results.pop(dep.name, None)
+
+    def Save(self):
+        directory = os.path.dirname(self._path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # Write to a temporal file and rename it, so an interrupted run does
+        # not leave a broken cache.
+        tmp = '%s.%d' % (self._path, os.getpid())
+        with open(tmp, 'wb') as f:
+            cPickle.dump((self._key, self._results), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self._path)
+
+    def _GetKey(self, dep):
+        """
+            This method returns what a check depends on: the check itself
+            and the state of the system for its kind of check.
+        """
+        if dep.inatllChecker:
+            kind = 'checker'
+        else:
+            kind = dep.component_type
+        return (dep.component_type, dep.component_check, dep.inatllChecker,
+                self._GetFingerprint(kind))
+
+    def _GetFingerprint(self, kind):
+        """
+            This method returns the state of the things a kind of check
+            depends on: the compiler, the directories where the libraries,
+            the headers or the programs are looked for, and the environment
+            variables that change them.
+        """
+        if kind not in self._fingerprints:
+            gcc = find_executable('gcc')
+            paths = os.environ.get('PATH', '').split(os.pathsep)
+            if kind == 'LIB':
+                fingerprint = _GetPathsState([gcc] + LIB_DIRS, LIB_VARS)
+            elif kind == 'HLIB':
+                fingerprint = _GetPathsState([gcc] + INCLUDE_DIRS, INCLUDE_VARS)
+            elif kind == 'PRO':
+                fingerprint = _GetPathsState(paths, ['PATH'])
+            else:
+                fingerprint = _GetPathsState([gcc] + LIB_DIRS + INCLUDE_DIRS + paths,
+                                             LIB_VARS + INCLUDE_VARS + ['PATH'])
+            self._fingerprints[kind] = fingerprint
+        return self._fingerprints[kind]
+
+
+def _GetPathsState(patterns, variables):
+    """
+        This function returns the mtimes of some paths (which can be glob
+        patterns) and the values of some environment variables.
+    """
+    mtimes = []
+    for pattern in patterns:
+        if not pattern:
+            continue
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                mtimes.append((path, os.stat(path).st_mtime))
+            except OSError:
+                mtimes.append((path, None))
+    values = [(var, os.environ.get(var)) for var in variables]
+    return (tuple(mtimes), tuple(values))
+
+
 def _CreateDependency(env, name, type, node, target=None, dep_type=DEP_PROJECT):
     if target is None:
         target = os.path.join(env['WS_DIR'], name)
@@ -515,19 +820,24 @@ def _CheckHLibInstall(include):
             True if the library exists.
             False otherwise.
     """
-    # Create the C file
-    f = open(C_TEMPLATE_FILE + '.c', 'w')
-    f.write(C_TEMPLATE_CODE % ('#include <%s>\n' % include))
-    f.close()
-    # Check if the library except
-    rc = subprocess.call(
-        CMD_TEMPLATE_HLIB,
-        shell=True,
-        stdout=PIPE,
-        stderr=PIPE
-    )
-    # Delete the files.
-    os.remove(C_TEMPLATE_FILE + '.c')
+    # Create the C file in its own directory, so concurrent checks do not
+    # collide.
+    tmp = tempfile.mkdtemp(prefix=C_TEMPLATE_FILE)
+    try:
+        f = open(os.path.join(tmp, C_TEMPLATE_FILE + '.c'), 'w')
+        f.write(C_TEMPLATE_CODE % ('#include <%s>\n' % include))
+        f.close()
+        # Check if the library except
+        rc = subprocess.call(
+            CMD_TEMPLATE_HLIB,
+            shell=True,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=tmp
+        )
+    finally:
+        # Delete the files.
+        shutil.rmtree(tmp, True)
     return rc == 0
 
 
@@ -545,18 +855,20 @@ def _CheckLibInstall(lib):
             True if the library exists.
             False otherwise.
     """
-    # Create the C file
-    f = open(C_TEMPLATE_FILE + '.c', 'w')
-    f.write(C_TEMPLATE_CODE % '')
-    f.close()
-    # Create the command line
-    cmd = CMD_TEMPLATE_LIB % lib
-    # Check if the library except
-    rc = subprocess.call(cmd, shell=True, stdout=PIPE, stderr=PIPE)
-    # Delete the files.
-    os.remove(C_TEMPLATE_FILE + '.c')
-    if rc == 0:
-        os.remove(C_TEMPLATE_FILE)
+    # Create the C file in its own directory, so concurrent checks do not
+    # collide.
+    tmp = tempfile.mkdtemp(prefix=C_TEMPLATE_FILE)
+    try:
+        f = open(os.path.join(tmp, C_TEMPLATE_FILE + '.c'), 'w')
+        f.write(C_TEMPLATE_CODE % '')
+        f.close()
+        # Create the command line
+        cmd = CMD_TEMPLATE_LIB % lib
+        # Check if the library except
+        rc = subprocess.call(cmd, shell=True, stdout=PIPE, stderr=PIPE, cwd=tmp)
+    finally:
+        # Delete the files.
+        shutil.rmtree(tmp, True)
     return rc == 0
 
 
@@ -645,22 +957,161 @@ def CheckoutDependency(env, source, target):
 
 
 def CheckoutDependencyNow(depname, env):
+    return depname in CheckoutDependenciesNow([depname], env)
+
+
+def CheckoutDependenciesNow(depnames, env):
+    """
+        Description:
+            This function downloads and installs a group of dependencies.
+            The downloads of the repositories (hg, svn, wget) run at the same
+            time in a pool of --checkout-jobs threads, with the name of the
+            dependency as prefix of each output line. After that, the system
+            packages and the post-checkout commands are run one at a time,
+            every dependency after its own dependencies. The failures are
+            reported together at the end.
+        Arguments:
+            depnames  -  A list with the names of the dependencies.
+            env  -  An SCons environment.
+        Exceptions:
+            None.
+        Return:
+            A list with the names of the dependencies installed.
+    """
+    deps = [_GetDependency(name) for name in depnames]
+    deps = [dep for dep in deps if dep is not None]
+    if not deps:
+        return []
+    dryRun = env.GetOption('install_dry_run')
+    if dryRun:
+        Output = _DryRunOutput
+        env.cwarn('[dry-run] the dependencies %s would be installed' %
+                  ', '.join(dep.name for dep in deps))
+    else:
+        Output = _PrefixedOutput
     # Crate a temporary directory for download external components.
     if not os.path.exists(TMP_DIR):
         os.makedirs(TMP_DIR)
-    if depname in external_dependencies.keys():
-        dep = external_dependencies.get(depname)
-    else:
-        dep = projects.get(depname)
-    if dep:
-        result = dep.Checkout() == 0
+    errors = {}
+    # Download the repositories concurrently.
+    fetches = [(dep, Output(dep.name)) for dep in deps if dep.parallel_fetch]
+    if fetches:
+        pool = ThreadPool(min(env.GetOption('checkout_jobs'), len(fetches)))
+        try:
+            for (dep, rc) in pool.map(_FetchDependency, fetches):
+                if rc != 0:
+                    errors[dep.name] = rc
+        finally:
+            pool.close()
+            pool.join()
+    # Install the system packages, one transaction for each manager.
+    managers = {}
+    for dep in deps:
+        if isinstance(dep, PackageDependency):
+            managers.setdefault(dep.manager, []).append(dep)
+    for manager in sorted(managers.keys()):
+        # The package managers may ask the user, so their output is not
+        # captured unless it is a dry run.
+        output = Output() if dryRun else DIRECT_OUTPUT
+        errors.update(_InstallPackages(managers[manager], output))
+    # Run the post-checkout commands in order.
+    installed = []
+    for dep in _SortByDependencies(deps):
+        if dep.name in errors:
+            continue
+        failed = [x for x in dep.component_deps if x in errors]
+        if failed:
+            errors[dep.name] = 'it depends on %s' % ', '.join(failed)
+            continue
+        if dep.parallel_fetch or isinstance(dep, PackageDependency):
+            rc = dep.AfterCheckout(Output(dep.name))
+        else:
+            rc = dep.Checkout()
+        if rc != 0:
+            errors[dep.name] = rc
+            continue
+        if dryRun:
+            continue
+        installed.append(dep.name)
         if dep.create_ext_lib_component:
             st = dep.create_ext_lib_component
-            env.ExternalDependenciesCreateComponentsDict[depname] = st
-    else:
-        result = False
+            env.ExternalDependenciesCreateComponentsDict[dep.name] = st
     # Remove the temporary directory.
     os.system('rm -rf %s' % TMP_DIR)
+    if errors:
+        env.cerror('[error] %d of %d dependencies could not be installed:' %
+                   (len(errors), len(deps)))
+        for dep in deps:
+            if dep.name in errors:
+                error = errors[dep.name]
+                env.cerror('  %s: %s' % (dep.name, error if error else 'failed'))
+    return installed
+
+
+def _GetDependency(name):
+    """
+        This function returns the dependency with the given name, either an
+        external dependency or a project, or None if it is unknown.
+    """
+    if name in external_dependencies.keys():
+        return external_dependencies.get(name)
+    else:
+        return projects.get(name)
+
+
+def _FetchDependency((dep, output)):
+    """
+        This function downloads a dependency in a thread of the pool. It
+        returns a tuple (dependency, result of Fetch()).
+    """
+    try:
+        return (dep, dep.Fetch(output))
+    except Exception, error:
+        return (dep, str(error))
+
+
+def _InstallPackages(deps, output):
+    """
+        This function installs the packages of some dependencies of the same
+        package manager with a single command. If it fails, the packages are
+        installed one by one to know which ones failed. It returns a
+        dictionary with the errors (name -> message).
+    """
+    manager = type(deps[0])
+    packages = utils.RemoveDuplicates([dep.target for dep in deps])
+    rc = manager.InstallPackages(packages, output)
+    if rc == 0:
+        return {}
+    if len(packages) == 1:
+        return dict((dep.name, rc) for dep in deps)
+    errors = {}
+    for package in packages:
+        rc = manager.InstallPackages([package], output)
+        if rc != 0:
+            errors.update((dep.name, rc) for dep in deps if dep.target == package)
+    return errors
+
+
+def _SortByDependencies(deps):
+    """
+        This function sorts a list of dependencies so that each one comes
+        after those it depends on, keeping the original order otherwise.
+    """
+    byName = dict((dep.name, dep) for dep in deps)
+    result = []
+    visited = set()
+
+    def Visit(dep):
+        if dep.name in visited:
+            return
+        visited.add(dep.name)
+        for name in dep.component_deps:
+            if name in byName:
+                Visit(byName[name])
+        result.append(dep)
+
+    for dep in deps:
+        Visit(dep)
     return result
 
 
@@ -673,6 +1124,22 @@ def UpdateDependency(env, source, target):
     return projects[dep].Update()
 
 
+def IsProjectDependency(name):
+    """
+        Description:
+            This function tells if a dependency is a project of the workspace
+            (projects.xml), whose SConscripts may define other components,
+            and not an external dependency.
+        Arguments:
+            name  -  The name of the dependency.
+        Exceptions:
+            None.
+        Return:
+            True if the dependency is a project.
+    """
+    return name not in external_dependencies and name in projects
+
+
 def GetComponentDeps(component):
     result = []
     if component in external_dependencies.keys():
@@ -25,34 +25,60 @@
 #
 
 
-import fnmatch
+import collections
 import os
 
+import SCons.Node.Alias
+from SCons.Script import COMMAND_LINE_TARGETS
 from SCons.Script.SConscript import SConsEnvironment
 
 from core_components import *
 from components import *
+import changeimpact
 import fbuild_exceptions
+import graphcache
+import phasetimes
+import testtimings
+from graphengine import GraphEngine
 from termcolor import Cprint
 
 downloadedDependencies = False
 
+# The targets that need all the components to be processed, besides the
+# all:* targets.
+FULL_GRAPH_TARGETS = ['all', 'targets']
+
 
 def init(env):
-    SConsEnvironment.CreateObject = CreateObject
-    SConsEnvironment.CreateProgram = CreateProgram
-    SConsEnvironment.CreateExternalComponent = CreateExternalComponent
-    SConsEnvironment.CreateStaticLibrary = CreateStaticLibrary
-    SConsEnvironment.CreateSharedLibrary = CreateSharedLibrary
-    SConsEnvironment.CreateHeaderOnlyLibrary = CreateHeaderOnlyLibrary
-    SConsEnvironment.CreateTest = CreateTest
-    SConsEnvironment.CreatePdfLaTeX = CreatePdfLaTeX
-    SConsEnvironment.CreateDoc = CreateDoc
+    SConsEnvironment.CreateObject = graphcache.Recorded(CreateObject)
+    SConsEnvironment.CreateProgram = graphcache.Recorded(CreateProgram)
+    SConsEnvironment.CreateExternalComponent = graphcache.Recorded(CreateExternalComponent)
+    SConsEnvironment.CreateStaticLibrary = graphcache.Recorded(CreateStaticLibrary)
+    SConsEnvironment.CreateSharedLibrary = graphcache.Recorded(CreateSharedLibrary)
+    SConsEnvironment.CreateHeaderOnlyLibrary = graphcache.Recorded(CreateHeaderOnlyLibrary)
+    SConsEnvironment.CreateTest = graphcache.Recorded(CreateTest)
+    SConsEnvironment.CreateBenchmark = graphcache.Recorded(CreateBenchmark)
+    SConsEnvironment.CreatePdfLaTeX = graphcache.Recorded(CreatePdfLaTeX)
+    SConsEnvironment.CreateDoc = graphcache.Recorded(CreateDoc)
     #SConsEnvironment.CreateAutoToolsProject = CreateAutoToolsProject
 
 
 class ComponentDictionary(dict):
 
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        # The engine that computes the closures of the components. It is
+        # reset every time the graph changes.
+        self.engine = GraphEngine(self)
+
+    def clear(self):
+        dict.clear(self)
+        self.engine.Reset()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.engine.Reset()
+
     def Add(self, component, check=True):
         if check:
             if not component.name.islower():
@@ -61,6 +87,7 @@ class ComponentDictionary(dict):
         # dependency was downloaded and
         if component.name not in self:
             self[component.name] = component
+            self.engine.Reset()
             return component
         else:
             Cprint('[warn] component tried to be re-added %s' % component.name, 'red')
@@ -95,57 +122,82 @@ def CreateHeaderOnlyLibrary(env, name, inc, deps, aliasGroups=None):
                                            aliasGroups))
 
 
-def CreateStaticLibrary(env, name, inc, ext_inc, src, deps, aliasGroups=None):
+def CreateStaticLibrary(env, name, inc, ext_inc, src, deps, aliasGroups=None, unity=True, pch=None,
+                        pgo_training=None):
     aliasGroups = aliasGroups if aliasGroups is not None else []
-    return componentGraph.Add(StaticLibraryComponent(componentGraph,
-                                              env,
-                                              name,
-                                              env.Dir('.'),
-                                              deps,
-                                              inc,
-                                              ext_inc,
-                                              src,
-                                              aliasGroups))
-
-
-def CreateSharedLibrary(env, name, inc, ext_inc, src, deps, aliasGroups=None):
-    aliasGroups = aliasGroups if aliasGroups is not None else []
-    return componentGraph.Add(DynamicLibraryComponent(componentGraph,
-                                               env,
-                                               name,
-                                               env.Dir('.'),
-                                               deps,
-                                               inc,
-                                               ext_inc,
-                                               src,
-                                               aliasGroups))
-
-
-def CreateObject(env, name, inc, src, deps, aliasGroups=None):
-    aliasGroups = aliasGroups if aliasGroups is not None else []
-    return componentGraph.Add(ObjectComponent(componentGraph,
+    component = StaticLibraryComponent(componentGraph,
                                        env,
                                        name,
                                        env.Dir('.'),
                                        deps,
                                        inc,
+                                       ext_inc,
                                        src,
-                                       aliasGroups))
-
-
-def CreateProgram(env, name, inc, src, deps, aliasGroups=None):
+                                       aliasGroups)
+    # unity=False compiles the sources one by one with --unity.
+    component._unity = unity
+    # pgo_training is the command that writes the profile for <name>:pgo.
+    component._pgo_training = pgo_training
+    # pch is a header precompiled for the C++ sources.
+    component._pch = env.File(pch) if pch else None
+    return componentGraph.Add(component)
+
+
+def CreateSharedLibrary(env, name, inc, ext_inc, src, deps, aliasGroups=None, unity=True,
+                        pgo_training=None):
     aliasGroups = aliasGroups if aliasGroups is not None else []
-    return componentGraph.Add(ProgramComponent(componentGraph,
+    component = DynamicLibraryComponent(componentGraph,
                                         env,
                                         name,
                                         env.Dir('.'),
                                         deps,
                                         inc,
+                                        ext_inc,
                                         src,
-                                        aliasGroups))
+                                        aliasGroups)
+    # unity=False compiles the sources one by one with --unity.
+    component._unity = unity
+    # pgo_training is the command that writes the profile for <name>:pgo.
+    component._pgo_training = pgo_training
+    return componentGraph.Add(component)
 
 
-def CreateTest(env, name, inc, src, deps, aliasGroups=None):
+def CreateObject(env, name, inc, src, deps, aliasGroups=None, unity=True):
+    aliasGroups = aliasGroups if aliasGroups is not None else []
+    component = ObjectComponent(componentGraph,
+                                env,
+                                name,
+                                env.Dir('.'),
+                                deps,
+                                inc,
+                                src,
+                                aliasGroups)
+    # unity=False compiles the sources one by one with --unity.
+    component._unity = unity
+    return componentGraph.Add(component)
+
+
+def CreateProgram(env, name, inc, src, deps, aliasGroups=None, unity=True, pch=None,
+                  pgo_training=None):
+    aliasGroups = aliasGroups if aliasGroups is not None else []
+    component = ProgramComponent(componentGraph,
+                                 env,
+                                 name,
+                                 env.Dir('.'),
+                                 deps,
+                                 inc,
+                                 src,
+                                 aliasGroups)
+    # unity=False compiles the sources one by one with --unity.
+    component._unity = unity
+    # pgo_training is the command that writes the profile for <name>:pgo.
+    component._pgo_training = pgo_training
+    # pch is a header precompiled for the C++ sources.
+    component._pch = env.File(pch) if pch else None
+    return componentGraph.Add(component)
+
+
+def CreateTest(env, name, inc, src, deps, aliasGroups=None, unity=True, pch=None):
     aliasGroups = aliasGroups if aliasGroups is not None else []
     # Change the name so we can add the component to the graph.
     testName = '%s@test' % name
@@ -155,27 +207,56 @@ def CreateTest(env, name, inc, src, deps, aliasGroups=None):
     else:
         msg = '[WARNING] %s: In test SConscript - Project added as a dependency of its test.' % name
         env.Cprint(msg, 'yellow')
-    return componentGraph.Add(UnitTestComponent(componentGraph,
-                                         env,
-                                         testName,
-                                         env.Dir('.'),
-                                         deps,
-                                         inc,
-                                         src,
-                                         aliasGroups))
+    component = UnitTestComponent(componentGraph,
+                                  env,
+                                  testName,
+                                  env.Dir('.'),
+                                  deps,
+                                  inc,
+                                  src,
+                                  aliasGroups)
+    # unity=False compiles the sources one by one with --unity.
+    component._unity = unity
+    # pch is a header precompiled for the C++ sources.
+    component._pch = env.File(pch) if pch else None
+    return componentGraph.Add(component)
+
+
+def CreateBenchmark(env, name, inc, src, deps, aliasGroups=None):
+    aliasGroups = aliasGroups if aliasGroups is not None else []
+    # Change the name so we can add the component to the graph.
+    benchName = '%s@bench' % name
+    # The benchmark automatically depends on the thing that is measuring.
+    if name not in deps:
+        deps.append(name)
+    else:
+        msg = '[WARNING] %s: In bench SConscript - Project added as a dependency of its benchmark.' % name
+        env.Cprint(msg, 'yellow')
+    component = BenchmarkComponent(componentGraph,
+                                   env,
+                                   benchName,
+                                   env.Dir('.'),
+                                   deps,
+                                   inc,
+                                   src,
+                                   aliasGroups)
+    return componentGraph.Add(component)
 
 
 def CreatePdfLaTeX(env, name, latexfile='', options='', aliasGroups=None):
     aliasGroups = aliasGroups if aliasGroups is not None else []
     docName = name + ':pdf:' + latexfile
     latexfile = env['INSTALL_DOC_DIR'] + "/" + name + ":doc/latex/" + latexfile
-    env['PDFLATEX_OPTIONS'] = options
-    return componentGraph.Add(PdfLaTeXComponent(componentGraph,
-                                    env,
-                                    docName,
-                                    env.Dir('.'),
-                                    latexfile,
-                                    aliasGroups))
+    component = PdfLaTeXComponent(componentGraph,
+                                  env,
+                                  docName,
+                                  env.Dir('.'),
+                                  latexfile,
+                                  aliasGroups)
+    # The options are set in the environment of the component, so the
+    # environment of the SConscript is not modified.
+    component._env['PDFLATEX_OPTIONS'] = options
+    return componentGraph.Add(component)
 
 def CreateDoc(env, name, doxyfile=None, aliasGroups = []):
     docName = name + ':doc'
@@ -202,83 +283,160 @@ def CreateDoc(env, name, doxyfile=None, aliasGroups = []):
 
 
 def WalkDirsForSconscripts(env, topdir='', ignore=None):
-    global componentGraph
     global downloadedDependencies
     ignore = ignore if ignore is not None else []
     topdir = topdir if topdir else env['WS_DIR']
-
-    # Step 1: load all the components in the dependency graph
-    # if we find a download dependency, we download it and re-process
-    # everything to be sure that all the components are downloaded and
-    # loaded in the dependency graph Initial set to pass the loop test
-    originalGraph = componentGraph.copy()
-
-    for component in env.ExternalDependenciesCreateComponentsDict.keys():
-        exec env.ExternalDependenciesCreateComponentsDict[component] in {'env': env}
-
+    phasetimes.Begin('read')
+
+    # Step 1: load all the components in the dependency graph.
+    # If some dependencies are missing, we download them in batches and after
+    # each batch read only the new SConscripts and external components,
+    # merging them into the graph. A downloaded project may define other
+    # missing components (i.e.: gtest_main is added by gmock), so the missing
+    # ones are found again after each batch. This is repeated until nothing
+    # else can be downloaded.
+    createdExternals = set()
+    _CreateNewExternalComponents(env, createdExternals)
+    # The SConscripts are read through the graph cache, which replays those
+    # that did not change since the last run.
+    graphCache = graphcache.GraphCache(env, topdir, ignore)
+    readSconscripts = set()
+    # The missing dependencies we already tried to download.
+    triedDependencies = set()
     downloadedDependencies = True
     while downloadedDependencies:
         downloadedDependencies = False
-        for root, dirnames, filenames in os.walk(topdir):
-            if ignore.count(os.path.relpath(root, topdir)) == 0:
-                for filename in fnmatch.filter(filenames, 'SConscript'):
-                    pathname = os.path.join(root, filename)
-                    vdir = os.path.join(
-                        env['BUILD_DIR'],
-                        os.path.relpath(root, env['WS_DIR'])
-                    )
-                    # We clone the enviroment since we need different one for each
-                    # project.
-                    env2 = env
-                    env = env.Clone()
-                    env.SConscript(
-                        pathname,
-                        exports='env',
-                        variant_dir=vdir,
-                        duplicate=1
-                    )
-                    env = env2
-        # Check if there is a component that we dont know how to build
-        for component in componentGraph.GetComponentsNames():
-            downloadedDependencies = _InstallComponentAndDep(env, component)
-            if downloadedDependencies:
-                break
-            # If a dependency was downloaded we need to re-parse all the
-            # SConscripts to assurance not to try to download something that
-            # is added by another component (i.e.: gtest_main is added by gmock)
-        if downloadedDependencies:
-            # Reset this to allow it to reparse those that were already added
-            componentGraph.clear()
-            componentGraph.update(originalGraph)
-            for component in env.ExternalDependenciesCreateComponentsDict.keys():
-                d = {'env': env}
-                exec env.ExternalDependenciesCreateComponentsDict[component] in d
+        for root, pathname in graphCache.GetSconscripts():
+            if pathname in readSconscripts:
+                continue
+            readSconscripts.add(pathname)
+            vdir = os.path.join(
+                env['BUILD_DIR'],
+                os.path.relpath(root, env['WS_DIR'])
+            )
+            graphCache.ReadSconscript(env, root, pathname, vdir)
+        _CreateNewExternalComponents(env, createdExternals)
+        # Check if there are components that we dont know how to build.
+        missing = [name for name in _FindMissingDependencies(env)
+                   if name not in triedDependencies]
+        batch = _SelectDependenciesToDownload(env, missing)
+        if batch:
+            triedDependencies.update(batch)
+            env.CheckoutDependenciesNow(batch, env)
+            downloadedDependencies = True
+    graphCache.Save()
+    phasetimes.End('read')
 
     # Step 2: real processing we have everything loaded in the dependency graph
-    # now we process it
-
-    for componentName in componentGraph.GetComponentsNames():
+    # now we process it, only the components needed by the targets.
+    phasetimes.Begin('process')
+    componentsNames = _GetComponentsToProcess(env)
+    # SCons runs the tests in the order they are processed, start the slowest.
+    componentsNames = testtimings.SortLongestFirst(env, componentGraph, componentsNames)
+    if env.GetOption('verbose'):
+        env.cdebug('[info] processing %d of %d components' %
+                   (len(componentsNames), len(componentGraph)))
+    for componentName in componentsNames:
         component = componentGraph.get(componentName)
         component.Process()
-
-def _InstallComponentAndDep(env, component_name):
-    comp_queue = [component_name]
-    downloadedDependencies = False
-    while comp_queue:
-        # Take the first element in the queue
-        comp = comp_queue.pop(0)
-        component = componentGraph.get(comp)
+    if changeimpact.AFFECTED_TEST_TARGET in COMMAND_LINE_TARGETS:
+        changeimpact.CreateAffectedTestAlias(env, componentGraph)
+    phasetimes.End('process')
+    phasetimes.SetValue('components', len(componentGraph))
+    phasetimes.SetValue('processed', len(componentsNames))
+
+
+def _GetComponentsToProcess(env):
+    """
+        This function returns the names of the components that must be
+        processed to build the targets of the command line: the components
+        named by the targets (project, project:action, project@test or
+        project@bench), the tests affected by the change for affected:test,
+        and all their dependencies. Every component is returned if a target
+        can not be resolved to a component or if it needs the whole graph
+        (like all:test).
+    """
+    allNames = componentGraph.GetComponentsNames()
+    if (env.GetOption('process_all') or env.GetOption('help') or
+        not COMMAND_LINE_TARGETS):
+        return allNames
+    seeds = []
+    for target in COMMAND_LINE_TARGETS:
+        project = target.split(':')[0]
+        if target == testtimings.TIMINGS_TARGET:
+            # The report does not need any component.
+            continue
+        if project in FULL_GRAPH_TARGETS or target in FULL_GRAPH_TARGETS:
+            return allNames
+        if target == changeimpact.AFFECTED_TEST_TARGET:
+            seeds.extend(changeimpact.GetAffectedTests(env, componentGraph))
+            continue
+        found = [name for name in [target, project, '%s@test' % project,
+                                   '%s@bench' % project]
+                 if name in componentGraph]
+        if not found and SCons.Node.Alias.default_ans.lookup(target) is None:
+            # We do not know which components build this target.
+            return allNames
+        seeds.extend(found)
+    needed = set(seeds)
+    try:
+        for name in seeds:
+            needed.update(componentGraph.engine.GetDependencies(name))
+    except fbuild_exceptions.CircularDependencyError:
+        # Let the processing of all the components report the cycle.
+        return allNames
+    # Keep the order in which all the components would be processed.
+    return [name for name in allNames if name in needed]
+
+def _CreateNewExternalComponents(env, createdExternals):
+    """
+        This function adds to the graph the external components that are
+        installed and were not added yet.
+    """
+    for component in env.ExternalDependenciesCreateComponentsDict.keys():
+        if component not in createdExternals:
+            createdExternals.add(component)
+            d = {'env': env}
+            exec env.ExternalDependenciesCreateComponentsDict[component] in d
+
+
+def _SelectDependenciesToDownload(env, missing):
+    """
+        This function returns the missing dependencies to download in the
+        next batch. The projects needed by the components of the graph go
+        first, alone: their SConscripts may define other missing components,
+        so those are not tried before reading them. When no such project is
+        missing, the rest go in a single batch (the external dependencies
+        only add themselves to the graph).
+    """
+    needed = set()
+    for name in componentGraph.GetComponentsNames():
+        needed.update(componentGraph.get(name)._dependencies)
+    projects = [name for name in missing
+                if name in needed and env.IsProjectDependency(name)]
+    return projects if projects else missing
+
+
+def _FindMissingDependencies(env):
+    """
+        This function walks the dependencies of all the components of the
+        graph in a single breadth-first pass, and returns the names of the
+        dependencies that are not in the graph (and their own dependencies
+        according to the configuration files), in the order they are found.
+    """
+    queue = collections.deque(componentGraph.GetComponentsNames())
+    seen = set(queue)
+    missing = []
+    while queue:
+        name = queue.popleft()
+        component = componentGraph.get(name)
         if component is not None:
-            dep_list_comp = component._dependencies
+            dependencies = component._dependencies
         else:
-            dep_list_comp = env.GetComponentDeps(comp)
-        # We remove from the list dependencies already installed.
-        dep_list_comp = [dep for dep in dep_list_comp if componentGraph.get(dep) is None]
-
-        if dep_list_comp:
-            for dep in dep_list_comp:
-                if not dep in comp_queue:
-                    comp_queue.append(dep)
-        if component is None:
-            downloadedDependencies = env.CheckoutDependencyNow(comp, env)
-    return downloadedDependencies
+            missing.append(name)
+            dependencies = env.GetComponentDeps(name)
+        for dependency in dependencies:
+            if dependency not in seen:
+                seen.add(dependency)
+                queue.append(dependency)
+    return missing
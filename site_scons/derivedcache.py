@@ -0,0 +1,304 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module sets up the cache of the derived files (--derived-cache=DIR).
+
+    The objects, the libraries, the programs and the installed files are
+    stored in a SCons CacheDir. A file is stored under its build signature:
+    the content signatures of its sources, its command line and its path
+    inside the fbuild directory. So the branches of a workspace can share the
+    cache, each one only gets the files built from the same sources with the
+    same flags. Other workspaces get no hits: their command lines have other
+    absolute paths (like the INSTALL_LIB_DIR define of fudepan.SetDefines).
+
+    The decider configured by scons_defaults (MD5-timestamp) trusts the
+    timestamps recorded in the .sconsign. The files retrieved from the cache
+    get the current time, not the time of the cached copy, so the files that
+    depend on them always check their contents, even when the cached copy
+    has the timestamp of a different file built before in this directory.
+
+    The size of the cache is bounded (--derived-cache-size). Each retrieved
+    file is marked as used, and when the cache grows beyond its size the
+    least recently used files are removed at the end of the build.
+"""
+
+
+import atexit
+import os
+import shutil
+import threading
+import time
+
+import SCons.Node.FS
+from termcolor import Cformat
+
+
+# The target that prints the statistics of the cache.
+STATS_TARGET = 'cache:stats'
+# The target that removes the least recently used files beyond the size.
+PRUNE_TARGET = 'cache:prune'
+# The default size of the cache.
+DEFAULT_SIZE = '5G'
+# The builders of the files stored in the cache, the other builders (the
+# tests, the reports, the documentation) always run.
+CACHED_BUILDERS = ['Object', 'SharedObject', 'StaticObject', 'StaticLibrary', 'Library',
+                   'SharedLibrary', 'LoadableModule', 'Program', 'PrecompiledHeader',
+                   'InstallBuilder', 'InstallVersionedBuilder']
+# The suffixes accepted by --derived-cache-size.
+_SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+# The file where SCons writes the configuration of the cache.
+_CONFIG_FILE = 'config'
+# The temporal files left by an interrupted push older than this (in
+# seconds) are removed by the pruning.
+_STALE_TMP_AGE = 60 * 60
+
+# The statistics of this build, the files are retrieved and pushed from the
+# threads of SCons.
+_stats = {'hits': 0, 'misses': 0, 'pushed': 0}
+_lock = threading.Lock()
+
+
+def init(env):
+    """
+        Description:
+            Enables the cache of the derived files if the --derived-cache
+            option was given.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    path = env.GetOption('derived_cache')
+    if not path:
+        return
+    size = ParseSize(env.GetOption('derived_cache_size'))
+    if size is None:
+        env.cerror('[error] invalid --derived-cache-size: %s, use a number of bytes with a '
+                   'K, M, G or T suffix.' % env.GetOption('derived_cache_size'))
+        size = ParseSize(DEFAULT_SIZE)
+    path = os.path.abspath(os.path.expanduser(path))
+    env['DERIVED_CACHE'] = path
+    env['DERIVED_CACHE_SIZE'] = size
+    env.CacheDir(path)
+    # Decider() sets the copy function, this must be called after it. The
+    # component environments are cloned from this one, they inherit it.
+    env.copy_from_cache = _CopyFromCache
+    retrieve = SCons.Node.FS.File.retrieve_from_cache
+    push = SCons.Node.FS.File.push_to_cache
+
+    def RetrieveFromCache(node):
+        if not _IsCached(node):
+            return None
+        retrieved = retrieve(node)
+        with _lock:
+            _stats['hits' if retrieved else 'misses'] += 1
+        return retrieved
+
+    def PushToCache(node):
+        if not _IsCached(node):
+            return None
+        push(node)
+        if node.exists():
+            with _lock:
+                _stats['pushed'] += 1
+
+    SCons.Node.FS.File.retrieve_from_cache = RetrieveFromCache
+    SCons.Node.FS.File.push_to_cache = PushToCache
+    atexit.register(_Finish, env)
+
+
+def ParseSize(text):
+    """
+        Description:
+            Parses a size like 500M or 10G.
+        Arguments:
+            text  -  The string with the size, a number of bytes with an
+                     optional K, M, G or T suffix.
+        Exceptions:
+            None.
+        Return:
+            The number of bytes, or None if the size is invalid.
+    """
+    text = (text or '').strip().upper().rstrip('B')
+    unit = 1
+    if text and text[-1] in _SIZE_UNITS:
+        (text, unit) = (text[:-1], _SIZE_UNITS[text[-1]])
+    try:
+        size = int(float(text) * unit)
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+
+def GetEntries(path):
+    """
+        Description:
+            Lists the files stored in a cache.
+        Arguments:
+            path  -  The directory of the cache.
+        Exceptions:
+            None.
+        Return:
+            A list of (path, size, last use) tuples, the least recently used
+            first.
+    """
+    entries = []
+    for (root, dirnames, filenames) in os.walk(path):
+        for filename in filenames:
+            filepath = os.path.join(root, filename)
+            if filepath == os.path.join(path, _CONFIG_FILE):
+                continue
+            try:
+                # lstat(), the cache may store symbolic links.
+                st = os.lstat(filepath)
+            except OSError:
+                # Removed by other build.
+                continue
+            entries.append((filepath, st.st_size, st.st_mtime))
+    entries.sort(key=lambda entry: entry[2])
+    return entries
+
+
+def Prune(env, size):
+    """
+        Description:
+            Removes the least recently used files of the cache until its size
+            is not bigger than the given size. The temporal files left by the
+            builds that were interrupted are removed too.
+        Arguments:
+            env   -  The SCons environment.
+            size  -  The maximum size of the cache, in bytes.
+        Exceptions:
+            None.
+        Return:
+            A tuple with the number of files removed and their size.
+    """
+    entries = GetEntries(env['DERIVED_CACHE'])
+    total = sum(entry[1] for entry in entries)
+    (removed, freed) = (0, 0)
+    now = time.time()
+    for (path, filesize, used) in entries:
+        if '.tmp' in os.path.basename(path):
+            # Other build may be writing it.
+            if now - used <= _STALE_TMP_AGE:
+                continue
+        elif total - freed <= size:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        freed += filesize
+    return (removed, freed)
+
+
+def WriteStats(env, target):
+    """
+        Description:
+            Prints (and writes to a file) the statistics of the cache.
+        Arguments:
+            env     -  The SCons environment.
+            target  -  The path to the file of the report.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    path = env['DERIVED_CACHE']
+    size = env['DERIVED_CACHE_SIZE']
+    entries = GetEntries(path)
+    total = sum(entry[1] for entry in entries)
+    lines = [
+        'Directory:          %s' % path,
+        'Files:              %d' % len(entries),
+        'Size:               %s of %s (%.0f%%)' % (_FormatSize(total), _FormatSize(size),
+                                                   100.0 * total / size),
+    ]
+    if entries:
+        lines += [
+            'Least recent use:   %s' % _FormatTime(entries[0][2]),
+            'Most recent use:    %s' % _FormatTime(entries[-1][2]),
+        ]
+    text = '\n'.join(lines) + '\n'
+    directory = os.path.dirname(target)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(target, 'w') as f:
+        f.write(text)
+    print Cformat('\n=== DERIVED FILES CACHE ===\n', 'green')
+    print text
+
+
+def _IsCached(node):
+    """Returns whether the node is built by one of the CACHED_BUILDERS."""
+    if not node.has_builder():
+        return False
+    try:
+        return node.get_builder().get_name(node.get_build_env()) in CACHED_BUILDERS
+    except Exception:
+        return False
+
+
+def _CopyFromCache(src, dst):
+    """
+        Copies a file of the cache, with the current time, and marks the
+        cached file as used.
+    """
+    try:
+        os.utime(src, None)
+    except OSError:
+        # A cache shared with other users, their files can not be marked.
+        pass
+    return shutil.copy(src, dst)
+
+
+def _Finish(env):
+    """Prints the statistics of the build and keeps the cache in its size."""
+    with _lock:
+        stats = dict(_stats)
+    if stats['hits'] + stats['misses']:
+        env.Cprint('[info] derived files cache: %d hits, %d misses (%.0f%% hits), %d stored '
+                   'in %s' % (stats['hits'], stats['misses'],
+                              100.0 * stats['hits'] / (stats['hits'] + stats['misses']),
+                              stats['pushed'], env['DERIVED_CACHE']), 'green')
+    # Only the builds that stored files can make the cache grow.
+    if stats['pushed']:
+        (removed, freed) = Prune(env, env['DERIVED_CACHE_SIZE'])
+        if removed:
+            env.Cprint('[info] derived files cache: %d least recently used files removed '
+                       '(%s)' % (removed, _FormatSize(freed)), 'green')
+
+
+def _FormatSize(size):
+    for unit in ['B', 'K', 'M', 'G']:
+        if size < 1024:
+            return '%.1f%s' % (size, unit)
+        size /= 1024.0
+    return '%.1fT' % size
+
+
+def _FormatTime(seconds):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(seconds))
@@ -0,0 +1,528 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This file contains the on-disk cache of the parsed component graph.
+
+    When an SConscript is read, the calls it makes to the env.Create*
+    methods are recorded together with their arguments (names, types, deps,
+    include paths and source lists). In the next runs, if neither the
+    SConscript nor the directories below it changed, the calls are replayed
+    instead of executing the SConscript again. If no directory of the
+    workspace changed, the workspace is not walked either.
+
+    Only the SConscripts that do nothing else than importing the env,
+    assigning simple values and calling env.Create* are cached, the other
+    ones are always executed.
+"""
+
+
+import ast
+import cPickle
+import glob
+import hashlib
+import os
+
+from SCons.Node.FS import Dir, Entry, File
+
+
+# Bump this number every time the format of the cache changes.
+CACHE_VERSION = 1
+# The name of the file (inside the BUILD_DIR) where the cache is stored.
+CACHE_FILE = 'graphcache.pickle'
+# The valid values for the --graph-cache option.
+MODE_OFF = 'off'
+MODE_READ = 'read'
+MODE_REBUILD = 'rebuild'
+MODES = [MODE_OFF, MODE_READ, MODE_REBUILD]
+# Functions that can be called in a cacheable SConscript to compute values.
+SAFE_FUNCTIONS = ['Dir', 'File', 'Glob', 'Split']
+# Functions that can be called as statements in a cacheable SConscript.
+SAFE_STATEMENTS = ['Import']
+# The prefix of the env methods whose calls are recorded.
+CREATE_PREFIX = 'Create'
+
+# The recorder of the SConscript being read, if any.
+_recorder = None
+
+
+class NotCacheableError(Exception):
+    """
+        This exception is raised when a recorded call has an argument that
+        can not be stored in the cache.
+    """
+    pass
+
+
+class _Recorder(object):
+    """
+        This class stores the calls to the env.Create* methods made while an
+        SConscript is read.
+    """
+
+    def __init__(self):
+        # A list of tuples (method name, arguments, keyword arguments).
+        self.calls = []
+        # False if a call could not be recorded.
+        self.cacheable = True
+
+
+def Recorded(function):
+    """
+        Description:
+            This function wraps an env.Create* method so its calls are
+            recorded while a cacheable SConscript is read.
+        Arguments:
+            function  -  The function to wrap.
+        Exceptions:
+            None.
+        Return:
+            The wrapper function.
+    """
+    def Wrapper(env, *args, **kwargs):
+        recorder = _recorder
+        if recorder is not None and recorder.cacheable:
+            try:
+                # Store the arguments before the call, since some of the
+                # Create* functions modify them.
+                call = (function.__name__, _Dump(args), _Dump(kwargs))
+                recorder.calls.append(call)
+            except NotCacheableError:
+                recorder.cacheable = False
+        return function(env, *args, **kwargs)
+    Wrapper.__name__ = function.__name__
+    Wrapper.__doc__ = function.__doc__
+    return Wrapper
+
+
+class GraphCache(object):
+    """
+        This class reads the SConscripts of a workspace, using the cache when
+        it is possible.
+    """
+
+    #
+    # Private attributes.
+    #
+    # The environment.
+    _env = None
+    # The value of the --graph-cache option.
+    _mode = None
+    # The path to the file where the cache is stored.
+    _path = None
+    # A tuple with the things that invalidate the whole cache when changed.
+    _key = None
+    # The directory where the SConscripts are looked for.
+    _topdir = None
+    # The directories (relative to the topdir) to ignore.
+    _ignore = None
+    # A list with the walked directories, in walk order.
+    _dirs = None
+    # A list of tuples (root, pathname) with the found SConscripts.
+    _sconscripts = None
+    # True once the SConscripts were looked for in this run.
+    _looked_for = False
+    # A dictionary (pathname -> entry) with the recorded SConscripts. An
+    # entry is a tuple (SConscript mtime, dirs mtimes, calls).
+    _entries = None
+    # A dictionary (dir -> mtime) with the mtimes already looked up.
+    _mtimes = None
+    # True if the cache must be written back.
+    _changed = False
+    # Statistics about the reading of the SConscripts.
+    _replayed = 0
+    _executed = 0
+
+    #
+    # Special methods.
+    #
+
+    def __init__(self, env, topdir, ignore):
+        self._env = env
+        self._mode = env.GetOption('graph_cache')
+        self._topdir = topdir
+        self._ignore = ignore
+        self._path = os.path.join(env['BUILD_DIR'], CACHE_FILE)
+        self._key = self._ComputeKey()
+        self._mtimes = {}
+        self._entries = {}
+        if self._mode == MODE_READ:
+            self._Load()
+        if self._mode == MODE_REBUILD:
+            self._changed = True
+
+    #
+    # Public methods.
+    #
+
+    def GetSconscripts(self):
+        """
+            Description:
+                This method finds the SConscripts of the workspace. The
+                workspace is walked only if a directory changed since the
+                cache was written.
+            Arguments:
+                None.
+            Exceptions:
+                None.
+            Return:
+                A list of tuples (root, pathname), in walk order.
+        """
+        # The SConscripts from the cache can only be used the first time,
+        # later a dependency may have been downloaded.
+        if self._sconscripts is None or self._looked_for:
+            self._Walk()
+        self._looked_for = True
+        return self._sconscripts
+
+    def ReadSconscript(self, env, root, pathname, vdir):
+        """
+            Description:
+                This method reads an SConscript into the component graph,
+                either replaying its recorded calls or executing it.
+            Arguments:
+                env  -  The environment of the workspace.
+                root  -  The directory where the SConscript lives.
+                pathname  -  The path to the SConscript.
+                vdir  -  The variant dir for the SConscript.
+            Exceptions:
+                None.
+            Return:
+                None.
+        """
+        global _recorder
+        mtime = _GetMtime(pathname)
+        entry = self._entries.get(pathname)
+        if self._mode != MODE_OFF and entry is not None:
+            (entry_mtime, entry_dirs, calls) = entry
+            if entry_mtime == mtime and self._DirsUnchanged(entry_dirs):
+                self._Replay(env, root, vdir, calls)
+                self._replayed += 1
+                return
+        self._executed += 1
+        if self._mode != MODE_OFF and _IsCacheable(pathname):
+            _recorder = _Recorder()
+        # We clone the enviroment since we need different one for each
+        # project.
+        env = env.Clone()
+        try:
+            env.SConscript(pathname, exports='env', variant_dir=vdir, duplicate=1)
+        finally:
+            recorder = _recorder
+            _recorder = None
+        if recorder is not None and recorder.cacheable:
+            self._entries[pathname] = (mtime, self._GetSubdirs(root), recorder.calls)
+            self._changed = True
+        elif pathname in self._entries:
+            del self._entries[pathname]
+            self._changed = True
+
+    def Save(self):
+        """
+            Description:
+                This method writes the cache to disk, if something changed.
+            Arguments:
+                None.
+            Exceptions:
+                None.
+            Return:
+                None.
+        """
+        if self._env.GetOption('verbose'):
+            self._env.cdebug('[graph-cache] %d SConscripts replayed, %d executed' %
+                             (self._replayed, self._executed))
+        if self._mode == MODE_OFF or not self._changed:
+            return
+        pathnames = set(pathname for (root, pathname) in self._sconscripts)
+        data = {
+            'key': self._key,
+            'dirs': [(d, self._GetDirMtime(d)) for d in self._dirs],
+            'sconscripts': self._sconscripts,
+            'entries': dict((p, e) for (p, e) in self._entries.iteritems() if p in pathnames)
+        }
+        if not os.path.exists(self._env['BUILD_DIR']):
+            os.makedirs(self._env['BUILD_DIR'])
+        # Write to a temporal file and rename it, so an interrupted run does
+        # not leave a broken cache.
+        tmp = '%s.%d' % (self._path, os.getpid())
+        with open(tmp, 'wb') as f:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self._path)
+        self._changed = False
+
+    #
+    # Private methods.
+    #
+
+    def _ComputeKey(self):
+        """
+            This method computes the values that invalidate the whole cache:
+            the paths, the configuration files and the build system itself.
+        """
+        env = self._env
+        root = env.Dir('#').abspath
+        md5 = hashlib.md5()
+        for xml in sorted(glob.glob(os.path.join(root, 'conf', '*.xml'))):
+            md5.update(xml)
+            with open(xml, 'rb') as f:
+                md5.update(f.read())
+        site_scons = os.path.dirname(os.path.abspath(__file__))
+        sources = [os.path.join(root, 'SConstruct')]
+        sources.extend(glob.glob(os.path.join(site_scons, '*.py')))
+        sources = [(s, _GetMtime(s)) for s in sorted(sources)]
+        return (CACHE_VERSION, self._topdir, sorted(self._ignore), env['WS_DIR'],
+                env['BUILD_DIR'], md5.hexdigest(), sources)
+
+    def _Load(self):
+        """
+            This method reads the cache from disk. A missing, broken or stale
+            cache is ignored.
+        """
+        try:
+            with open(self._path, 'rb') as f:
+                data = cPickle.load(f)
+        except Exception:
+            return
+        if not isinstance(data, dict) or data.get('key') != self._key:
+            return
+        self._entries = data['entries']
+        # If no directory changed, there are no new SConscripts.
+        if self._DirsUnchanged(data['dirs']):
+            self._dirs = [d for (d, mtime) in data['dirs']]
+            self._sconscripts = data['sconscripts']
+
+    def _Walk(self):
+        """
+            This method walks the workspace looking for SConscripts.
+        """
+        # Forget the mtimes looked up before, a dependency may have been
+        # downloaded since then.
+        self._mtimes = {}
+        self._dirs = []
+        self._sconscripts = []
+        for root, dirnames, filenames in os.walk(self._topdir):
+            self._dirs.append(root)
+            if self._ignore.count(os.path.relpath(root, self._topdir)) == 0:
+                if 'SConscript' in filenames:
+                    self._sconscripts.append((root, os.path.join(root, 'SConscript')))
+        self._changed = self._changed or self._mode != MODE_OFF
+
+    def _GetSubdirs(self, root):
+        """
+            This method returns the mtimes of the directory and all its
+            subdirectories. Since the walk is top-down, the subdirectories
+            come right after the directory.
+        """
+        result = []
+        if root in self._dirs:
+            start = self._dirs.index(root)
+            prefix = os.path.join(root, '')
+            result.append((root, self._GetDirMtime(root)))
+            for d in self._dirs[start + 1:]:
+                if not d.startswith(prefix):
+                    break
+                result.append((d, self._GetDirMtime(d)))
+        return result
+
+    def _GetDirMtime(self, path):
+        """
+            This method returns the mtime of a directory, looking it up only
+            once.
+        """
+        if path not in self._mtimes:
+            self._mtimes[path] = _GetMtime(path)
+        return self._mtimes[path]
+
+    def _DirsUnchanged(self, dirs):
+        """
+            This method checks that the mtimes of some directories did not
+            change. Since creating or deleting a file changes the mtime of
+            the directory, an unchanged directory has the same files.
+        """
+        for (d, mtime) in dirs:
+            if self._GetDirMtime(d) != mtime:
+                return False
+        return True
+
+    def _Replay(self, env, root, vdir, calls):
+        """
+            This method repeats the recorded calls of an SConscript, as if
+            it was read from its variant dir. The environment is not cloned,
+            a cached SConscript does not modify it and each component clones
+            the environment it receives.
+        """
+        env.VariantDir(vdir, root, duplicate=1)
+        fs = env.fs
+        cwd = fs.getcwd()
+        fs.chdir(env.Dir(vdir), change_os_dir=0)
+        try:
+            for (method, args, kwargs) in calls:
+                args = _Load(env, args)
+                kwargs = _Load(env, kwargs)
+                getattr(env, method)(*args, **kwargs)
+        finally:
+            fs.chdir(cwd, change_os_dir=0)
+
+
+def _GetMtime(path):
+    """
+        This function returns the mtime of a path, or None if it does not
+        exist.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _Dump(value):
+    """
+        This function converts a value into something that can be pickled.
+        The nodes are stored with their absolute paths.
+    """
+    if isinstance(value, (str, unicode, int, long, float, bool)) or value is None:
+        return value
+    if isinstance(value, Dir):
+        return ('Dir', value.abspath)
+    if isinstance(value, File):
+        return ('File', value.abspath)
+    if isinstance(value, Entry):
+        return ('Entry', value.abspath)
+    if isinstance(value, dict):
+        return ('dict', [(_Dump(k), _Dump(v)) for (k, v) in value.iteritems()])
+    try:
+        items = list(value)
+    except TypeError:
+        raise NotCacheableError(value)
+    return ('list', [_Dump(x) for x in items])
+
+
+def _Load(env, value):
+    """
+        This function converts back a value stored with _Dump.
+    """
+    if not isinstance(value, tuple):
+        return value
+    (kind, data) = value
+    if kind == 'list':
+        return [_Load(env, x) for x in data]
+    elif kind == 'dict':
+        return dict((_Load(env, k), _Load(env, v)) for (k, v) in data)
+    else:
+        return getattr(env, kind)(data)
+
+
+def _GetCallName(call):
+    """
+        This function returns the name of the function called, as 'name' or
+        'env.name', or None if it is something else.
+    """
+    function = call.func
+    if isinstance(function, ast.Name):
+        return function.id
+    if isinstance(function, ast.Attribute) and isinstance(function.value, ast.Name):
+        if function.value.id == 'env':
+            return 'env.' + function.attr
+    return None
+
+
+def _IsSafeCall(call, names):
+    """
+        This function checks that a call is to one of the given functions,
+        with simple arguments.
+    """
+    name = _GetCallName(call)
+    if name is None:
+        return False
+    if name.startswith('env.'):
+        name = name[len('env.'):]
+    if name not in names or call.starargs or call.kwargs:
+        return False
+    return all(_IsSafeValue(x) for x in call.args + [k.value for k in call.keywords])
+
+
+def _IsSafePathCall(call):
+    """
+        This function checks that a call to Dir, File, Glob or Split only
+        takes relative paths inside the directory of the SConscript.
+    """
+    if not _IsSafeCall(call, SAFE_FUNCTIONS) or call.keywords:
+        return False
+    for arg in call.args:
+        if not isinstance(arg, ast.Str):
+            return False
+        if arg.s.startswith('/') or arg.s.startswith('#') or '..' in arg.s:
+            return False
+    return True
+
+
+def _IsSafeValue(node):
+    """
+        This function checks that an expression has no side effects and its
+        value only depends on the directory of the SConscript.
+    """
+    if isinstance(node, (ast.Str, ast.Num, ast.Name)):
+        return True
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return all(_IsSafeValue(x) for x in node.elts)
+    if isinstance(node, ast.Dict):
+        return all(_IsSafeValue(x) for x in node.keys + node.values)
+    if isinstance(node, ast.BinOp):
+        return _IsSafeValue(node.left) and _IsSafeValue(node.right)
+    if isinstance(node, ast.Call):
+        return _IsSafePathCall(node)
+    return False
+
+
+def _IsCacheable(pathname):
+    """
+        This function checks that an SConscript only imports the env, assigns
+        simple values and calls env.Create*, so its effect on the component
+        graph can be recorded and replayed.
+    """
+    try:
+        with open(pathname, 'r') as f:
+            tree = ast.parse(f.read(), pathname)
+    except (IOError, SyntaxError):
+        return False
+    for statement in tree.body:
+        if isinstance(statement, ast.Pass):
+            continue
+        if isinstance(statement, ast.Assign):
+            if not all(isinstance(t, ast.Name) for t in statement.targets):
+                return False
+            if not _IsSafeValue(statement.value):
+                return False
+            continue
+        if isinstance(statement, ast.Expr):
+            value = statement.value
+            if isinstance(value, ast.Str):
+                continue
+            if isinstance(value, ast.Call):
+                if _IsSafeCall(value, SAFE_STATEMENTS):
+                    continue
+                name = _GetCallName(value)
+                if name is not None and name.startswith('env.' + CREATE_PREFIX):
+                    if _IsSafeCall(value, [name[len('env.'):]]):
+                        continue
+        return False
+    return True
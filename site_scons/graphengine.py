@@ -0,0 +1,225 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This file contains the engine that computes the transitive closures of
+    the component graph.
+
+    Each component is visited once, after all its dependencies (in
+    topological order), so the closure of a component is built from the
+    already computed closures of its dependencies.
+"""
+
+
+import fbuild_exceptions
+
+
+class GraphEngine(object):
+    """
+        This class computes and caches the transitive closures of a graph of
+        components.
+
+        The graph is a dictionary that maps names to components. The engine
+        must be reset every time the graph changes.
+    """
+
+    #
+    # Private attributes.
+    #
+    # The dictionary of components (name -> component).
+    _graph = None
+    # A list with the names of the visited components in topological order
+    # (dependencies first).
+    _order = None
+    # A dictionary with the transitive dependencies of each component, in the
+    # order they are first found by a depth-first walk.
+    _dependencies = None
+    # A dictionary with the maximum depth of each transitive dependency.
+    _depths = None
+    # A dictionary with the include paths that each component takes from its
+    # dependencies.
+    _includes = None
+    # A dictionary with the include paths that each component gives to the
+    # components that depend on it, without those of its own dependencies.
+    _contributions = None
+
+    #
+    # Special methods.
+    #
+
+    def __init__(self, graph):
+        self._graph = graph
+        self.Reset()
+
+    #
+    # Public methods.
+    #
+
+    def Reset(self):
+        """
+            Description:
+                This method discards all the computed closures.
+            Arguments:
+                None.
+            Exceptions:
+                None.
+            Return:
+                None.
+        """
+        self._order = []
+        self._dependencies = {}
+        self._depths = {}
+        self._includes = {}
+        self._contributions = {}
+
+    def GetTopologicalOrder(self):
+        """
+            Description:
+                This method sorts all the components of the graph so that
+                every component comes after its dependencies.
+            Arguments:
+                None.
+            Exceptions:
+                CircularDependencyError.
+            Return:
+                A list with the names of the components.
+        """
+        for name in sorted(self._graph.keys()):
+            self._Visit(name)
+        return list(self._order)
+
+    def GetDependencies(self, name):
+        """
+            Description:
+                This method returns the transitive dependencies of a
+                component.
+            Arguments:
+                name  -  A string with the name of the component.
+            Exceptions:
+                CircularDependencyError.
+            Return:
+                A list with the names of the dependencies, in the order a
+                depth-first walk finds them for the first time.
+        """
+        self._Visit(name)
+        return self._dependencies[name]
+
+    def GetDependenciesDepth(self, name):
+        """
+            Description:
+                This method returns the depth of each transitive dependency of
+                a component, i.e., the length of the longest path that goes
+                from the component to the dependency.
+            Arguments:
+                name  -  A string with the name of the component.
+            Exceptions:
+                CircularDependencyError.
+            Return:
+                A dictionary that maps names to depths.
+        """
+        self._Visit(name)
+        return self._depths[name]
+
+    def GetDependenciesIncludePaths(self, name):
+        """
+            Description:
+                This method returns the include paths that the dependencies of
+                a component give to it.
+            Arguments:
+                name  -  A string with the name of the component.
+            Exceptions:
+                CircularDependencyError.
+            Return:
+                A set of paths.
+        """
+        self._Visit(name)
+        return self._includes[name]
+
+    #
+    # Private methods.
+    #
+
+    def _Visit(self, name):
+        """
+            This method computes the closures of a component and of all its
+            dependencies. It walks the graph with an explicit stack, so deep
+            graphs do not hit the recursion limit.
+        """
+        if name in self._dependencies:
+            return
+        component = self._graph[name]
+        # The components being visited, and a set to look them up quickly.
+        path = [name]
+        on_path = set(path)
+        stack = [(component, iter(component._dependencies))]
+        while stack:
+            component, pending = stack[-1]
+            for dependency in pending:
+                if dependency in self._dependencies:
+                    continue
+                if dependency in on_path:
+                    raise fbuild_exceptions.CircularDependencyError(path + [dependency])
+                child = self._graph.get(dependency)
+                if child is not None:
+                    path.append(dependency)
+                    on_path.add(dependency)
+                    stack.append((child, iter(child._dependencies)))
+                    break
+            else:
+                # All the dependencies were visited.
+                stack.pop()
+                on_path.discard(path.pop())
+                self._Finish(component)
+
+    def _Finish(self, component):
+        """
+            This method builds the closures of a component from the closures
+            of its dependencies.
+        """
+        dependencies = []
+        seen = set()
+        depths = {}
+        includes = set()
+        for dependency in component._dependencies:
+            child = self._graph.get(dependency)
+            if child is None:
+                component._env.cerror(
+                    '[error] %s depends on %s which could not be found' %
+                    (component.name, dependency)
+                )
+                continue
+            for x in [dependency] + self._dependencies[dependency]:
+                if x not in seen:
+                    seen.add(x)
+                    dependencies.append(x)
+            depths[dependency] = max(depths.get(dependency, 0), 1)
+            for x, depth in self._depths[dependency].iteritems():
+                if depths.get(x, 0) < depth + 1:
+                    depths[x] = depth + 1
+            if dependency not in self._contributions:
+                self._contributions[dependency] = set(child._GetIncludePathsAsDependency())
+            includes |= self._contributions[dependency]
+            includes |= self._includes[dependency]
+        self._dependencies[component.name] = dependencies
+        self._depths[component.name] = depths
+        self._includes[component.name] = includes
+        self._order.append(component.name)
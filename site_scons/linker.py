@@ -25,10 +25,32 @@
 """
 
 
+import os
 import platform
+import subprocess
+from distutils.spawn import find_executable
+from multiprocessing import cpu_count
+from SCons.Script import AddOption
+
+
+# The linkers that can be chosen with --linker, 'auto' takes the first one
+# available of FAST_LINKERS.
+LINKERS = ['auto', 'bfd', 'gold', 'lld', 'mold']
+FAST_LINKERS = ['mold', 'lld', 'gold']
+# The linkers that can not link the objects of GCC with link-time
+# optimization, they do not load its plugin.
+_NO_GCC_LTO_LINKERS = ['lld']
 
 
 def init(env):
+    AddOption('--linker',
+              dest='linker',
+              type='choice',
+              choices=LINKERS,
+              nargs=1,
+              action='store',
+              help='linker used by the compiler, options: %s. auto takes the fastest '
+                   'one installed.' % ', '.join(LINKERS))
     (arch, binType) = platform.architecture()
     if binType == 'ELF':
         LinuxOptions(env)
@@ -41,3 +63,79 @@ def LinuxOptions(env):
     # scons to deploy it somewhere else.
     env.Append(RPATH=env['INSTALL_LIB_DIR'])
     env['ENV']['LD_LIBRARY_PATH'] = env['INSTALL_LIB_DIR']
+    lto = env.GetOption('type') == 'lto'
+    if lto:
+        LinkTimeOptimization(env)
+    if env.GetOption('linker'):
+        SelectLinker(env, env.GetOption('linker'), lto)
+
+
+def LinkTimeOptimization(env):
+    """
+        Description:
+            Sets the archiver and the link flags for the link-time
+            optimization (the compiler adds -flto for --type=lto). The static
+            libraries are created with the GCC wrappers of ar and ranlib, so
+            their index includes the symbols of the LTO objects. Up to -j
+            links run at once, so the CPUs are split among them: each link
+            optimizes in CPUs / -j jobs.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    for (tool, wrapper) in [('AR', 'gcc-ar'), ('RANLIB', 'gcc-ranlib')]:
+        path = find_executable(wrapper)
+        if path is None:
+            env.cwarn('[warn] %s is not installed, the static libraries can not be linked '
+                      'with link-time optimization.' % wrapper)
+        else:
+            env[tool] = path
+    jobs = max(cpu_count() // max(env.GetOption('num_jobs') or 1, 1), 1)
+    # The shared libraries take the LINKFLAGS too.
+    env.Append(LINKFLAGS=['-flto=%d' % jobs, '-O3'])
+
+
+def SelectLinker(env, linker, lto=False):
+    """
+        Description:
+            Makes the compiler link with the given linker (-fuse-ld), if it is
+            available.
+        Arguments:
+            env     -  The SCons environment.
+            linker  -  One of LINKERS.
+            lto     -  Whether the objects are compiled for link-time
+                       optimization.
+        Exceptions:
+            None.
+        Return:
+            The name of the linker used, or None if it is the default one.
+    """
+    candidates = FAST_LINKERS if linker == 'auto' else [linker]
+    if lto:
+        candidates = [x for x in candidates if x not in _NO_GCC_LTO_LINKERS]
+    for candidate in candidates:
+        if _IsLinkerAvailable(env, candidate):
+            env.Append(LINKFLAGS=['-fuse-ld=%s' % candidate])
+            return candidate
+    if linker == 'auto':
+        env.cwarn('[warn] no faster linker was found, the default linker is used.')
+    elif lto and linker in _NO_GCC_LTO_LINKERS:
+        env.cwarn('[warn] %s can not link with link-time optimization, the default linker is '
+                  'used.' % linker)
+    else:
+        env.cwarn('[warn] the %s linker is not available, the default linker is used.' % linker)
+    return None
+
+
+def _IsLinkerAvailable(env, linker):
+    """Returns whether the compiler can run the given linker."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            returncode = subprocess.call([env.subst('$CXX'), '-fuse-ld=%s' % linker,
+                                          '-Wl,--version'], stdout=devnull, stderr=devnull)
+    except OSError:
+        return False
+    return returncode == 0
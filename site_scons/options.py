@@ -62,6 +62,47 @@ def init(env):
         default="*",
         help='Specifies the test suite that will be run. Default is all tests suit.'
     )
+    AddOption(
+        '--test-shards',
+        dest='test_shards',
+        action='store',
+        type='int',
+        default=1,
+        help='Number of processes that run each test executable at the same time, each one runs a part (shard) of the tests. Default is 1.'
+    )
+    AddOption(
+        '--test-cache',
+        dest='test_cache',
+        action='store',
+        type='choice',
+        choices=['on', 'off'],
+        default='on',
+        help='Replay the result of the tests that passed with the same executable, libraries and ref files (on), or always run them (off). Default is on.'
+    )
+    AddOption(
+        '--changed-from',
+        dest='changed_from',
+        action='store',
+        type='string',
+        default=None,
+        help='For affected:test, the git revision compared with the working tree to find the changed files. Default is HEAD.'
+    )
+    AddOption(
+        '--changed-files',
+        dest='changed_files',
+        action='store',
+        type='string',
+        default=None,
+        help='For affected:test, a file with the paths of the changed files, one per line.'
+    )
+    AddOption(
+        '--unity',
+        dest='unity',
+        action='store',
+        type='int',
+        default=0,
+        help='Compile the sources of each component in unity files that include about N sources each, so the headers are parsed less times. Default is 0 (off).'
+    )
     AddOption(
         '--namecheck',
         dest='namecheck',
@@ -75,4 +116,137 @@ def init(env):
         action='store_true',
         help='Exclude header files in :static-analysis check.',
         default=False
-    )
\ No newline at end of file
+    )
+    AddOption(
+        '--graph-cache',
+        dest='graph_cache',
+        action='store',
+        type='choice',
+        choices=['off', 'read', 'rebuild'],
+        default='read',
+        help='''Use the on-disk cache of the component graph: "read" replays the SConscripts that did not change, "rebuild" reads them all and rewrites the cache, "off" does not use it. Default is read.'''
+    )
+    AddOption(
+        '--process-all',
+        dest='process_all',
+        action='store_true',
+        help='''Process all the components of the workspace, not only those needed by the targets of the command line.''',
+        default=False
+    )
+    AddOption(
+        '--checkout-jobs',
+        dest='checkout_jobs',
+        action='store',
+        type='int',
+        default=4,
+        help='Number of dependencies downloaded at the same time. Default is 4.'
+    )
+    AddOption(
+        '--install-dry-run',
+        dest='install_dry_run',
+        action='store_true',
+        help='Print the commands that would download and install the missing dependencies, without running them.',
+        default=False
+    )
+    AddOption(
+        '--recheck-deps',
+        dest='recheck_deps',
+        action='store_true',
+        help='Check again which external dependencies are installed, instead of using the cached results.',
+        default=False
+    )
+    AddOption(
+        '--trace',
+        dest='trace_file',
+        action='store',
+        type='string',
+        default=None,
+        help='Write a trace of the actions executed (Chrome trace event format) to the given file.'
+    )
+    AddOption(
+        '--critical-path-trace',
+        dest='critical_path_trace',
+        action='store',
+        type='string',
+        default=None,
+        help='The trace (written by --trace) with the durations of the actions analyzed by all:critical-path.'
+    )
+    AddOption(
+        '--derived-cache',
+        dest='derived_cache',
+        action='store',
+        type='string',
+        default=None,
+        help='Directory of a cache of the objects, libraries, programs and installed files, shared by the branches of the workspace.'
+    )
+    AddOption(
+        '--derived-cache-size',
+        dest='derived_cache_size',
+        action='store',
+        type='string',
+        default='5G',
+        help='Maximum size of the --derived-cache, the least recently used files are removed (like 500M or 10G). Default is 5G.'
+    )
+    AddOption(
+        '--profiler',
+        dest='profiler',
+        action='store',
+        type='choice',
+        choices=['auto', 'gprof', 'perf'],
+        default='auto',
+        help='The profiler used by <project>:profile: gprof, perf, or auto to use perf if it is installed. Default is auto.'
+    )
+    AddOption(
+        '--bench-filter',
+        dest='bench_filter',
+        action='store',
+        type='string',
+        default=None,
+        help='A regular expression with the benchmarks run by <project>:bench. Default is all the benchmarks.'
+    )
+    AddOption(
+        '--bench-repetitions',
+        dest='bench_repetitions',
+        action='store',
+        type='int',
+        default=5,
+        help='The number of times each benchmark is repeated by <project>:bench, its time is the median of the repetitions. Default is 5.'
+    )
+    AddOption(
+        '--bench-threshold',
+        dest='bench_threshold',
+        action='store',
+        type='float',
+        default=5.0,
+        help='The percentage that the time of a benchmark can grow before <project>:bench-compare fails. Default is 5.'
+    )
+    AddOption(
+        '--bench-baseline',
+        dest='bench_baseline',
+        action='store',
+        type='string',
+        default=None,
+        help='The results compared by <project>:bench-compare: a JSON file, or a git ref of the project with results kept by <project>:bench. Default is the baseline saved in the reports.'
+    )
+    AddOption(
+        '--bench-update-baseline',
+        dest='bench_update_baseline',
+        action='store_true',
+        default=False,
+        help='Save the results of <project>:bench-compare as the baseline.'
+    )
+    AddOption(
+        '--rtc-bench',
+        dest='rtc_bench',
+        action='store_true',
+        default=False,
+        help='Include <project>:bench-compare in <project>:ready-to-commit.'
+    )
+    AddOption(
+        '--phase-times',
+        dest='phase_times',
+        action='store',
+        type='string',
+        default=None,
+        help='Write the time of the phases of fbuild (reading the SConscripts, processing the components, building) to the given file, in JSON.'
+    )
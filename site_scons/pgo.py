@@ -0,0 +1,181 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module runs the profile-guided optimization of a project
+    (<project>:pgo).
+
+    The project is built in the 'pgo-<type>' variant (see variants.py) with
+    --pgo=generate, and its tests (or its training command) run to write the
+    profile. Then it is built again in the same variant with --pgo=use. The
+    profile is kept in INSTALL_REPORTS_DIR/pgo/<variant>/<project>, with the
+    signature of the sources it was written for: it is written again only
+    when the sources of the project, of its dependencies or of its tests
+    change.
+"""
+
+
+import hashlib
+import os
+import shutil
+import subprocess
+
+from compiler import PGO_GENERATE, PGO_USE
+from core_components import ExternalComponent, SourcedComponent, HeaderOnlyComponent
+import variants
+
+
+# The build types optimized, the others are optimized as 'opt'.
+OPTIMIZED_TYPES = ['opt', 'lto']
+# The file (in the directory of the profile) with the signature of the
+# sources.
+SIGNATURE_FILE = 'sources.sha1'
+# The size of the blocks read to hash a file.
+_BLOCK_SIZE = 1 << 20
+
+
+def GetVariant(env):
+    """
+        Description:
+            Gets the variant where the profile-guided optimization is built.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            A tuple with the name of the variant and its build type.
+    """
+    build_type = env.GetOption('type')
+    if build_type not in OPTIMIZED_TYPES:
+        build_type = 'opt'
+    return ('pgo-%s' % build_type, build_type)
+
+
+def Run(env, graph, project, training=None):
+    """
+        Description:
+            Builds a project optimized with its profile, writing the profile
+            first if it is missing or stale.
+        Arguments:
+            env       -  The SCons environment.
+            graph     -  The graph of components.
+            project   -  The name of the project.
+            training  -  A command that runs the program to write the profile,
+                         in the directory of the installed programs of the
+                         variant, or None to run the tests of the project.
+        Exceptions:
+            None.
+        Return:
+            True if the project was built.
+    """
+    (variant, build_type) = GetVariant(env)
+    test = '%s@test' % project
+    if training is None and test not in graph:
+        env.cerror('[error] %s has no tests nor training command to write its profile.' %
+                   project)
+        return False
+    profile_dir = os.path.join(env.Dir('$INSTALL_REPORTS_DIR').abspath, 'pgo', variant, project)
+    signature_file = os.path.join(profile_dir, SIGNATURE_FILE)
+    names = [project] + ([test] if training is None else [])
+    signature = _GetSourcesSignature(graph, names, '%s\0%s' % (build_type, training))
+    try:
+        with open(signature_file) as f:
+            stale = f.read().strip() != signature
+    except IOError:
+        stale = True
+    if not stale:
+        env.Cprint('[info] the profile of %s is up to date: %s' % (project, profile_dir), 'green')
+    else:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        os.makedirs(profile_dir)
+        options = {'--type': build_type, '--pgo': PGO_GENERATE, '--pgo-dir': profile_dir,
+                   '--test-cache': 'off'}
+        targets = ['%s:test' % project] if training is None else [project]
+        if variants.RunVariant(env, variant, targets, options):
+            env.cerror('[error] the instrumented build of %s failed.' % project)
+            return False
+        if training is not None and not _RunTraining(env, variant, training):
+            return False
+        if not _HasProfile(profile_dir):
+            env.cerror('[error] no profile was written in %s.' % profile_dir)
+            return False
+        with open(signature_file, 'w') as f:
+            f.write(signature + '\n')
+    options = {'--type': build_type, '--pgo': PGO_USE, '--pgo-dir': profile_dir}
+    if variants.RunVariant(env, variant, [project], options):
+        env.cerror('[error] the optimized build of %s failed.' % project)
+        return False
+    dirs = variants.GetVariantDirs(env, variant)
+    env.Cprint('[info] %s optimized with its profile, installed in %s and %s' %
+               (project, dirs['INSTALL_BIN_DIR'], dirs['INSTALL_LIB_DIR']), 'green')
+    return True
+
+
+def _RunTraining(env, variant, training):
+    """Runs the training command with the programs of the variant."""
+    dirs = variants.GetVariantDirs(env, variant)
+    process_env = dict(os.environ)
+    process_env['LD_LIBRARY_PATH'] = dirs['INSTALL_LIB_DIR']
+    process_env['PATH'] = os.pathsep.join([dirs['INSTALL_BIN_DIR'], process_env.get('PATH', '')])
+    env.Cprint('[info] training: %s' % training, 'green')
+    returncode = subprocess.call(training, shell=True, cwd=dirs['INSTALL_BIN_DIR'],
+                                 env=process_env)
+    if returncode:
+        env.cerror('[error] the training command failed with exit code %d.' % returncode)
+        return False
+    return True
+
+
+def _HasProfile(profile_dir):
+    for (root, dirnames, filenames) in os.walk(profile_dir):
+        if any(x.endswith('.gcda') for x in filenames):
+            return True
+    return False
+
+
+def _GetSourcesSignature(graph, names, extra):
+    """
+        Returns the signature of the sources and headers of the components
+        and of their dependencies (the external ones are not included).
+    """
+    components = set(names)
+    for name in names:
+        components.update(graph.engine.GetDependencies(name))
+    files = set()
+    for name in components:
+        component = graph.get(name)
+        if component is None or isinstance(component, ExternalComponent):
+            continue
+        if isinstance(component, SourcedComponent):
+            files.update(x.srcnode().abspath for x in component.GetSourcesFiles())
+        if isinstance(component, HeaderOnlyComponent):
+            files.update(x.srcnode().abspath for x in component.GetIncludeFiles())
+    sha1 = hashlib.sha1(extra)
+    for path in sorted(files):
+        sha1.update('%s\0' % path)
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(_BLOCK_SIZE), ''):
+                    sha1.update(block)
+        except IOError:
+            sha1.update('missing')
+    return sha1.hexdigest()
@@ -0,0 +1,180 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module measures the phases of fbuild itself (--phase-times=FILE).
+
+    The phases are:
+
+      - setup: from the start of the SConstruct to the reading of the
+        SConscripts (the options, the builders, the external dependencies).
+      - read: WalkDirsForSconscripts() loading the component graph.
+      - process: the Process() of the components needed by the targets.
+      - closures: the time spent in GetIncludePaths() and GetLibs(), it is
+        part of the process phase.
+      - build: from the end of the SConstruct to the end of the build, for a
+        build with nothing to do this is the up-to-date check of SCons.
+
+    When the build ends the times (in seconds), the number of calls of the
+    closures and the number of components are written in JSON, so they can
+    be compared between versions of fbuild (see bin/phase-benchmark.py).
+"""
+
+
+import atexit
+import json
+import os
+import time
+
+from SCons.Script import COMMAND_LINE_TARGETS
+
+
+# The phases, in order.
+PHASES = ['setup', 'read', 'process', 'closures', 'build']
+# The methods of the components measured as the closures phase.
+CLOSURES = ['GetIncludePaths', 'GetLibs']
+
+# The time of each phase, and the start of the phases running.
+_times = dict((phase, 0.0) for phase in PHASES)
+_started = {}
+# The number of calls of each closure method.
+_calls = dict((method, 0) for method in CLOSURES)
+# Other values of the report (like the number of components).
+_values = {}
+# The time when the measure started, None if it is disabled.
+_start = None
+
+
+def init(env):
+    """
+        Description:
+            Starts measuring the phases if the --phase-times option was given.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    global _start
+    path = env.GetOption('phase_times')
+    if not path or _start is not None:
+        return
+    _start = time.time()
+    _started['setup'] = _start
+    # Imported here, the module must be initialized before the components.
+    from core_components import Component
+    for method in CLOSURES:
+        setattr(Component, method, _Measured(method, getattr(Component, method)))
+    atexit.register(_Write, env, os.path.abspath(path))
+
+
+def Begin(phase):
+    """
+        Description:
+            Marks the start of a phase.
+        Arguments:
+            phase  -  One of PHASES.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    if _start is None:
+        return
+    now = time.time()
+    # The setup ends when other phase begins.
+    if 'setup' in _started:
+        _times['setup'] += now - _started.pop('setup')
+    _started[phase] = now
+
+
+def End(phase):
+    """
+        Description:
+            Marks the end of a phase.
+        Arguments:
+            phase  -  One of PHASES.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    if _start is None or phase not in _started:
+        return
+    _times[phase] += time.time() - _started.pop(phase)
+
+
+def SetValue(name, value):
+    """
+        Description:
+            Adds a value to the report, like the number of components.
+        Arguments:
+            name   -  The name of the value.
+            value  -  The value (it must be serializable to JSON).
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    _values[name] = value
+
+
+def _Measured(method, function):
+    """Returns the method that adds its time to the closures phase."""
+    # The closures may call each other, only the outermost call is measured.
+    depth = [0]
+
+    def Wrapper(self, *args, **kwargs):
+        _calls[method] += 1
+        if depth[0]:
+            return function(self, *args, **kwargs)
+        depth[0] += 1
+        start = time.time()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            _times['closures'] += time.time() - start
+            depth[0] -= 1
+    Wrapper.__name__ = function.__name__
+    Wrapper.__doc__ = function.__doc__
+    return Wrapper
+
+
+def _Write(env, path):
+    """Writes the report of the phases."""
+    end = time.time()
+    for phase in _started.keys():
+        End(phase)
+    report = {
+        'phases': dict(_times),
+        'calls': dict(_calls),
+        'total': end - _start,
+        'targets': list(COMMAND_LINE_TARGETS),
+    }
+    report.update(_values)
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    env.Cprint('[info] phase times written to %s' % path, 'green')
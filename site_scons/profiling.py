@@ -0,0 +1,298 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module profiles a project (<project>:profile).
+
+    The project is built in the 'profile-<profiler>-<type>' variant (see
+    variants.py) with --instrument, for gprof (-pg) or for perf (frame
+    pointers). Then its workload runs: the training command of the project,
+    or its tests, or the program. The reports are written in
+    INSTALL_REPORTS_DIR/profile/<project>:
+
+      - flat-profile.txt: the time spent in each function.
+      - call-graph.txt: the callers and callees of each function.
+      - stacks.folded: the stacks with their time, one per line, that the
+        flame graph tools (like flamegraph.pl) render. perf records the
+        whole stacks; gprof only records the callers of each function, so
+        its stacks are rebuilt splitting the time of each function among
+        its callers.
+"""
+
+
+import collections
+import glob
+import os
+import re
+import subprocess
+from distutils.spawn import find_executable
+
+from compiler import INSTRUMENT_GPROF, INSTRUMENT_PERF
+from core_components import ProgramComponent
+import variants
+
+
+# The value of --profiler that takes perf if it is installed.
+PROFILER_AUTO = 'auto'
+# The build types optimized, the others are profiled as 'opt'.
+OPTIMIZED_TYPES = ['opt', 'lto']
+# The files of the report.
+FLAT_PROFILE_FILE = 'flat-profile.txt'
+CALL_GRAPH_FILE = 'call-graph.txt'
+FOLDED_STACKS_FILE = 'stacks.folded'
+# The frequency of the samples of perf (per second).
+PERF_FREQUENCY = 999
+# The deepest stack rebuilt from the call graph of gprof.
+_MAX_GPROF_DEPTH = 64
+# A function of the call graph of gprof: '[3]  66.7  0.00  0.37  2  a [3]'.
+_GPROF_PRIMARY_RE = re.compile(
+    r'^\[(\d+)\]\s+[\d.]+\s+([\d.]+)\s+([\d.]+)\s+(?:[\d+]+\s+)?(.*?)\s+\[\d+\]$')
+# A caller or a callee of a function: '  0.37  0.00  2/3  leaf [1]'.
+_GPROF_ARC_RE = re.compile(r'^\s+([\d.]+)\s+([\d.]+)\s+(?:[\d+/]+\s+)?(.*?)\s+\[(\d+)\]$')
+# An offset in a frame of perf script: 'main+0x1f'.
+_PERF_OFFSET_RE = re.compile(r'\+0x[0-9a-f]+$')
+
+
+def GetProfiler(env):
+    """
+        Description:
+            Gets the profiler chosen with the --profiler option.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            INSTRUMENT_GPROF or INSTRUMENT_PERF.
+    """
+    profiler = env.GetOption('profiler') or PROFILER_AUTO
+    if profiler == PROFILER_AUTO:
+        profiler = INSTRUMENT_PERF if find_executable('perf') else INSTRUMENT_GPROF
+    return profiler
+
+
+def Run(env, graph, project, training=None):
+    """
+        Description:
+            Builds a project for profiling, runs its workload and writes the
+            reports.
+        Arguments:
+            env       -  The SCons environment.
+            graph     -  The graph of components.
+            project   -  The name of the project.
+            training  -  A command that runs the program, in the directory of
+                         the installed programs of the variant, or None to run
+                         the tests of the project (or the program if it has no
+                         tests).
+        Exceptions:
+            None.
+        Return:
+            True if the reports were written.
+    """
+    profiler = GetProfiler(env)
+    if not find_executable(profiler):
+        env.cerror('[error] %s is not installed.' % profiler)
+        return False
+    build_type = env.GetOption('type')
+    if build_type not in OPTIMIZED_TYPES:
+        build_type = 'opt'
+    variant = 'profile-%s-%s' % (profiler, build_type)
+    dirs = variants.GetVariantDirs(env, variant)
+    test = graph.get('%s@test' % project)
+    process_env = dict(os.environ)
+    process_env['LD_LIBRARY_PATH'] = dirs['INSTALL_LIB_DIR']
+    process_env['PATH'] = os.pathsep.join([dirs['INSTALL_BIN_DIR'], process_env.get('PATH', '')])
+    if training is None and test is not None:
+        # The test executable, in the build directory of the variant.
+        test_dir = os.path.relpath(test._dir.abspath, env.Dir('$BUILD_DIR').abspath)
+        test_dir = os.path.join(dirs['BUILD_DIR'], test_dir)
+        program = os.path.join(test_dir, '%s_test' % project)
+        # The test target, so the program is linked into its test.
+        (target, cwd) = ('%s:test' % project, test_dir)
+        cmd = [program, '--gtest_filter=%s' % env.GetOption('testsuite')]
+        process_env['GTEST_DEATH_TEST_USE_FORK'] = '1'
+    elif isinstance(graph.get(project), ProgramComponent):
+        program = os.path.join(dirs['INSTALL_BIN_DIR'], project)
+        (target, cwd) = (project, dirs['INSTALL_BIN_DIR'])
+        cmd = ['sh', '-c', training] if training is not None else [program]
+    else:
+        env.cerror('[error] %s has no tests nor training command to profile.' % project)
+        return False
+    options = {'--type': build_type, '--instrument': profiler}
+    if variants.RunVariant(env, variant, [target], options):
+        env.cerror('[error] the build of %s for profiling failed.' % project)
+        return False
+    report_dir = os.path.join(env.Dir('$INSTALL_REPORTS_DIR').abspath, 'profile', project)
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    env.Cprint('[info] profiling with %s: %s' % (profiler, ' '.join(cmd)), 'green')
+    if profiler == INSTRUMENT_GPROF:
+        reports = _RunGprof(env, program, cmd, cwd, process_env, report_dir)
+    else:
+        reports = _RunPerf(env, cmd, cwd, process_env, report_dir)
+    if reports is None:
+        return False
+    (flat_profile, call_graph, stacks) = reports
+    for (filename, text) in [(FLAT_PROFILE_FILE, flat_profile), (CALL_GRAPH_FILE, call_graph),
+                             (FOLDED_STACKS_FILE, _FormatStacks(stacks))]:
+        with open(os.path.join(report_dir, filename), 'w') as f:
+            f.write(text)
+    print '\n'.join(flat_profile.splitlines()[:20])
+    env.Cprint('[info] profile of %s written to %s' % (project, report_dir), 'green')
+    return True
+
+
+def _RunGprof(env, program, cmd, cwd, process_env, report_dir):
+    """Runs the workload and the reports of gprof."""
+    prefix = os.path.join(report_dir, 'gmon.out')
+    for path in glob.glob(prefix + '.*'):
+        os.remove(path)
+    # Each process writes its gmon.out.<pid>.
+    process_env['GMON_OUT_PREFIX'] = prefix
+    returncode = subprocess.call(cmd, cwd=cwd, env=process_env)
+    if returncode:
+        env.cwarn('[warn] the workload finished with exit code %d.' % returncode)
+    profiles = sorted(glob.glob(prefix + '.*'))
+    if not profiles:
+        env.cerror('[error] the workload did not write a profile (%s.*).' % prefix)
+        return None
+    try:
+        flat_profile = _Output(['gprof', '-b', '-p', program] + profiles)
+    except (OSError, subprocess.CalledProcessError), error:
+        env.cerror('[error] gprof failed: %s' % error)
+        return None
+    # gprof fails when the workload called no instrumented function, the
+    # flat profile is kept anyway.
+    try:
+        call_graph = _Output(['gprof', '-b', '-q', program] + profiles)
+    except (OSError, subprocess.CalledProcessError), error:
+        reason = getattr(error, 'output', None) or error
+        env.cwarn('[warn] gprof wrote no call graph: %s' % reason)
+        call_graph = ''
+    return (flat_profile, call_graph, _FoldGprofCallGraph(call_graph))
+
+
+def _RunPerf(env, cmd, cwd, process_env, report_dir):
+    """Runs the workload with perf record and the reports of perf."""
+    data = os.path.join(report_dir, 'perf.data')
+    record = ['perf', 'record', '-F', str(PERF_FREQUENCY), '-g', '-o', data, '--'] + cmd
+    returncode = subprocess.call(record, cwd=cwd, env=process_env)
+    if returncode:
+        env.cwarn('[warn] the workload finished with exit code %d.' % returncode)
+    if not os.path.exists(data):
+        env.cerror('[error] perf did not write %s.' % data)
+        return None
+    try:
+        flat_profile = _Output(['perf', 'report', '-i', data, '--stdio', '--no-children',
+                                '-g', 'none', '--sort', 'symbol'])
+        call_graph = _Output(['perf', 'report', '-i', data, '--stdio', '--children',
+                              '-g', 'caller', '--sort', 'symbol'])
+        script = _Output(['perf', 'script', '-i', data])
+    except (OSError, subprocess.CalledProcessError), error:
+        env.cerror('[error] perf failed: %s' % error)
+        return None
+    return (flat_profile, call_graph, _FoldPerfScript(script))
+
+
+def _FoldPerfScript(script):
+    """
+        Returns the folded stacks (stack -> samples) of the output of perf
+        script: each sample is a header line followed by its frames, the
+        innermost first, and an empty line.
+    """
+    stacks = collections.defaultdict(int)
+    frames = None
+    for line in script.splitlines() + ['']:
+        if not line.strip():
+            if frames:
+                stacks[';'.join(reversed(frames))] += 1
+            frames = None
+        elif not line[0].isspace():
+            frames = []
+        elif frames is not None:
+            # '<address> <symbol>+<offset> (<library>)'
+            parts = line.strip().split(None, 1)
+            symbol = parts[1].rsplit(' (', 1)[0] if len(parts) > 1 else parts[0]
+            frames.append(_PERF_OFFSET_RE.sub('', symbol).replace(';', ':'))
+    return stacks
+
+
+def _FoldGprofCallGraph(call_graph):
+    """
+        Returns the folded stacks (stack -> milliseconds) rebuilt from the
+        call graph of gprof: the time of each function is split among its
+        callers as gprof does, from the functions that have no callers.
+    """
+    functions = {}
+    callees = collections.defaultdict(list)
+    has_callers = set()
+    for block in call_graph.split('-----'):
+        (primary, arcs) = (None, [])
+        for line in block.splitlines():
+            match = _GPROF_PRIMARY_RE.match(line)
+            if match:
+                primary = match.group(1)
+                functions[primary] = (match.group(4).replace(';', ':'),
+                                      float(match.group(2)), float(match.group(3)))
+                continue
+            match = _GPROF_ARC_RE.match(line)
+            if match:
+                arcs.append((primary, match.group(4),
+                             float(match.group(1)) + float(match.group(2))))
+        for (function, other, time) in arcs:
+            # The arcs before the function are its callers.
+            if function is None:
+                has_callers.add(primary)
+            else:
+                callees[function].append((other, time))
+    stacks = collections.defaultdict(int)
+
+    def Walk(index, path, weight):
+        (name, own, children) = functions[index]
+        path = path + [name]
+        samples = int(round(own * weight * 1000))
+        if samples:
+            stacks[';'.join(path)] += samples
+        if len(path) >= _MAX_GPROF_DEPTH:
+            return
+        for (callee, time) in callees[index]:
+            if callee not in functions or functions[callee][0] in path:
+                continue
+            total = functions[callee][1] + functions[callee][2]
+            if total > 0:
+                Walk(callee, path, weight * time / total)
+
+    for index in functions:
+        if index not in has_callers:
+            Walk(index, [], 1.0)
+    return stacks
+
+
+def _FormatStacks(stacks):
+    return ''.join('%s %d\n' % (stack, count) for (stack, count) in sorted(stacks.items()))
+
+
+def _Output(cmd):
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, error) = process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, ' '.join(cmd), error.strip())
+    return output
@@ -30,6 +30,8 @@ from multiprocessing import cpu_count
 
 from SCons.Variables import PathVariable
 
+import variants
+
 
 INC_PATH_PREFIX = '-I'
 LINK_PATH_PREFIX = '-L'
@@ -42,7 +44,11 @@ def init(env, vars):
         env.SetOption('num_jobs', cpu_count() + 1)
     # Some environment tunnings so this runs faster
     env.Decider('MD5-timestamp')
-    env.SConsignFile()
+    # The variants (see variants.py) keep their signatures apart.
+    if variants.GetVariantName():
+        env.SConsignFile('.sconsign-%s' % variants.GetVariantName())
+    else:
+        env.SConsignFile()
     # Let the default to do nothing
     env.Default()
     # Get the scons root path, this can be tricky because
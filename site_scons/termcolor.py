@@ -48,6 +48,7 @@ if not sys.stdout.isatty():
 
 copy_message = '%s[copy] $SOURCES to $TARGETS%s' % (colors['blue'], colors['end'])
 compile_source_message = '%s[compiling] $SOURCE%s' % (colors['blue'], colors['end'])
+precompile_header_message = '%s[precompiling] $SOURCE%s' % (colors['blue'], colors['end'])
 link_program_message = '%s[linking program] $TARGET%s' % (colors['cyan'], colors['end'])
 link_library_message = '%s[linking static] $TARGET%s' % (colors['cyan'], colors['end'])
 link_shared_library_message = '%s[linking shared] $TARGET%s' % (colors['cyan'], colors['end'])
@@ -102,6 +103,7 @@ def PrettyMessages(env):
     env['CXXCOMSTR'] = compile_source_message
     env['SHCCCOMSTR'] = compile_source_message
     env['SHCXXCOMSTR'] = compile_source_message
+    env['PCHCOMSTR'] = precompile_header_message
     env['ARCOMSTR'] = link_library_message
     env['RANLIBCOMSTR'] = ranlib_library_message
     env['SHLINKCOMSTR'] = link_shared_library_message
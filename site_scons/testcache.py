@@ -0,0 +1,209 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module contains the cache of the results of the tests.
+
+    When a test executable passes, its output and its xml report are stored
+    under a key computed from everything that can change its result: the
+    contents of the executable and of the shared libraries it loads, the
+    files of its 'ref' directory, the command (with the --testsuite filter)
+    and the environment variables that gtest and the dynamic linker read.
+    The next time the same test would run, the stored result is replayed
+    instead. Failures are never stored.
+"""
+
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+
+
+# The name of the directory (inside the BUILD_DIR) where the results are
+# stored.
+CACHE_DIR = 'testcache'
+# Change this number when the format of the cache or the key change.
+CACHE_VERSION = 1
+# The maximum number of results kept, the oldest are removed.
+MAX_ENTRIES = 1000
+# The valid values for the --test-cache option.
+MODE_ON = 'on'
+MODE_OFF = 'off'
+MODES = [MODE_ON, MODE_OFF]
+# The files of each entry.
+_OUTPUT_FILE = 'output.txt'
+_REPORT_FILE = 'test-report.xml'
+# The environment variables (besides GTEST_*) that can change the result of
+# a test.
+_ENV_VARS = ['LD_LIBRARY_PATH', 'LD_PRELOAD']
+# A line of ldd with a library found: 'libfoo.so.1 => /path/libfoo.so.1 (0x...)'.
+_LDD_RE = re.compile(r'=>\s*(/\S+)')
+# The size of the blocks read to hash a file.
+_BLOCK_SIZE = 1 << 20
+
+
+class TestCache(object):
+    """
+        This class stores and replays the results of the tests that passed.
+    """
+
+    def __init__(self, env):
+        self._dir = os.path.join(env['BUILD_DIR'], CACHE_DIR)
+
+    #
+    # Public methods.
+    #
+
+    def GetKey(self, program, ref_dirs, cmd, test_env):
+        """
+            Description:
+                Computes the key of the result of a test.
+            Arguments:
+                program   -  The path to the test executable.
+                ref_dirs  -  A list with the paths to the 'ref' directories
+                             of the test (in the build and source trees).
+                cmd       -  A string with the command that runs the test.
+                test_env  -  A dictionary with the variables added to the
+                             environment of the test.
+            Exceptions:
+                None.
+            Return:
+                A string.
+        """
+        sha1 = hashlib.sha1()
+        sha1.update('%d\0%s\0' % (CACHE_VERSION, cmd))
+        # The report is not part of the result, only where it is written.
+        variables = dict((k, v) for (k, v) in os.environ.items()
+                         if k.startswith('GTEST_') or k in _ENV_VARS)
+        variables.update(test_env)
+        variables.pop('GTEST_OUTPUT', None)
+        for name in sorted(variables):
+            sha1.update('%s=%s\0' % (name, variables[name]))
+        for path in [program] + _GetSharedLibraries(program):
+            sha1.update('%s\0%s\0' % (path, _HashFile(path)))
+        for ref_dir in ref_dirs:
+            for (root, dirnames, filenames) in os.walk(ref_dir):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(root, filename)
+                    sha1.update('%s\0%s\0' % (path, _HashFile(path)))
+        return sha1.hexdigest()
+
+    def Load(self, key, report):
+        """
+            Description:
+                Gets the result of a test that passed, and restores its
+                report.
+            Arguments:
+                key     -  The key returned by GetKey().
+                report  -  The path where the xml report must be restored, or
+                           None if it is not needed.
+            Exceptions:
+                None.
+            Return:
+                A string with the output of the test, or None if the result
+                is not stored (or it has no report and the report is needed).
+        """
+        entry = os.path.join(self._dir, key)
+        cached_report = os.path.join(entry, _REPORT_FILE)
+        try:
+            with open(os.path.join(entry, _OUTPUT_FILE)) as f:
+                output = f.read()
+            if report is not None:
+                if not os.path.exists(cached_report):
+                    return None
+                directory = os.path.dirname(report)
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                shutil.copyfile(cached_report, report)
+            # Mark the entry as used, the oldest ones are removed first.
+            os.utime(entry, None)
+        except (IOError, OSError):
+            return None
+        return output
+
+    def Store(self, key, output, report):
+        """
+            Description:
+                Stores the result of a test that passed.
+            Arguments:
+                key     -  The key returned by GetKey().
+                output  -  A string with the output of the test.
+                report  -  The path to the xml report written by the test, or
+                           None if it was not written.
+            Exceptions:
+                None.
+            Return:
+                None.
+        """
+        entry = os.path.join(self._dir, key)
+        # Write to a temporal directory and rename it, so an interrupted run
+        # does not leave a broken entry.
+        tmp = '%s.%d' % (entry, os.getpid())
+        try:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, _OUTPUT_FILE), 'w') as f:
+                f.write(output)
+            if report is not None and os.path.exists(report):
+                shutil.copyfile(report, os.path.join(tmp, _REPORT_FILE))
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+            self._Prune()
+        except (IOError, OSError):
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    #
+    # Private methods.
+    #
+
+    def _Prune(self):
+        """Removes the least recently used entries beyond MAX_ENTRIES."""
+        entries = [os.path.join(self._dir, x) for x in os.listdir(self._dir)]
+        if len(entries) <= MAX_ENTRIES:
+            return
+        entries.sort(key=os.path.getmtime)
+        for entry in entries[:len(entries) - MAX_ENTRIES]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _HashFile(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _GetSharedLibraries(program):
+    """Returns the paths to the shared libraries that the program loads."""
+    try:
+        process = subprocess.Popen(['ldd', program], stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    except OSError:
+        return []
+    output = process.communicate()[0]
+    return sorted(set(path for path in _LDD_RE.findall(output) if os.path.isfile(path)))
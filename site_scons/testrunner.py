@@ -0,0 +1,337 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module runs the test executables of the unit test components.
+
+    SCons runs the tests of different projects at the same time (up to the
+    number of jobs given with -j), so the output of each test executable is
+    captured and printed all at once when it finishes. When the build ends a
+    summary of all the tests that were run is printed.
+"""
+
+
+import atexit
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from xml.dom import minidom
+
+from termcolor import Cformat, Cprint
+
+
+# The line that gtest prints at the end of each test case (suite).
+_SUITE_END_RE = re.compile(r'^\[-+\] \d+ tests? from (\S+) \((\d+) ms total\)', re.M)
+# The colors of gtest (GTEST_COLOR), removed before looking for the suites.
+_COLOR_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class TestResult(object):
+    """
+        This class holds the result of the execution of a test executable.
+    """
+
+    def __init__(self, name, returncode, wall_time, output, cached=False):
+        # The name of the project.
+        self.name = name
+        # The exit code of the test executable.
+        self.returncode = returncode
+        # The time (in seconds) that the executable was running.
+        self.wall_time = wall_time
+        # The output of the executable ('' if it was not captured).
+        self.output = output
+        # True if the result was taken from the cache of test results.
+        self.cached = cached
+        # The gtest suites found in the output, as (name, seconds) tuples. A
+        # suite may be split among several shards, so its times are added.
+        self.suites = []
+        times = {}
+        for (suite, ms) in _SUITE_END_RE.findall(_COLOR_RE.sub('', output)):
+            if suite not in times:
+                self.suites.append(suite)
+                times[suite] = 0.0
+            times[suite] += int(ms) / 1000.0
+        self.suites = [(suite, times[suite]) for suite in self.suites]
+
+    def Passed(self):
+        return self.returncode == 0
+
+
+class TestRunner(object):
+    """
+        This class runs test executables and keeps their results, so a
+        summary can be printed at the end of the build.
+
+        The Run() method may be called from several threads at the same time.
+    """
+
+    #
+    # Private attributes.
+    #
+    # The lock that serializes the writes to the terminal and the results.
+    _lock = None
+    # A list with the results of the executed tests (TestResult instances).
+    _results = None
+    # The time when the first test started.
+    _start = None
+    # True if the time of each gtest suite is shown in the summary.
+    _verbose = False
+
+    #
+    # Special methods.
+    #
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = []
+
+    #
+    # Public methods.
+    #
+
+    def Run(self, env, name, test_dir, cmd, test_env=None, capture=True, shards=1):
+        """
+            Description:
+                Runs a test executable and prints its output and result.
+            Arguments:
+                env       -  The environment of the test component.
+                name      -  A string with the name of the project.
+                test_dir  -  The directory where the command is executed.
+                cmd       -  A string with the command (run by a shell).
+                test_env  -  A dictionary with the variables added to the
+                             environment of the process (for instance
+                             GTEST_OUTPUT).
+                capture   -  False if the process needs the terminal (for
+                             instance when it runs under gdb), so its output
+                             is not captured.
+                shards    -  The number of processes that run the executable
+                             at the same time, each one with a part of the
+                             gtest tests. Ignored if the output is not
+                             captured.
+            Exceptions:
+                None.
+            Return:
+                A TestResult instance.
+        """
+        # Each process gets its own environment, os.environ is shared by all
+        # the threads of SCons.
+        process_env = dict(os.environ)
+        process_env.update(test_env or {})
+        self._Start(env)
+        start = time.time()
+        if capture:
+            # Keep the colors of gtest although its output is a pipe.
+            if sys.stdout.isatty():
+                process_env.setdefault('GTEST_COLOR', 'yes')
+            (returncode, output) = self._RunShards(cmd, test_dir, process_env, shards)
+        else:
+            with self._lock:
+                Cprint('\n=== Running TESTS of %s ===\n' % name, 'green')
+            returncode = subprocess.call(cmd, shell=True, cwd=test_dir, env=process_env)
+            output = ''
+        result = TestResult(name, returncode, time.time() - start, output)
+        self._Finish(result, capture)
+        return result
+
+    def Replay(self, env, name, output):
+        """
+            Description:
+                Prints the output of a test that passed in a previous run
+                (taken from the cache of test results).
+            Arguments:
+                env     -  The environment of the test component.
+                name    -  A string with the name of the project.
+                output  -  A string with the output of the test.
+            Exceptions:
+                None.
+            Return:
+                A TestResult instance.
+        """
+        self._Start(env)
+        result = TestResult(name, 0, 0.0, output, cached=True)
+        self._Finish(result, True)
+        return result
+
+    def _Start(self, env):
+        """Registers the summary when the first test starts."""
+        with self._lock:
+            if self._start is None:
+                self._start = time.time()
+                self._verbose = env.GetOption('verbose')
+                atexit.register(self.PrintSummary)
+
+    def _Finish(self, result, printOutput):
+        """Keeps the result of a test and prints it."""
+        cached = ' (cached)' if result.cached else ''
+        with self._lock:
+            self._results.append(result)
+            if printOutput:
+                Cprint('\n=== Running TESTS of %s%s ===\n' % (result.name, cached), 'green')
+                sys.stdout.write(result.output)
+            if result.Passed():
+                Cprint('\n\nTest result (%s): *** PASSED *** (%.2f s)%s\n\n' %
+                       (result.name, result.wall_time, cached), 'green')
+            else:
+                Cprint('\n\nTest result (%s): *** FAILED *** (%.2f s)\n\n' %
+                       (result.name, result.wall_time), 'red')
+            sys.stdout.flush()
+
+    def _RunShards(self, cmd, test_dir, process_env, shards):
+        """
+            Runs the shards of a test executable at the same time. Returns
+            the exit code (not zero if a shard failed) and the output of all
+            the shards. The reports of the shards are merged.
+        """
+        report = process_env.get('GTEST_OUTPUT')
+        processes = []
+        for index in range(shards):
+            shard_env = dict(process_env)
+            if shards > 1:
+                shard_env['GTEST_TOTAL_SHARDS'] = str(shards)
+                shard_env['GTEST_SHARD_INDEX'] = str(index)
+                if report:
+                    shard_env['GTEST_OUTPUT'] = _GetShardReport(report, index)
+            # A file is used instead of a pipe, so no shard waits until the
+            # output of the previous ones is read.
+            output_file = tempfile.TemporaryFile()
+            process = subprocess.Popen(cmd, shell=True, cwd=test_dir, env=shard_env,
+                                       stdout=output_file, stderr=subprocess.STDOUT)
+            processes.append((process, output_file))
+        returncode = 0
+        outputs = []
+        for (index, (process, output_file)) in enumerate(processes):
+            returncode = process.wait() or returncode
+            output_file.seek(0)
+            if shards > 1:
+                outputs.append('--- shard %d/%d ---\n' % (index + 1, shards))
+            outputs.append(output_file.read())
+            output_file.close()
+        if shards > 1 and report:
+            MergeTestReports([_GetShardReport(report, i) for i in range(shards)], report)
+        return (returncode, ''.join(outputs))
+
+    def GetResults(self):
+        return list(self._results)
+
+    def PrintSummary(self):
+        """Prints the result and the time of every test that was run."""
+        if not self._results:
+            return
+        total_time = time.time() - self._start
+        passed = [r for r in self._results if r.Passed()]
+        failed = [r for r in self._results if not r.Passed()]
+        Cprint('\n=== TESTS SUMMARY ===\n', 'green')
+        for result in sorted(self._results, key=lambda r: r.name):
+            if result.cached:
+                status = Cformat('PASSED (cached)', 'green')
+            elif result.Passed():
+                status = Cformat('PASSED', 'green')
+            else:
+                status = Cformat('FAILED (exit code %d)' % result.returncode, 'red')
+            print '  %-30s %8.2f s  %s' % (result.name, result.wall_time, status)
+            # The time of each gtest suite is only shown in verbose mode.
+            if self._verbose:
+                for (suite, seconds) in result.suites:
+                    print '      %-26s %8.2f s' % (suite, seconds)
+        cached = len([r for r in self._results if r.cached])
+        color = 'red' if failed else 'green'
+        Cprint('\n%d passed (%d cached), %d failed, wall time %.2f s (%.2f s running tests)\n' %
+               (len(passed), cached, len(failed), total_time,
+                sum(r.wall_time for r in self._results)), color)
+        sys.stdout.flush()
+
+
+# The runner used by the RunUnittest() builders.
+_runner = TestRunner()
+
+
+def _GetShardReport(report, index):
+    """Returns the GTEST_OUTPUT value for a shard (xml:<report>-shard<i>.xml)."""
+    (root, ext) = os.path.splitext(report)
+    return '%s-shard%d%s' % (root, index, ext)
+
+
+def MergeTestReports(reports, target):
+    """
+        Description:
+            Merges the xml reports written by the shards of a test executable
+            into a single report. The counters of the <testsuites> elements
+            are added, and the reports of the shards are removed.
+        Arguments:
+            reports  -  A list with the GTEST_OUTPUT values of the shards.
+            target   -  The GTEST_OUTPUT value of the merged report.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    merged = None
+    for report in reports:
+        path = report.split(':', 1)[-1]
+        # A shard that crashed may not have written its report.
+        if not os.path.exists(path):
+            continue
+        document = minidom.parse(path)
+        os.remove(path)
+        root = document.documentElement
+        if merged is None:
+            merged = document
+            continue
+        merged_root = merged.documentElement
+        for attr in ['tests', 'failures', 'disabled', 'errors']:
+            if root.hasAttribute(attr):
+                total = int(merged_root.getAttribute(attr) or 0) + int(root.getAttribute(attr))
+                merged_root.setAttribute(attr, str(total))
+        # The shards run at the same time, so the time is the longest one.
+        if root.hasAttribute('time'):
+            longest = max(float(merged_root.getAttribute('time') or 0),
+                          float(root.getAttribute('time')))
+            merged_root.setAttribute('time', str(longest))
+        for suite in root.getElementsByTagName('testsuite'):
+            merged_root.appendChild(merged.importNode(suite, True))
+    target = target.split(':', 1)[-1]
+    if merged is not None:
+        with open(target, 'w') as f:
+            f.write(merged.toxml('UTF-8'))
+    elif os.path.exists(target):
+        # Do not leave the report of a previous run.
+        os.remove(target)
+
+
+def ReplayTest(env, name, output):
+    """Prints the cached output of a test. See TestRunner.Replay()."""
+    return _runner.Replay(env, name, output)
+
+
+def RunTest(env, name, test_dir, cmd, test_env=None, capture=True, shards=1):
+    """
+        Description:
+            Runs a test executable with the runner shared by all the test
+            components. See TestRunner.Run().
+        Return:
+            A TestResult instance.
+    """
+    return _runner.Run(env, name, test_dir, cmd, test_env, capture, shards)
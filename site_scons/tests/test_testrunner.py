@@ -0,0 +1,87 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    Tests of the parsing of the gtest output in testrunner.py.
+
+    Run them from the fbuild directory with:
+
+        python -m unittest discover -s site_scons/tests
+"""
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testrunner import TestResult
+
+
+# The output of a gtest executable with GTEST_COLOR=yes.
+COLORED_OUTPUT = '\n'.join([
+    'Running main() from gtest_main.cc',
+    '\x1b[0;32m[==========] \x1b[mRunning 3 tests from 2 test suites.',
+    '\x1b[0;32m[----------] \x1b[mGlobal test environment set-up.',
+    '\x1b[0;32m[----------] \x1b[m2 tests from Foo',
+    '\x1b[0;32m[ RUN      ] \x1b[mFoo.A',
+    '\x1b[0;32m[       OK ] \x1b[mFoo.A (1 ms)',
+    '\x1b[0;32m[ RUN      ] \x1b[mFoo.B',
+    '\x1b[0;32m[       OK ] \x1b[mFoo.B (2 ms)',
+    '\x1b[0;32m[----------] \x1b[m2 tests from Foo (3 ms total)',
+    '',
+    '\x1b[0;32m[----------] \x1b[m1 test from Bar',
+    '\x1b[0;32m[ RUN      ] \x1b[mBar.C',
+    '\x1b[0;32m[       OK ] \x1b[mBar.C (1500 ms)',
+    '\x1b[0;32m[----------] \x1b[m1 test from Bar (1500 ms total)',
+    '',
+    '\x1b[0;32m[----------] \x1b[mGlobal test environment tear-down',
+    '\x1b[0;32m[==========] \x1b[m3 tests from 2 test suites ran. (1503 ms total)',
+    '\x1b[0;32m[  PASSED  ] \x1b[m3 tests.',
+    ''])
+
+
+class TestResultSuitesTest(unittest.TestCase):
+
+    def testColoredOutput(self):
+        result = TestResult('project', 0, 1.6, COLORED_OUTPUT)
+        self.assertEqual(result.suites, [('Foo', 0.003), ('Bar', 1.5)])
+
+    def testPlainOutput(self):
+        plain = COLORED_OUTPUT.replace('\x1b[0;32m', '').replace('\x1b[m', '')
+        result = TestResult('project', 0, 1.6, plain)
+        self.assertEqual(result.suites, [('Foo', 0.003), ('Bar', 1.5)])
+
+    def testShardsAreAdded(self):
+        result = TestResult('project', 0, 3.2, COLORED_OUTPUT + COLORED_OUTPUT)
+        self.assertEqual(result.suites, [('Foo', 0.006), ('Bar', 3.0)])
+
+    def testOutputIsKept(self):
+        # The colors are only removed to find the suites, the output is
+        # replayed as it was printed.
+        result = TestResult('project', 0, 1.6, COLORED_OUTPUT)
+        self.assertEqual(result.output, COLORED_OUTPUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
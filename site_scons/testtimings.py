@@ -0,0 +1,253 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module keeps the history of the time taken by the tests.
+
+    After each test executable runs, its wall time and the time of each of
+    its gtest suites (from its xml report, or from its output if there is no
+    report) are stored in a SQLite database in the reports directory. The
+    history is used to run the slowest tests first, and to print the
+    all:test-timings report.
+"""
+
+
+import os
+import sqlite3
+import threading
+import time
+from xml.dom import minidom
+
+from termcolor import Cformat
+
+
+# The name of the database (inside INSTALL_REPORTS_DIR/test).
+DATABASE_FILE = 'timings.sqlite'
+# The name of the report (inside INSTALL_REPORTS_DIR/test).
+REPORT_FILE = 'timings.txt'
+# The target that prints the report.
+TIMINGS_TARGET = 'all:test-timings'
+# The number of runs averaged to estimate the time of a test.
+HISTORY_RUNS = 5
+# The number of suites listed in the report.
+REPORT_SUITES = 20
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS binaries (
+           project TEXT, started REAL, wall_time REAL, passed INTEGER, shards INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS suites (
+           project TEXT, started REAL, suite TEXT, seconds REAL, tests INTEGER,
+           failures INTEGER)''',
+    'CREATE INDEX IF NOT EXISTS binaries_project ON binaries (project, started)',
+    'CREATE INDEX IF NOT EXISTS suites_suite ON suites (project, suite, started)',
+]
+
+# The tests may finish at the same time, each one in a thread of SCons.
+_lock = threading.Lock()
+
+
+def GetDatabasePath(env):
+    return os.path.join(env.Dir('$INSTALL_REPORTS_DIR').abspath, 'test', DATABASE_FILE)
+
+
+def Record(env, result, shards, report=None):
+    """
+        Description:
+            Stores the times of a test executable that was run.
+        Arguments:
+            env     -  The environment of the test component.
+            result  -  The TestResult instance of the execution.
+            shards  -  The number of shards in which the test was split.
+            report  -  The path to the xml report written by the test, or
+                       None if there is no report.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    started = time.time() - result.wall_time
+    suites = None
+    if report is not None and os.path.exists(report):
+        try:
+            suites = _ParseReport(report)
+        except Exception:
+            # A test that crashed may leave a broken report.
+            suites = None
+    if suites is None:
+        suites = [(suite, seconds, None, None) for (suite, seconds) in result.suites]
+    with _lock:
+        try:
+            connection = _Connect(env)
+            with connection:
+                connection.execute('INSERT INTO binaries VALUES (?, ?, ?, ?, ?)',
+                                   (result.name, started, result.wall_time,
+                                    int(result.Passed()), shards))
+                connection.executemany('INSERT INTO suites VALUES (?, ?, ?, ?, ?, ?)',
+                                       [(result.name, started) + s for s in suites])
+            connection.close()
+        except sqlite3.Error, error:
+            env.cwarn('[warn] the test timings can not be stored: %s' % error)
+
+
+def GetExpectedTimes(env):
+    """
+        Description:
+            Estimates the time of each test executable, as the average of its
+            last runs.
+        Arguments:
+            env  -  The SCons environment.
+        Exceptions:
+            None.
+        Return:
+            A dictionary (project name -> seconds). The tests never run are
+            not included.
+    """
+    if not os.path.exists(GetDatabasePath(env)):
+        return {}
+    times = {}
+    try:
+        connection = _Connect(env)
+        rows = connection.execute(
+            'SELECT project, wall_time FROM binaries ORDER BY project, started DESC')
+        for (project, wall_time) in rows:
+            runs = times.setdefault(project, [])
+            if len(runs) < HISTORY_RUNS:
+                runs.append(wall_time)
+        connection.close()
+    except sqlite3.Error:
+        return {}
+    return dict((project, sum(runs) / len(runs)) for (project, runs) in times.items())
+
+
+def SortLongestFirst(env, graph, names):
+    """
+        Description:
+            Sorts the test components of a list of components by their
+            expected time, the slowest first, so they start running first.
+            The other components keep their places.
+        Arguments:
+            env    -  The SCons environment.
+            graph  -  The graph of components.
+            names  -  A list with the names of the components.
+        Exceptions:
+            None.
+        Return:
+            A new list with the names.
+    """
+    times = GetExpectedTimes(env)
+    if not times:
+        return list(names)
+    tests = [i for (i, name) in enumerate(names) if name.endswith('@test')]
+    # The tests never run go first, they may be the slowest.
+    ordered = sorted([names[i] for i in tests],
+                     key=lambda name: -times.get(name.split('@')[0], float('inf')))
+    result = list(names)
+    for (i, name) in zip(tests, ordered):
+        result[i] = name
+    return result
+
+
+def WriteReport(env, target):
+    """
+        Description:
+            Prints (and writes to a file) the slowest test suites, with the
+            trend of their times.
+        Arguments:
+            env     -  The SCons environment.
+            target  -  The path to the file of the report.
+        Exceptions:
+            None.
+        Return:
+            None.
+    """
+    if not os.path.exists(GetDatabasePath(env)):
+        env.cwarn('[warn] no test timings were recorded yet, run some tests first.')
+        return
+    connection = _Connect(env)
+    binaries = connection.execute(
+        'SELECT project, wall_time, passed, started FROM binaries b WHERE started = '
+        '(SELECT MAX(started) FROM binaries WHERE project = b.project) '
+        'ORDER BY wall_time DESC').fetchall()
+    last_runs = dict((project, started) for (project, _, _, started) in binaries)
+    history = {}
+    rows = connection.execute('SELECT project, suite, seconds, started FROM suites '
+                              'ORDER BY project, suite, started DESC')
+    for (project, suite, seconds, started) in rows:
+        # Only the suites of the last run of each test are listed.
+        if (project, suite) not in history and started != last_runs.get(project):
+            continue
+        runs = history.setdefault((project, suite), [])
+        if len(runs) <= HISTORY_RUNS:
+            runs.append(seconds)
+    connection.close()
+    lines = ['Slowest test executables (last run):', '']
+    lines.append('  %-30s %10s  %-8s %s' % ('project', 'time (s)', 'result', 'date'))
+    for (project, wall_time, passed, started) in binaries:
+        lines.append('  %-30s %10.2f  %-8s %s' % (
+            project, wall_time, 'PASSED' if passed else 'FAILED',
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(started))))
+    lines += ['', 'Slowest test suites (last run, average of the previous %d runs):' %
+              HISTORY_RUNS, '']
+    lines.append('  %-50s %10s %10s %8s' % ('project / suite', 'last (s)', 'avg (s)', 'trend'))
+    slowest = sorted(history.items(), key=lambda item: -item[1][0])[:REPORT_SUITES]
+    for ((project, suite), runs) in slowest:
+        (last, previous) = (runs[0], runs[1:])
+        if previous and sum(previous) > 0:
+            average = sum(previous) / len(previous)
+            trend = '%+7.0f%%' % ((last - average) / average * 100)
+            average = '%10.2f' % average
+        else:
+            (average, trend) = ('%10s' % '-', '%8s' % '-')
+        lines.append('  %-50s %10.2f %s %s' % ('%s / %s' % (project, suite), last, average, trend))
+    text = '\n'.join(lines) + '\n'
+    directory = os.path.dirname(target)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(target, 'w') as f:
+        f.write(text)
+    print Cformat('\n=== TESTS TIMINGS ===\n', 'green')
+    print text
+    print 'Report written to %s' % target
+
+
+def _Connect(env):
+    path = GetDatabasePath(env)
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # Other fbuild processes may be writing the database.
+    connection = sqlite3.connect(path, timeout=30)
+    for statement in _SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def _ParseReport(report):
+    """Returns the (suite, seconds, tests, failures) tuples of a gtest report."""
+    suites = []
+    document = minidom.parse(report)
+    for element in document.getElementsByTagName('testsuite'):
+        suites.append((element.getAttribute('name'),
+                       float(element.getAttribute('time') or 0),
+                       int(element.getAttribute('tests') or 0),
+                       int(element.getAttribute('failures') or 0)))
+    return suites
@@ -247,6 +247,28 @@ def FindHeaders(dirs):
     return ''.join('-I%s ' %x for x in out)
 
 
+def Git(args, cwd):
+    """
+    Description:
+        This function runs a git command and returns its output.
+    Arguments:
+        args  -  A list with the arguments of git.
+        cwd   -  The directory where git runs.
+    Exceptions:
+        subprocess.CalledProcessError if git fails, with the error it wrote.
+        OSError if git is not installed.
+    Return:
+        A string instance with the output of git.
+    """
+    process = subprocess.Popen(['git'] + args, cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    (output, error) = process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, 'git %s' % ' '.join(args),
+                                            error.strip())
+    return output
+
+
 def CheckPath(path, create=True):
     if not os.path.exists(path):
         if create:
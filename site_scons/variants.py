@@ -0,0 +1,131 @@
+# fudepan-build: The build system for FuDePAN projects
+#
+# Copyright (C) 2011-2012 Esteban Papp, Hugo Arregui,
+#               2013 Gonzalo Bonigo, Gustavo Ojeda, Matias Iturburu,
+#                    Leandro Moreno, FuDePAN
+#
+# This file is part of the fudepan-build build system.
+#
+# fudepan-build is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fudepan-build is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with fudepan-build.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+    This module builds targets in a variant of the workspace.
+
+    A variant is the same workspace built with other options (like the
+    instrumented build for profile-guided optimization). It is built by
+    other fbuild process, in its own build and install directories
+    (<BUILD_DIR>-<name> and <BUILD_DIR>-<name>/install) and with its own
+    signatures file, so it does not rebuild nor replace the files of the
+    normal build.
+"""
+
+
+import os
+import subprocess
+import sys
+
+from SCons.Script import ARGUMENTS
+
+
+# The variable of the command line with the name of the variant.
+VARIANT_VARIABLE = 'VARIANT'
+# The options of the command line passed to the variants: (option, dest).
+PASSED_OPTIONS = [
+    ('--buildtests', 'buildtests'),
+    ('--verbose', 'verbose'),
+    ('--type', 'type'),
+    ('--effective', 'effective'),
+    ('--linker', 'linker'),
+    ('--compiler-cache', 'compiler_cache'),
+    ('--derived-cache', 'derived_cache'),
+    ('--derived-cache-size', 'derived_cache_size'),
+    ('--unity', 'unity'),
+]
+
+
+def GetVariantName():
+    """
+        Description:
+            Gets the name of the variant being built.
+        Arguments:
+            None.
+        Exceptions:
+            None.
+        Return:
+            The name, or None if this is the normal build.
+    """
+    return ARGUMENTS.get(VARIANT_VARIABLE)
+
+
+def GetVariantDirs(env, name):
+    """
+        Description:
+            Gets the directories of a variant.
+        Arguments:
+            env   -  The SCons environment.
+            name  -  The name of the variant.
+        Exceptions:
+            None.
+        Return:
+            A dictionary with the variables of the directories (BUILD_DIR and
+            INSTALL_*_DIR).
+    """
+    build_dir = '%s-%s' % (env.Dir('$BUILD_DIR').abspath, name)
+    install_dir = os.path.join(build_dir, 'install')
+    return {
+        'BUILD_DIR': build_dir,
+        'INSTALL_BIN_DIR': os.path.join(install_dir, 'bin'),
+        'INSTALL_HEADERS_DIR': os.path.join(install_dir, 'includes'),
+        'INSTALL_LIB_DIR': os.path.join(install_dir, 'libs'),
+        'INSTALL_REPORTS_DIR': os.path.join(install_dir, 'reports'),
+    }
+
+
+def RunVariant(env, name, targets, options=None):
+    """
+        Description:
+            Builds targets in a variant. The options of PASSED_OPTIONS and
+            the variables of the command line are passed to the variant.
+        Arguments:
+            env      -  The SCons environment.
+            name     -  The name of the variant.
+            targets  -  A list with the targets to build.
+            options  -  A dictionary (option -> value) with the options for
+                        the variant, they replace those of the command line.
+                        True is given as a flag and None removes the option.
+        Exceptions:
+            None.
+        Return:
+            The exit code of the build of the variant.
+    """
+    values = dict((option, env.GetOption(dest)) for (option, dest) in PASSED_OPTIONS)
+    values['-j'] = env.GetOption('num_jobs')
+    values.update(options or {})
+    cmd = [sys.executable, os.path.abspath(sys.argv[0])]
+    for (option, value) in sorted(values.items()):
+        if value is True:
+            cmd.append(option)
+        elif value is not None and value is not False:
+            cmd.append('%s=%s' % (option, value) if option.startswith('--') else
+                       '%s%s' % (option, value))
+    variables = dict(ARGUMENTS)
+    variables.update(GetVariantDirs(env, name))
+    variables[VARIANT_VARIABLE] = name
+    cmd += ['%s=%s' % item for item in sorted(variables.items())]
+    cmd += targets
+    env.Cprint('[info] building %s in the variant %s' % (' '.join(targets), name), 'green')
+    if env.GetOption('verbose'):
+        env.Cprint('>> %s' % ' '.join(cmd), 'end')
+    return subprocess.call(cmd, cwd=env.Dir('#').abspath)